@@ -0,0 +1,135 @@
+"""
+JWT-аутентификация без SELECT auth_user на каждый запрос.
+
+Пользователь собирается из user_id в подписанном токене и закэшированного
+состояния как экземпляр User с отложенными полями: если вьюхе понадобится,
+например, email, Django догрузит его сам. Username кладётся и в сам токен
+(claim username) — клиенту не нужно отдельно спрашивать, кто он. Отзыв
+проверяется по кэшу:
+  * auth:user:<id> — is_active/username/is_staff, живёт AUTH_STATE_TTL секунд
+    и сбрасывается сигналом при изменении пользователя;
+  * auth:denied:<jti> — access-токены, отозванные через logout.
+Оба ключа читаются одним get_many, в БД запрос идёт только при промахе.
+
+Так можно, только если кэш общий для всех воркеров (api.cache.shared):
+иначе logout или деактивация в одном воркере не видны в остальных до
+истечения токена. С процессным кэшем состояние пользователя и отзыв
+проверяются по базе — отозванные access-токены тогда пишутся в blacklist
+simplejwt рядом с refresh-токенами.
+"""
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import router, transaction
+from django.db.models import Exists
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from . import cache as api_cache
+from . import routers
+
+USERNAME_CLAIM = 'username'
+# В порядке полей модели: from_db раскладывает значения именно так
+LOADED_FIELDS = ['id', 'username', 'is_staff', 'is_active']
+
+
+def state_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def denied_key(jti):
+    return f'auth:denied:{jti}'
+
+
+def _state_ttl():
+    return getattr(settings, 'AUTH_STATE_TTL', 60)
+
+
+def forget_user(user_id):
+    # После коммита: иначе параллельный запрос успеет закэшировать старое состояние
+    transaction.on_commit(lambda: cache.delete(state_key(user_id)))
+
+
+def deny_token(token):
+    """Отзывает access-токен до истечения его срока."""
+    ttl = int(token['exp'] - time.time())
+    if ttl <= 0:
+        return
+    if api_cache.shared():
+        cache.set(denied_key(token[api_settings.JTI_CLAIM]), True, ttl)
+        return
+    outstanding, _ = OutstandingToken.objects.get_or_create(jti=token[api_settings.JTI_CLAIM], defaults={
+        'user_id': token.get(api_settings.USER_ID_CLAIM),
+        'token': str(token),
+        'created_at': datetime.now(timezone.utc),
+        'expires_at': datetime.fromtimestamp(token['exp'], timezone.utc),
+    })
+    BlacklistedToken.objects.get_or_create(token=outstanding)
+
+
+def load_state(user_id):
+    # С основной базы: отставшая реплика вернула бы старое is_active на весь TTL
+    users = User.objects.db_manager(router.db_for_write(User))
+    state = users.filter(id=user_id).values_list('is_active', 'username', 'is_staff').first()
+    # Несуществующего пользователя тоже кэшируем, чтобы старые токены не били в БД
+    cache.set(state_key(user_id), state or (False, None, False), _state_ttl())
+    return state
+
+
+def load_state_and_revocation(user_id, jti):
+    """Без общего кэша: состояние пользователя и отзыв токена одним запросом к основной базе."""
+    users = User.objects.db_manager(router.db_for_write(User))
+    denied = BlacklistedToken.objects.filter(token__jti=jti or '')
+    row = users.filter(id=user_id).annotate(revoked=Exists(denied)) \
+        .values_list('is_active', 'username', 'is_staff', 'revoked').first()
+    if row is None:
+        return None, False
+    return row[:3], row[3]
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        if api_cache.shared():
+            state = self._cached_state(user_id, jti)
+        else:
+            state, revoked = load_state_and_revocation(user_id, jti)
+            if revoked:
+                raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+        if state is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        is_active, username, is_staff = state
+        if username is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        if not is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+
+        # Имя из кэша свежее claim'а: после переименования старые токены продолжают работать
+        return User.from_db(router.db_for_read(User), LOADED_FIELDS, [user_id, username, is_staff, is_active])
+
+    def _cached_state(self, user_id, jti):
+        keys = [state_key(user_id)]
+        if jti:
+            keys.append(denied_key(jti))
+        if routers.replicas():
+            keys.append(routers.pin_key(user_id))
+        found = cache.get_many(keys)
+        if jti and found.get(denied_key(jti)):
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+        if found.get(routers.pin_key(user_id)):
+            # Пользователь недавно писал — читаем его запрос с основной базы
+            routers.pin_primary()
+
+        state = found.get(state_key(user_id))
+        return load_state(user_id) if state is None else state
@@ -0,0 +1,160 @@
+"""
+Аватарки: проверка в потоке запроса, нарезка вариантов в пуле процессов
+(utils.images) и сохранение через хранилище из utils.s3. Профиль
+обновляется одним UPDATE, когда все варианты уже лежат в хранилище.
+
+Прямая загрузка (presign/complete): клиент получает подписанную ссылку
+в свою папку uploads/avatars/<username>/ и кладёт файл в хранилище сам,
+байты через Django не проходят. Сырой объект приватный. После загрузки объект проверяется по
+HEAD-запросу, а затем проходит ту же обработку, что и загрузка через
+профиль: проверка формата, снятие EXIF/GPS, нарезка вариантов. В профиль
+попадают только готовые варианты, сырой объект удаляется.
+
+Загрузки, для которых complete так и не вызвали, удаляет sweep_uploads
+(старше ORPHAN_UPLOAD_AGE). В S3 вместо команды можно повесить
+lifecycle-правило с Expiration на префикс uploads/.
+"""
+import io
+import time
+import uuid
+
+from django.db import close_old_connections, transaction
+
+from utils import images, s3
+
+from . import cache
+from .models import Profile
+
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+
+DIRECT_UPLOAD_EXPIRES = 300
+UPLOADS_PREFIX = 'uploads/avatars/'
+ORPHAN_UPLOAD_AGE = 24 * 3600
+CONTENT_TYPES = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/webp': 'webp',
+    'image/gif': 'gif',
+}
+
+AVATARS_PREFIX = 'avatars/'
+
+# Этот вариант пишется и в avatar_url — для клиентов, которые не знают про avatar_variants
+DEFAULT_VARIANT = ('large', 'jpg')
+
+
+def read_upload(upload):
+    if upload.size > MAX_UPLOAD_BYTES:
+        raise images.InvalidImage('Avatar is too large')
+    data = upload.read()
+    images.validate(data)
+    return data
+
+
+def process_avatar(user_id, username, data):
+    variants = images.render_in_pool(data)
+    storage = s3.get_storage()
+    # Новая папка на каждую загрузку: старые ссылки не отдают новую картинку из кэшей CDN
+    prefix = f'{AVATARS_PREFIX}{username}/{uuid.uuid4().hex[:12]}'
+    urls = {}
+    for (name, ext), (content, content_type) in variants.items():
+        urls.setdefault(name, {})[ext] = storage.save(io.BytesIO(content), f'{prefix}/{name}.{ext}', content_type)
+    name, ext = DEFAULT_VARIANT
+    with transaction.atomic():
+        profile = Profile.objects.select_for_update().filter(user_id=user_id)
+        previous = profile.values_list('avatar_url', 'avatar_variants').first()
+        profile.update(avatar_url=urls[name][ext], avatar_variants=urls)
+        cache.invalidate_profiles([user_id])
+        if previous:
+            # Прежние варианты удаляем, только когда профиль уже указывает на новые
+            stale = stored_keys(storage, *previous)
+            transaction.on_commit(lambda: delete_keys(storage, stale), robust=True)
+    return urls
+
+
+def stored_keys(storage, avatar_url, variants):
+    """Ключи вариантов из хранилища, на которые ссылается профиль."""
+    base = storage.url(AVATARS_PREFIX)
+    urls = [avatar_url, *(url for formats in (variants or {}).values() for url in formats.values())]
+    return {AVATARS_PREFIX + url[len(base):] for url in urls if url and url.startswith(base)}
+
+
+def delete_keys(storage, keys):
+    for key in keys:
+        storage.delete(key)
+
+
+def _process_in_background(user_id, username, data):
+    try:
+        return process_avatar(user_id, username, data)
+    finally:
+        close_old_connections()
+
+
+def submit(user, data):
+    """Запускает обработку в фоновом потоке, возвращает future."""
+    return s3.get_executor().submit(_process_in_background, user.id, user.username, data)
+
+
+def upload_prefix(username):
+    return f'{UPLOADS_PREFIX}{username}/'
+
+
+def sweep_orphaned_uploads(older_than=ORPHAN_UPLOAD_AGE):
+    """Удаляет сырые загрузки старше older_than секунд; возвращает их число."""
+    storage = s3.get_storage()
+    cutoff = time.time() - older_than
+    stale = [key for key, modified in storage.list(UPLOADS_PREFIX) if modified < cutoff]
+    for key in stale:
+        storage.delete(key)
+    return len(stale)
+
+
+def presign(user, content_type, method='post'):
+    ext = CONTENT_TYPES.get(content_type)
+    if ext is None:
+        raise images.InvalidImage(f'Unsupported content type: {content_type}')
+    key = f'{upload_prefix(user.username)}{uuid.uuid4().hex}.{ext}'
+    upload = s3.get_storage().presign_upload(key, content_type, MAX_UPLOAD_BYTES, DIRECT_UPLOAD_EXPIRES, method)
+    return dict(upload, key=key, expires_in=DIRECT_UPLOAD_EXPIRES)
+
+
+def check_upload(user, key):
+    """Проверяет, что загруженный клиентом объект лежит в его папке и подходит по HEAD."""
+    prefix = upload_prefix(user.username)
+    name = key[len(prefix):] if key.startswith(prefix) else ''
+    if not name or '/' in name or name.startswith('.'):
+        raise images.InvalidImage('Key is outside of your upload folder')
+    head = s3.get_storage().head(key)
+    if head is None:
+        raise images.InvalidImage('Upload not found')
+    if not 0 < head['size'] <= MAX_UPLOAD_BYTES or head['content_type'] not in CONTENT_TYPES:
+        raise images.InvalidImage('Uploaded object is not an acceptable avatar')
+
+
+def process_upload(user_id, username, key):
+    """Обрабатывает загруженный объект как обычную аватарку и удаляет его."""
+    storage = s3.get_storage()
+    try:
+        data = storage.read(key)
+        images.validate(data)
+        return process_avatar(user_id, username, data)
+    finally:
+        # Сырой файл с метаданными клиента не должен оставаться в хранилище
+        storage.delete(key)
+
+
+def _process_upload_in_background(user_id, username, key):
+    try:
+        return process_upload(user_id, username, key)
+    finally:
+        close_old_connections()
+
+
+def complete(user, key):
+    """
+    Проверяет загруженный клиентом объект по HEAD и ставит его обработку
+    в фоновый пул; возвращает future. Сами байты в потоке запроса не читаются.
+    """
+    check_upload(user, key)
+    return s3.get_executor().submit(_process_upload_in_background, user.id, user.username, key)
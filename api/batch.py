@@ -0,0 +1,147 @@
+"""
+Пакетная запись для клиентов, которые синхронизируют офлайн-активность.
+
+Все операции пакета выполняются в одной транзакции: сначала одним запросом
+на каждый вид данных читается текущее состояние (посты, лайки, подписки),
+затем операции применяются в памяти по порядку, и итог пишется через
+bulk_create / один DELETE / один UPDATE счётчиков на модель. Поисковый
+индекс, outbox уведомлений и ленты тоже пишутся пачкой, так что число
+запросов не зависит от размера пакета.
+
+bulk_create и сырые DELETE не вызывают сигналы, поэтому счётчики, кэш,
+поиск, уведомления и ленты обновляются здесь явно.
+"""
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from . import cache, follows, likes, notifications, search, timeline
+from .models import Comment, Follow, Like, Post, Profile
+from .signals import bump_counter, bump_counters
+
+MAX_OPERATIONS = 100
+
+CREATE_POST = 'create_post'
+COMMENT = 'comment'
+LIKE = 'like'
+UNLIKE = 'unlike'
+FOLLOW = 'follow'
+UNFOLLOW = 'unfollow'
+
+OPERATIONS = (CREATE_POST, COMMENT, LIKE, UNLIKE, FOLLOW, UNFOLLOW)
+
+
+def _delete_pairs(model, owner_field, owner_id, key_field, keys):
+    """DELETE ... WHERE owner = %s AND key IN (...) без сигналов и без предварительного SELECT."""
+    if not keys:
+        return 0
+    qn = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(keys))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {qn(model._meta.db_table)} WHERE {qn(owner_field)} = %s AND {qn(key_field)} IN ({placeholders})',
+            [owner_id, *keys],
+        )
+        return cursor.rowcount
+
+
+def _toggle(state, key, wanted):
+    """Меняет членство key в state; возвращает True, если что-то поменялось."""
+    if (key in state) == wanted:
+        return False
+    (state.add if wanted else state.discard)(key)
+    return True
+
+
+def execute(user, operations):
+    """
+    Выполняет провалидированные операции (словари BatchOperationSerializer)
+    и возвращает список результатов в том же порядке.
+    """
+    results = [None] * len(operations)
+    post_ids = {op['post_id'] for op in operations if op['op'] in (COMMENT, LIKE, UNLIKE)}
+    usernames = {op['username'] for op in operations if op['op'] in (FOLLOW, UNFOLLOW)}
+
+    with transaction.atomic():
+        rows = Post.objects.filter(id__in=post_ids).values_list('id', 'user_id', 'likes_count')
+        authors, likes_counts = {}, {}
+        for post_id, author_id, likes_count in rows:
+            authors[post_id], likes_counts[post_id] = author_id, likes_count
+        targets = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+        liked_before = likes.liked_post_ids(user, list(authors))
+        following_before = follows.following_ids(user, list(targets.values()))
+        liked, following = set(liked_before), set(following_before)
+        new_posts, new_comments, events = [], [], []
+
+        for i, op in enumerate(operations):
+            kind = op['op']
+            if kind == CREATE_POST:
+                new_posts.append((i, Post(user=user, content=op['content'])))
+            elif kind in (COMMENT, LIKE, UNLIKE):
+                author_id = authors.get(op['post_id'])
+                if author_id is None:
+                    results[i] = {'status': 404, 'error': 'Post not found.'}
+                elif kind == COMMENT:
+                    new_comments.append((i, Comment(user=user, post_id=op['post_id'], content=op['content'])))
+                    events.append((notifications.COMMENT, author_id))
+                else:
+                    if _toggle(liked, op['post_id'], kind == LIKE):
+                        events.append((notifications.LIKE if kind == LIKE else notifications.UNLIKE, author_id))
+                        likes_counts[op['post_id']] += 1 if kind == LIKE else -1
+                    # Счётчик на момент этой операции, а не итог всего пакета
+                    results[i] = {'status': 200, 'post_id': op['post_id'], 'liked': kind == LIKE,
+                                  'likes_count': likes_counts[op['post_id']]}
+            else:
+                target_id = targets.get(op['username'])
+                if target_id is None:
+                    results[i] = {'status': 404, 'error': 'User not found.'}
+                elif target_id == user.id:
+                    results[i] = {'status': 400, 'error': 'You cannot follow yourself.'}
+                else:
+                    changed = _toggle(following, target_id, kind == FOLLOW)
+                    if changed and kind == FOLLOW:
+                        events.append((notifications.FOLLOW, target_id))
+                    results[i] = {
+                        'status': 201 if changed and kind == FOLLOW else 200,
+                        'username': op['username'], 'following': kind == FOLLOW,
+                    }
+
+        posts = Post.objects.bulk_create([post for _, post in new_posts])
+        search.get_backend().index_posts(posts)
+        for (i, _), post in zip(new_posts, posts):
+            results[i] = {'status': 201, 'id': post.id, 'created_at': post.created_at}
+
+        comments = Comment.objects.bulk_create([comment for _, comment in new_comments])
+        for (i, _), comment in zip(new_comments, comments):
+            results[i] = {'status': 201, 'id': comment.id, 'post_id': comment.post_id}
+        comment_deltas = Counter(comment.post_id for comment in comments)
+        bump_counters(Post.objects.all(), 'id', 'comments_count', comment_deltas)
+
+        liked_added, liked_removed = liked - liked_before, liked_before - liked
+        Like.objects.bulk_create([Like(user=user, post_id=post_id) for post_id in liked_added])
+        _delete_pairs(Like, 'user_id', user.id, 'post_id', list(liked_removed))
+        like_deltas = {post_id: 1 for post_id in liked_added}
+        like_deltas.update({post_id: -1 for post_id in liked_removed})
+        bump_counters(Post.objects.all(), 'id', 'likes_count', like_deltas)
+
+        followed, unfollowed = following - following_before, following_before - following
+        Follow.objects.bulk_create([Follow(follower=user, following_id=target_id) for target_id in followed])
+        _delete_pairs(Follow, 'follower_id', user.id, 'following_id', list(unfollowed))
+        follower_deltas = {target_id: 1 for target_id in followed}
+        follower_deltas.update({target_id: -1 for target_id in unfollowed})
+        bump_counters(Profile.objects.all(), 'user_id', 'followers_count', follower_deltas)
+        if len(followed) != len(unfollowed):
+            bump_counter(Profile.objects.filter(user_id=user.id), 'following_count', len(followed) - len(unfollowed))
+
+        notifications.notify_many([(kind, user.id, recipient_id) for kind, recipient_id in events])
+
+        cache.invalidate_posts({post.id for post in posts} | set(comment_deltas) | set(like_deltas))
+        cache.touch(*(f'comments:{post_id}' for post_id in comment_deltas))
+        if follower_deltas:
+            cache.invalidate_profiles([user.id, *follower_deltas])
+
+    timeline.fan_out_posts(posts)
+    timeline.backfill_authors([(user.id, target_id) for target_id in followed])
+    timeline.remove_authors(user.id, list(unfollowed))
+    return results
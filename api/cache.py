@@ -0,0 +1,203 @@
+"""
+Кэш сериализованных постов и профилей.
+
+В кэше лежат представления, общие для всех пользователей; персональная
+часть (is_liked) накладывается поверх при чтении одним запросом. Записи
+сбрасываются сигналами из api/signals.py после коммита транзакции.
+Бэкенд — стандартный CACHES['default'] (LocMem по умолчанию, Redis при REDIS_URL).
+
+Кэш работает, только если он общий для всех воркеров (shared): в LocMem
+правка поста сбросила бы запись лишь в том воркере, который её обработал,
+а остальные отдавали бы старые данные до истечения API_CACHE_TIMEOUT.
+Счётчики попаданий ведутся в api.metrics и суммируются по всем воркерам.
+
+Там же хранятся отметки изменений (stamps) по пространствам имён — на них
+строятся ETag/Last-Modified в api/mixins.py.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import metrics
+from .models import Like, Post, Profile
+
+STATS = ('hits', 'misses', 'invalidations')
+
+
+def _count(name, n=1):
+    if n:
+        metrics.inc(f'api_cache_{name}_total', (), n)
+
+
+def get_stats():
+    """Попадания, промахи и сбросы объектного кэша, суммарно по всем воркерам."""
+    counters, _ = metrics.collect()
+    stats = {name: counters[f'api_cache_{name}_total', ()] for name in STATS}
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
+
+def _version():
+    return getattr(settings, 'API_CACHE_VERSION', 1)
+
+
+def _timeout():
+    return getattr(settings, 'API_CACHE_TIMEOUT', 300)
+
+
+def post_key(post_id):
+    return f'api:post:{post_id}'
+
+
+def profile_key(user_id):
+    return f'api:profile:{user_id}'
+
+
+def _get_many(keys):
+    if not shared():
+        return {}
+    found = cache.get_many(keys, version=_version())
+    _count('hits', len(found))
+    _count('misses', len(keys) - len(found))
+    return found
+
+
+def _set_many(data):
+    if data and shared():
+        cache.set_many(data, timeout=_timeout(), version=_version())
+
+
+def get_posts(post_ids):
+    """
+    Возвращает {post_id: данные без is_liked} для существующих постов.
+    Промахи добираются одним запросом.
+    """
+    from .serializers import PostSerializer
+
+    keys = {post_key(post_id): post_id for post_id in post_ids}
+    found = _get_many(list(keys))
+    result = {keys[key]: data for key, data in found.items()}
+
+    missing = [post_id for post_id in post_ids if post_id not in result]
+    if missing:
+        posts = list(Post.objects.for_feed().filter(id__in=missing))
+        serialized = PostSerializer(posts, many=True, context={'liked_post_ids': set()}).data
+        fresh = {}
+        for data in serialized:
+            data = dict(data)
+            data.pop('is_liked', None)
+            result[data['id']] = data
+            fresh[post_key(data['id'])] = data
+        _set_many(fresh)
+    return result
+
+
+def get_post(post_id):
+    return get_posts([post_id]).get(post_id)
+
+
+def get_profiles(user_ids):
+    """Возвращает {user_id: сериализованный профиль}; промахи — одним запросом."""
+    from .serializers import ProfileSerializer
+
+    keys = {profile_key(user_id): user_id for user_id in user_ids}
+    found = _get_many(list(keys))
+    result = {keys[key]: data for key, data in found.items()}
+
+    missing = [user_id for user_id in user_ids if user_id not in result]
+    if missing:
+        profiles = Profile.objects.select_related('user').filter(user_id__in=missing)
+        fresh = {}
+        for profile in profiles:
+            data = dict(ProfileSerializer(profile).data)
+            result[profile.user_id] = data
+            fresh[profile_key(profile.user_id)] = data
+        _set_many(fresh)
+    return result
+
+
+def get_profile(user_id):
+    return get_profiles([user_id]).get(user_id)
+
+
+def with_is_liked(posts, user):
+    """Накладывает персональный is_liked на закэшированные посты."""
+    liked = set()
+    if user.is_authenticated and posts:
+        liked = set(Like.objects.filter(user=user, post_id__in=[post['id'] for post in posts])
+                    .values_list('post_id', flat=True))
+    return [dict(post, is_liked=post['id'] in liked) for post in posts]
+
+
+# Бэкенды, у которых в каждом процессе своё содержимое
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def shared():
+    """
+    Видят ли все воркеры один и тот же кэш. В LocMem у каждого воркера своё
+    содержимое: сброс или отметка, сделанные в одном, в другом не видны.
+    Всё, что полагается на кэш как на общее состояние (объектный кэш, ETag,
+    отзыв токенов, закрепление за основной базой), работает только с общим
+    кэшем (Redis, файловый) или с явным API_CACHE_SINGLE_PROCESS = True,
+    когда воркер заведомо один.
+    """
+    if getattr(settings, 'API_CACHE_SINGLE_PROCESS', False):
+        return True
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+
+def stamp_key(namespace):
+    return f'api:stamp:{namespace}'
+
+
+def get_stamps(namespaces):
+    """
+    Возвращает {namespace: время последнего изменения}. Если отметка
+    вытеснена из кэша, считаем, что данные изменились только что.
+    """
+    keys = {stamp_key(namespace): namespace for namespace in namespaces}
+    found = cache.get_many(list(keys))
+    now = time.time()
+    for key, namespace in keys.items():
+        if key not in found:
+            cache.add(key, now, timeout=None)
+            found[key] = cache.get(key, now)
+    return {namespace: found[key] for key, namespace in keys.items()}
+
+
+def _after_commit(keys=(), namespaces=()):
+    keys, namespaces = list(keys), list(namespaces)
+    if not keys and not namespaces:
+        return
+
+    def apply():
+        if keys:
+            cache.delete_many(keys, version=_version())
+            _count('invalidations', len(keys))
+        if namespaces:
+            now = time.time()
+            cache.set_many({stamp_key(namespace): now for namespace in namespaces}, timeout=None)
+
+    transaction.on_commit(apply)
+
+
+def touch(*namespaces):
+    """Отмечает изменение данных в пространствах имён (после коммита)."""
+    _after_commit(namespaces=namespaces)
+
+
+def invalidate_posts(post_ids):
+    _after_commit((post_key(post_id) for post_id in post_ids), ['posts'])
+
+
+def invalidate_profiles(user_ids):
+    user_ids = list(user_ids)
+    _after_commit((profile_key(user_id) for user_id in user_ids),
+                  (f'profile:{user_id}' for user_id in user_ids))
@@ -0,0 +1,21 @@
+"""
+Граф подписок. Единственное хранилище — модель Follow, проиндексированная
+в обе стороны (см. Follow.Meta.indexes).
+"""
+from .models import Follow
+
+
+def following_ids(follower, user_ids):
+    """Какие из user_ids читает follower — одним запросом по уникальному индексу."""
+    if not follower.is_authenticated or not user_ids:
+        return set()
+    return set(Follow.objects.filter(follower_id=follower.id, following_id__in=list(user_ids))
+               .values_list('following_id', flat=True))
+
+
+def followers_of(user):
+    return Follow.objects.filter(following=user)
+
+
+def followed_by(user):
+    return Follow.objects.filter(follower=user)
@@ -0,0 +1,125 @@
+"""
+Лайки — самая частая запись, поэтому здесь без ORM-обвязки: вставка
+INSERT ... ON CONFLICT DO NOTHING RETURNING и сдвиг счётчика
+UPDATE ... RETURNING. Лайк/анлайк укладываются в два запроса, повторный
+вызов ничего не меняет (идемпотентно).
+
+Сигналы Like при этом не срабатывают, поэтому сброс кэша и уведомление
+делаются здесь же.
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import cache, notifications
+from .models import Like, Post
+
+
+class PostNotFound(Exception):
+    pass
+
+
+def _fast_path():
+    return connection.vendor in ('sqlite', 'postgresql') and connection.features.can_return_columns_from_insert
+
+
+def _tables():
+    qn = connection.ops.quote_name
+    return qn(Like._meta.db_table), qn(Post._meta.db_table)
+
+
+def _current_state(cursor, post_id):
+    _, posts = _tables()
+    cursor.execute(f'SELECT likes_count FROM {posts} WHERE id = %s', [post_id])
+    row = cursor.fetchone()
+    if row is None:
+        raise PostNotFound(post_id)
+    return row[0]
+
+
+def _insert(cursor, user_id, post_id):
+    """Возвращает новый likes_count или None, если лайк уже стоял."""
+    likes, posts = _tables()
+    # INSERT ... SELECT заодно проверяет, что пост существует
+    cursor.execute(
+        f'INSERT INTO {likes} (user_id, post_id, created_at) '
+        f'SELECT %s, id, %s FROM {posts} WHERE id = %s '
+        f'ON CONFLICT (user_id, post_id) DO NOTHING RETURNING id',
+        [user_id, timezone.now(), post_id],
+    )
+    if cursor.fetchone() is None:
+        return None
+    cursor.execute(
+        f'UPDATE {posts} SET likes_count = likes_count + 1 WHERE id = %s RETURNING likes_count, user_id',
+        [post_id],
+    )
+    likes_count, author_id = cursor.fetchone()
+    notifications.notify(notifications.LIKE, user_id, author_id)
+    cache.invalidate_posts([post_id])
+    return likes_count
+
+
+def _delete(cursor, user_id, post_id):
+    """Возвращает новый likes_count или None, если лайка не было."""
+    likes, posts = _tables()
+    cursor.execute(f'DELETE FROM {likes} WHERE user_id = %s AND post_id = %s RETURNING id', [user_id, post_id])
+    if cursor.fetchone() is None:
+        return None
+    cursor.execute(
+        f'UPDATE {posts} SET likes_count = CASE WHEN likes_count > 0 THEN likes_count - 1 ELSE 0 END '
+        f'WHERE id = %s RETURNING likes_count, user_id',
+        [post_id],
+    )
+    likes_count, author_id = cursor.fetchone()
+    notifications.notify(notifications.UNLIKE, user_id, author_id)
+    cache.invalidate_posts([post_id])
+    return likes_count
+
+
+def _orm_set(user, post_id, liked):
+    # Для СУБД без RETURNING: обычный ORM, счётчики ведут сигналы
+    post = Post.objects.filter(id=post_id).only('id', 'user_id').first()
+    if post is None:
+        raise PostNotFound(post_id)
+    if liked:
+        _, created = Like.objects.get_or_create(user=user, post=post)
+        if created:
+            notifications.notify(notifications.LIKE, user.id, post.user_id)
+    elif Like.objects.filter(user=user, post=post).delete()[0]:
+        notifications.notify(notifications.UNLIKE, user.id, post.user_id)
+    return Post.objects.filter(id=post_id).values_list('likes_count', flat=True).first()
+
+
+def set_like(user, post_id, liked):
+    """Ставит (liked=True) или снимает лайк. Возвращает (liked, likes_count)."""
+    with transaction.atomic():
+        if not _fast_path():
+            return liked, _orm_set(user, post_id, liked)
+        with connection.cursor() as cursor:
+            change = _insert if liked else _delete
+            likes_count = change(cursor, user.id, post_id)
+            if likes_count is None:
+                likes_count = _current_state(cursor, post_id)
+    return liked, likes_count
+
+
+def toggle_like(user, post_id):
+    with transaction.atomic():
+        if not _fast_path():
+            liked = not Like.objects.filter(user=user, post_id=post_id).exists()
+            return liked, _orm_set(user, post_id, liked)
+        with connection.cursor() as cursor:
+            likes_count = _delete(cursor, user.id, post_id)
+            if likes_count is not None:
+                return False, likes_count
+            likes_count = _insert(cursor, user.id, post_id)
+            if likes_count is None:
+                # Лайк поставили параллельно между DELETE и INSERT
+                return True, _current_state(cursor, post_id)
+            return True, likes_count
+
+
+def liked_post_ids(user, post_ids):
+    """Какие из post_ids лайкнул user — один запрос."""
+    if not user.is_authenticated or not post_ids:
+        return set()
+    return set(Like.objects.filter(user_id=user.id, post_id__in=list(post_ids)).values_list('post_id', flat=True))
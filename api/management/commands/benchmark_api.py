@@ -0,0 +1,307 @@
+"""
+Бенчмарк эндпоинтов: каждый маршрут из api/urls.py прогоняется через
+тестовый клиент Django от имени временного пользователя. Для каждой пары
+маршрут + метод печатаются p50/p95/p99 латентности, число SQL-запросов
+и размер ответа.
+
+    export SQLITE_PATH=/tmp/bench.sqlite3
+    python manage.py migrate
+    python manage.py seed_data --users 100000 --posts 1000000 --likes 5000000
+    python manage.py benchmark_api --iterations 200 --save baseline.json
+    python manage.py benchmark_api --iterations 200 --compare baseline.json
+
+С --compare команда падает, если у какого-то маршрута выросло число
+запросов или p95 стал хуже базового больше чем на --threshold.
+
+Пишущие сценарии меняют данные, поэтому на основной базе (db.sqlite3)
+команда не запускается — только на отдельной через SQLITE_PATH.
+Пользователь bench_<run> обычный, не staff, со случайным паролем; после
+прогона он удаляется вместе со всем, что успел создать.
+"""
+import json
+import math
+import os
+import secrets
+import statistics
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from api import timeline
+from api.models import Comment, Follow, Post, Profile
+from api.serializers import UsernameTokenObtainPairSerializer
+
+SAFE_METHODS = ('get', 'head', 'options')
+
+# Маршруты, которые тестовым клиентом не измерить
+SKIPPED = {
+    'notification-stream': 'SSE stream never completes',
+    'cache-stats': 'staff only, the benchmark user is not staff',
+    'avatar-upload-url': 'needs external object storage',
+    'avatar-upload-complete': 'needs external object storage',
+}
+
+
+def percentile(values, p):
+    """Перцентиль по ближайшему рангу; values отсортированы."""
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class Context:
+    """Данные, на которых гоняются сценарии: пользователь, популярные авторы и посты."""
+
+    def __init__(self, targets):
+        self.run = uuid.uuid4().hex[:8]
+        self.username = f'bench_{self.run}'
+        self.password = secrets.token_urlsafe(16)
+        self.user = User.objects.create_user(self.username, password=self.password)
+        Profile.objects.create(user=self.user)
+        try:
+            self._prepare(targets)
+        except BaseException:
+            self.cleanup()
+            raise
+
+    def _prepare(self, targets):
+        self.access = self.tokens()[1]
+        popular = list(Profile.objects.exclude(user=self.user).order_by('-followers_count')
+                       .values_list('user_id', 'user__username')[:targets + 20])
+        if not popular:
+            raise CommandError('Database is empty, run seed_data first')
+        self.popular = popular[0][1]
+        followed = set(Follow.objects.filter(follower=self.user).values_list('following_id', flat=True))
+        # Лента не должна быть пустой: подписываемся на два десятка самых популярных
+        for user_id, _ in popular[:20]:
+            if user_id not in followed:
+                Follow.objects.create(follower=self.user, following_id=user_id)
+                timeline.backfill_author(self.user.id, user_id)
+        self.user_ids = [user_id for user_id, _ in popular[:20]]
+        # Для follow/unfollow — те, на кого ещё не подписаны
+        self.targets = [username for user_id, username in popular[20:]] or [self.popular]
+
+        post = Post.objects.order_by('-likes_count', '-id').first()
+        if post is None:
+            raise CommandError('Database has no posts, run seed_data first')
+        self.post_id = post.id
+        self.word = post.content.split()[0] if post.content.split() else 'a'
+        self.post_ids = list(Post.objects.order_by('-created_at', '-id').values_list('id', flat=True)[:20])
+        self.own_post = Post.objects.create(user=self.user, content='benchmark post').id
+        self.comment = Comment.objects.create(user=self.user, post_id=self.post_id, content='benchmark').id
+        self.created_posts = []
+        self.created_comments = []
+
+    def cleanup(self):
+        """Удаляет пользователя прогона и тех, кого создал сценарий register."""
+        User.objects.filter(username__startswith=self.username).delete()
+
+    def tokens(self):
+        refresh = UsernameTokenObtainPairSerializer.get_token(self.user)
+        return str(refresh), str(refresh.access_token)
+
+    def take_post(self):
+        return self.created_posts.pop() if self.created_posts else \
+            Post.objects.create(user=self.user, content='benchmark post').id
+
+    def take_comment(self):
+        return self.created_comments.pop() if self.created_comments else \
+            Comment.objects.create(user=self.user, post_id=self.post_id, content='benchmark').id
+
+
+def _logout(ctx, i):
+    refresh, access = ctx.tokens()
+    return {'path': reverse('logout'), 'data': {'refresh': refresh}, 'access': access}
+
+
+# (имя маршрута, метод, сборщик запроса, куда запомнить id созданного объекта).
+# Сборщик вызывается вне замера: всё, что он пишет в базу, в метрики не попадает.
+SCENARIOS = [
+    ('health-check', 'get', lambda ctx, i: {'path': reverse('health-check')}, None),
+    ('metrics', 'get', lambda ctx, i: {'path': reverse('metrics')}, None),
+    ('register', 'post', lambda ctx, i: {'path': reverse('register'), 'access': None, 'data': {
+        'username': f'{ctx.username}_{i}', 'email': f'{ctx.username}_{i}@example.com', 'password': ctx.password,
+    }}, None),
+    ('login', 'post', lambda ctx, i: {'path': reverse('login'), 'access': None, 'data': {
+        'username': ctx.username, 'password': ctx.password,
+    }}, None),
+    ('token_refresh', 'post', lambda ctx, i: {'path': reverse('token_refresh'), 'access': None,
+                                              'data': {'refresh': ctx.tokens()[0]}}, None),
+    ('search', 'get', lambda ctx, i: {'path': reverse('search') + f'?q={ctx.word}'}, None),
+    ('user-profile', 'get', lambda ctx, i: {'path': reverse('user-profile', args=[ctx.popular])}, None),
+    ('user-profile', 'put', lambda ctx, i: {'path': reverse('user-profile', args=[ctx.username]),
+                                            'data': {'bio': f'benchmark {i}'}}, None),
+    ('user-posts', 'get', lambda ctx, i: {'path': reverse('user-posts', args=[ctx.popular])}, None),
+    ('user-posts', 'post', lambda ctx, i: {'path': reverse('user-posts', args=[ctx.username]),
+                                           'data': {'content': f'benchmark post {i}'}}, 'created_posts'),
+    ('follow-user', 'post', lambda ctx, i: {
+        'path': reverse('follow-user', args=[ctx.targets[i % len(ctx.targets)]])}, None),
+    ('unfollow-user', 'delete', lambda ctx, i: {
+        'path': reverse('unfollow-user', args=[ctx.targets[i % len(ctx.targets)]])}, None),
+    ('batch-following-status', 'get', lambda ctx, i: {
+        'path': reverse('batch-following-status') + '?ids=' + ','.join(map(str, ctx.user_ids))}, None),
+    ('check-following-status', 'get', lambda ctx, i: {
+        'path': reverse('check-following-status', args=[ctx.popular])}, None),
+    ('user-followers', 'get', lambda ctx, i: {'path': reverse('user-followers', args=[ctx.popular])}, None),
+    ('user-following', 'get', lambda ctx, i: {'path': reverse('user-following', args=[ctx.username])}, None),
+    ('posts-list', 'get', lambda ctx, i: {'path': reverse('posts-list')}, None),
+    ('timeline', 'get', lambda ctx, i: {'path': reverse('timeline')}, None),
+    ('post-detail', 'get', lambda ctx, i: {'path': reverse('post-detail', args=[ctx.post_id])}, None),
+    ('post-detail', 'put', lambda ctx, i: {'path': reverse('post-detail', args=[ctx.own_post]),
+                                           'data': {'content': f'benchmark put {i}'}}, None),
+    ('post-detail', 'patch', lambda ctx, i: {'path': reverse('post-detail', args=[ctx.own_post]),
+                                             'data': {'content': f'benchmark patch {i}'}}, None),
+    ('post-detail', 'delete', lambda ctx, i: {'path': reverse('post-detail', args=[ctx.take_post()])}, None),
+    ('like-post', 'post', lambda ctx, i: {'path': reverse('like-post', args=[ctx.post_id])}, None),
+    ('like-post', 'delete', lambda ctx, i: {'path': reverse('like-post', args=[ctx.post_id])}, None),
+    ('toggle-like', 'post', lambda ctx, i: {'path': reverse('toggle-like', args=[ctx.post_id])}, None),
+    ('liked-status', 'get', lambda ctx, i: {
+        'path': reverse('liked-status') + '?ids=' + ','.join(map(str, ctx.post_ids))}, None),
+    ('batch-write', 'post', lambda ctx, i: {'path': reverse('batch-write'), 'data': {'operations': [
+        {'op': 'like', 'post_id': post_id} for post_id in ctx.post_ids[:5]
+    ] + [{'op': 'unlike', 'post_id': post_id} for post_id in ctx.post_ids[:5]]}}, None),
+    ('notification-list', 'get', lambda ctx, i: {'path': reverse('notification-list')}, None),
+    ('notification-mark-read', 'post', lambda ctx, i: {'path': reverse('notification-mark-read')}, None),
+    ('notification-unread-count', 'get', lambda ctx, i: {'path': reverse('notification-unread-count')}, None),
+    ('post-comments', 'get', lambda ctx, i: {'path': reverse('post-comments', args=[ctx.post_id])}, None),
+    ('post-comments', 'post', lambda ctx, i: {'path': reverse('post-comments', args=[ctx.post_id]),
+                                              'data': {'content': f'benchmark comment {i}'}}, 'created_comments'),
+    ('comment-detail', 'get', lambda ctx, i: {
+        'path': reverse('comment-detail', args=[ctx.post_id, ctx.comment])}, None),
+    ('comment-detail', 'put', lambda ctx, i: {
+        'path': reverse('comment-detail', args=[ctx.post_id, ctx.comment]),
+        'data': {'content': f'benchmark edit {i}'}}, None),
+    ('comment-detail', 'delete', lambda ctx, i: {
+        'path': reverse('comment-detail', args=[ctx.post_id, ctx.take_comment()])}, None),
+    ('user-list', 'get', lambda ctx, i: {'path': reverse('user-list')}, None),
+    ('user-lookup', 'post', lambda ctx, i: {'path': reverse('user-lookup'), 'data': {'ids': ctx.user_ids}}, None),
+    # Последним: отзывает свой access-токен
+    ('logout', 'post', _logout, None),
+]
+
+
+class Command(BaseCommand):
+    help = 'Замеряет латентность, число запросов и размер ответа каждого эндпоинта API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3, help='Незамеряемых прогонов на сценарий')
+        parser.add_argument('--route', action='append', help='Гонять только эти маршруты (по имени)')
+        parser.add_argument('--read-only', action='store_true', help='Только GET-сценарии')
+        parser.add_argument('--save', metavar='PATH', help='Записать результаты как базовые в JSON')
+        parser.add_argument('--compare', metavar='PATH', help='Сравнить с базовыми результатами из JSON')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Допустимый рост p95 относительно базового (0.2 = 20%%)')
+        parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                            help='Рост p95 меньше этого не считается регрессией (шум)')
+
+    def handle(self, *args, **options):
+        scenarios = [s for s in SCENARIOS if (not options['route'] or s[0] in options['route'])
+                     and (not options['read_only'] or s[1] in SAFE_METHODS)]
+        self._check_scratch_database()
+        self._check_coverage()
+        ctx = Context(targets=options['warmup'] + options['iterations'])
+        client = Client(raise_request_exception=False)
+
+        results = {}
+        try:
+            for name, method, build, store in scenarios:
+                results[f'{method.upper()} {name}'] = self._measure(
+                    client, ctx, method, build, store, options['warmup'], options['iterations'])
+        finally:
+            ctx.cleanup()
+        self._report(results)
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write(f'Baseline saved to {options["save"]}')
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            regressions = self._compare(results, baseline, options['threshold'], options['min_delta_ms'])
+            if regressions:
+                raise CommandError(f'{len(regressions)} regression(s): {", ".join(regressions)}')
+
+    def _check_scratch_database(self):
+        name = str(settings.DATABASES['default']['NAME'])
+        if os.path.abspath(name) == os.path.abspath(settings.BASE_DIR / 'db.sqlite3'):
+            raise CommandError('Refusing to benchmark the main database: the scenarios write to it. '
+                               'Point SQLITE_PATH at a scratch copy, e.g. SQLITE_PATH=/tmp/bench.sqlite3')
+
+    def _check_coverage(self):
+        from api import urls
+        covered = {name for name, *_ in SCENARIOS} | set(SKIPPED)
+        missing = [pattern.name for pattern in urls.urlpatterns if pattern.name not in covered]
+        if missing:
+            self.stderr.write(f'Routes without a benchmark scenario: {", ".join(missing)}')
+
+    def _measure(self, client, ctx, method, build, store, warmup, iterations):
+        latencies, queries, sizes, errors = [], [], [], 0
+        for i in range(warmup + iterations):
+            request = build(ctx, i)
+            access = request.get('access', ctx.access)
+            headers = {'HTTP_AUTHORIZATION': f'Bearer {access}'} if access else {}
+            body = json.dumps(request['data']) if request.get('data') is not None else ''
+
+            with ExitStack() as stack:
+                # Все соединения: при репликах чтение уходит не в default. Лог
+                # чистим, иначе он упрётся в лимит и CaptureQueriesContext начнёт врать
+                for alias in connections:
+                    connections[alias].queries_log.clear()
+                captured = [stack.enter_context(CaptureQueriesContext(connections[alias]))
+                            for alias in connections]
+                started = time.perf_counter()
+                response = client.generic(method.upper(), request['path'], body,
+                                          content_type='application/json', **headers)
+                elapsed = time.perf_counter() - started
+
+            if store and response.status_code == 201:
+                getattr(ctx, store).append(response.json()['id'])
+            if i < warmup:
+                continue
+            if response.status_code >= 400:
+                errors += 1
+            latencies.append(elapsed * 1000)
+            queries.append(sum(len(c) for c in captured))
+            sizes.append(len(response.content))
+
+        latencies.sort()
+        return {
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'queries': round(statistics.mean(queries), 2),
+            'bytes': round(statistics.mean(sizes)),
+            'errors': errors,
+        }
+
+    def _report(self, results):
+        self.stdout.write(f'{"endpoint":<36} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+                          f'{"queries":>8} {"bytes":>8} {"errors":>6}')
+        for key, r in results.items():
+            self.stdout.write(f'{key:<36} {r["p50"]:8.2f} {r["p95"]:8.2f} {r["p99"]:8.2f} '
+                              f'{r["queries"]:8.2f} {r["bytes"]:8d} {r["errors"]:6d}')
+
+    def _compare(self, results, baseline, threshold, min_delta_ms):
+        regressions = []
+        for key, r in results.items():
+            base = baseline.get(key)
+            if base is None:
+                continue
+            reasons = []
+            # Число запросов детерминировано — любой рост это регрессия (N+1)
+            if r['queries'] > base['queries']:
+                reasons.append(f'queries {base["queries"]} -> {r["queries"]}')
+            if r['p95'] > base['p95'] * (1 + threshold) and r['p95'] - base['p95'] > min_delta_ms:
+                reasons.append(f'p95 {base["p95"]:.2f} -> {r["p95"]:.2f} ms')
+            if reasons:
+                regressions.append(key)
+                self.stdout.write(self.style.ERROR(f'REGRESSION {key}: {"; ".join(reasons)}'))
+        return regressions
@@ -0,0 +1,153 @@
+"""
+Нагрузочный тест SQLite: несколько процессов одновременно ставят/снимают
+лайки, пишут посты и читают ленту. Прогоняется дважды на копиях базы —
+с настройками SQLite по умолчанию (rollback journal) и с SQLITE_TUNED_OPTIONS
+из settings — и печатает пропускную способность и число "database is locked".
+
+    python manage.py benchmark_sqlite --processes 8 --seconds 10
+"""
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from contextlib import closing
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+
+from api import likes, notifications
+from api.models import Post, Profile
+
+PROFILES = {
+    'default': {'init_command': 'PRAGMA journal_mode=DELETE'},
+    'tuned': settings.SQLITE_TUNED_OPTIONS,
+}
+
+SEED_USERS = 50
+SEED_POSTS = 500
+
+
+def _copy(source, target):
+    with closing(sqlite3.connect(source)) as src, closing(sqlite3.connect(target)) as dst:
+        src.backup(dst)
+
+
+def _configure(path, options):
+    connection = connections['default']
+    connection.close()
+    connection.settings_dict.update(NAME=path, OPTIONS=dict(options), CONN_MAX_AGE=None)
+    # Уведомления пишем в outbox той же транзакцией — без фоновых потоков в воркерах
+    settings.NOTIFICATION_QUEUE = 'api.notifications.OutboxNotificationQueue'
+    notifications.get_queue.cache_clear()
+
+
+def _worker(path, options, seconds, write_ratio, seed, results):
+    _configure(path, options)
+    rng = random.Random(seed)
+    user_ids = list(User.objects.values_list('id', flat=True))
+    post_ids = list(Post.objects.values_list('id', flat=True))
+    stats = {'reads': 0, 'writes': 0, 'locked': 0, 'latencies': []}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            if rng.random() < write_ratio:
+                user = User(id=rng.choice(user_ids))
+                if rng.random() < 0.8:
+                    likes.toggle_like(user, rng.choice(post_ids))
+                else:
+                    Post.objects.create(user=user, content='benchmark')
+                stats['writes'] += 1
+            else:
+                posts = list(Post.objects.for_feed().order_by('-created_at', '-id')[:20])
+                likes.liked_post_ids(User(id=rng.choice(user_ids)), [post.id for post in posts])
+                stats['reads'] += 1
+        except OperationalError:
+            stats['locked'] += 1
+            continue
+        stats['latencies'].append(time.perf_counter() - started)
+    connections.close_all()
+    results.put(stats)
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает пропускную способность SQLite с настройками по умолчанию и с тюнингом'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--write-ratio', type=float, default=0.3)
+        parser.add_argument('--profile', choices=list(PROFILES), action='append',
+                            help='Какие профили прогнать (по умолчанию все)')
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            self.stderr.write('benchmark_sqlite works only with the SQLite backend')
+            return
+        source = self._snapshot()
+        try:
+            for name in options['profile'] or list(PROFILES):
+                self._run(name, source, options)
+        finally:
+            os.unlink(source)
+
+    def _snapshot(self):
+        """Копия текущей базы через backup API (корректно и при открытом WAL)."""
+        fd, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        _copy(settings.DATABASES['default']['NAME'], path)
+        _configure(path, {})
+        self._seed()
+        connections['default'].close()
+        return path
+
+    def _seed(self):
+        users = list(User.objects.values_list('id', flat=True)[:SEED_USERS])
+        for i in range(len(users), SEED_USERS):
+            user = User.objects.create(username=f'bench_{i}_{random.getrandbits(32):x}')
+            Profile.objects.create(user=user)
+            users.append(user.id)
+        missing = SEED_POSTS - Post.objects.count()
+        if missing > 0:
+            Post.objects.bulk_create([Post(user_id=random.choice(users), content='seed') for _ in range(missing)])
+
+    def _run(self, name, source, options):
+        fd, path = tempfile.mkstemp(suffix=f'-{name}.sqlite3')
+        os.close(fd)
+        _copy(source, path)
+        connections.close_all()
+        try:
+            context = multiprocessing.get_context('fork')
+            results = context.Queue()
+            workers = [
+                context.Process(target=_worker, args=(path, PROFILES[name], options['seconds'],
+                                                      options['write_ratio'], seed, results))
+                for seed in range(options['processes'])
+            ]
+            for worker in workers:
+                worker.start()
+            stats = [results.get() for _ in workers]
+            for worker in workers:
+                worker.join()
+        finally:
+            for suffix in ('', '-wal', '-shm', '-journal'):
+                if os.path.exists(path + suffix):
+                    os.unlink(path + suffix)
+
+        seconds = options['seconds']
+        reads = sum(s['reads'] for s in stats)
+        writes = sum(s['writes'] for s in stats)
+        locked = sum(s['locked'] for s in stats)
+        latencies = sorted(latency for s in stats for latency in s['latencies'])
+        p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0
+        median = statistics.median(latencies) * 1000 if latencies else 0
+        self.stdout.write(
+            f'{name:>8}: {(reads + writes) / seconds:8.1f} ops/s '
+            f'(reads {reads / seconds:.1f}/s, writes {writes / seconds:.1f}/s), '
+            f'locked {locked}, p50 {median:.1f} ms, p95 {p95:.1f} ms'
+        )
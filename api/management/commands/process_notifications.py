@@ -0,0 +1,29 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api.notifications import BATCH_SIZE, run_worker
+
+
+class Command(BaseCommand):
+    help = 'Разбирает NotificationOutbox и создаёт уведомления пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Число потоков-воркеров')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--once', action='store_true', help='Выйти, когда очередь опустеет')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        if workers > 1 and not connection.features.has_select_for_update_skip_locked:
+            self.stderr.write(f'{connection.vendor} does not support SKIP LOCKED, using a single worker')
+            workers = 1
+
+        kwargs = {'batch_size': options['batch_size'], 'once': options['once']}
+        if workers == 1:
+            run_worker(**kwargs)
+            return
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='notifications') as pool:
+            for future in [pool.submit(run_worker, **kwargs) for _ in range(workers)]:
+                future.result()
@@ -0,0 +1,72 @@
+"""
+Сохранённые профили запросов (api/profiling.py).
+
+    python manage.py profiles                   # сводка по маршрутам
+    python manage.py profiles --list --limit 20 # последние профили
+    python manage.py profiles --route api/timeline/
+    python manage.py profiles --sign            # значение для заголовка X-Profile
+
+Сводка показывает для каждого маршрута число профилей, среднее и худшее
+время, долю SQL и функции, в которых чаще всего был пойман поток
+(собственное время — лист стека). Сами стеки — в <id>.folded,
+например: flamegraph.pl profiles/<id>.folded > flame.svg
+"""
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand
+
+from api import profiling
+
+
+class Command(BaseCommand):
+    help = 'Показывает сохранённые профили запросов, сгруппированные по маршрутам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--list', action='store_true', help='Список профилей вместо сводки')
+        parser.add_argument('--route', help='Только профили этого маршрута')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--top', type=int, default=5, help='Сколько самых горячих функций показать')
+        parser.add_argument('--sign', action='store_true', help='Напечатать значение заголовка X-Profile')
+
+    def handle(self, *args, **options):
+        if options['sign']:
+            self.stdout.write(f'{profiling.HEADER}: {profiling.sign()}')
+            return
+        profiles = [p for p in profiling.load() if not options['route'] or p['route'] == options['route']]
+        if not profiles:
+            self.stdout.write(f'No profiles in {profiling.profiles_dir()}')
+            return
+        if options['list']:
+            self._list(profiles[:options['limit']])
+        else:
+            self._summary(profiles, options['limit'], options['top'])
+
+    def _list(self, profiles):
+        for p in profiles:
+            self.stdout.write(
+                f'{p["id"]}  {p["method"]:<6} {p["route"]:<40} {p["status"]}  '
+                f'{p["duration_ms"]:8.1f} ms  sql {p["sql_ms"]:7.1f} ms / {len(p["queries"])} queries  '
+                f'[{p["trigger"]}]'
+            )
+
+    def _summary(self, profiles, limit, top):
+        by_route = defaultdict(list)
+        for p in profiles:
+            by_route[p['method'], p['route']].append(p)
+        # Сначала маршруты, на которые ушло больше всего времени
+        ranked = sorted(by_route.items(), key=lambda item: -sum(p['duration_ms'] for p in item[1]))
+        for (method, route), group in ranked[:limit]:
+            durations = [p['duration_ms'] for p in group]
+            sql_share = sum(p['sql_ms'] for p in group) / sum(durations) if sum(durations) else 0
+            self.stdout.write(
+                f'{method} {route}: {len(group)} profiles, mean {sum(durations) / len(group):.1f} ms, '
+                f'max {max(durations):.1f} ms, '
+                f'{sum(len(p["queries"]) for p in group) / len(group):.1f} queries, SQL {sql_share:.0%}'
+            )
+            leaves = Counter()
+            for p in group:
+                for stack, count in profiling.load_stacks(p['id']).items():
+                    leaves[stack.rsplit(';', 1)[-1]] += count
+            total = sum(leaves.values())
+            for name, count in leaves.most_common(top):
+                self.stdout.write(f'    {count / total:6.1%}  {name}')
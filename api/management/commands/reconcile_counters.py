@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from api.models import Comment, Follow, Like, Notification, Post, Profile
+
+
+def _count_of(model, link, outer='pk', **filters):
+    counts = (model.objects.filter(**{link: OuterRef(outer)}, **filters)
+              .order_by().values(link).annotate(n=Count('pk')).values('n'))
+    return Coalesce(Subquery(counts), 0)
+
+
+# (модель, поле-счётчик, выражение с реальным значением)
+COUNTERS = [
+    (Post, 'likes_count', lambda: _count_of(Like, 'post')),
+    (Post, 'comments_count', lambda: _count_of(Comment, 'post')),
+    (Profile, 'followers_count', lambda: _count_of(Follow, 'following', 'user_id')),
+    (Profile, 'following_count', lambda: _count_of(Follow, 'follower', 'user_id')),
+    (Profile, 'unread_notifications_count',
+     lambda: _count_of(Notification, 'recipient', 'user_id', is_read=False)),
+]
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счётчики и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать расхождения')
+
+    def handle(self, *args, **options):
+        for model, field, actual in COUNTERS:
+            # Одним UPDATE на счётчик трогаем только строки с расхождением
+            drifted = model.objects.annotate(actual=actual()).exclude(**{field: F('actual')})
+            label = f'{model.__name__}.{field}'
+            if options['dry_run']:
+                self.stdout.write(f'{label}: {drifted.count()} drifted')
+                continue
+            with transaction.atomic():
+                fixed = model.objects.filter(pk__in=drifted.values('pk')).update(**{field: actual()})
+            self.stdout.write(f'{label}: {fixed} fixed')
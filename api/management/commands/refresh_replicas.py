@@ -0,0 +1,42 @@
+"""
+Локальная замена репликации для SQLite: копирует основную базу в файлы
+реплик через backup API. Копия консистентна и не останавливает запись
+в основную базу.
+
+    python manage.py refresh_replicas               # один раз
+    python manage.py refresh_replicas --interval 2  # в цикле, как фоновая задача
+"""
+import sqlite3
+import time
+from contextlib import closing
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+
+class Command(BaseCommand):
+    help = 'Копирует основную SQLite-базу в реплики из DATABASE_REPLICAS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help='Повторять каждые N секунд')
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('refresh_replicas works only with SQLite databases')
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('No replicas configured (SQLITE_REPLICAS)')
+        while True:
+            for alias in settings.DATABASE_REPLICAS:
+                started = time.monotonic()
+                self.copy(primary['NAME'], settings.DATABASES[alias]['NAME'])
+                self.stdout.write(f'{alias}: refreshed in {(time.monotonic() - started) * 1000:.0f} ms')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    @staticmethod
+    def copy(source, target):
+        with closing(sqlite3.connect(source)) as src, closing(sqlite3.connect(target, timeout=30)) as dst:
+            src.backup(dst)
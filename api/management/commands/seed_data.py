@@ -0,0 +1,161 @@
+"""
+Синтетические данные для нагрузочных тестов.
+
+Всё пишется через bulk_create пачками, мимо сигналов; в конце одним
+проходом пересчитываются счётчики (reconcile_counters), поисковый индекс
+и домашние ленты. Популярность распределена по степенному закону (Zipf):
+у немногих пользователей большая часть подписчиков и лайков, как в жизни.
+
+    python manage.py seed_data --users 100000 --posts 1000000 --likes 5000000
+"""
+import itertools
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api import notifications, search, timeline
+from api.models import Comment, Follow, Like, Notification, Post, Profile, TimelineEntry
+
+WORDS = ('привет день город кофе работа музыка книга спорт погода кино код '
+         'алматы астана лето зима друзья путешествие фото новости идея').split()
+
+
+def zipf_weights(n, exponent):
+    """Накопленные веса: элемент с рангом r выбирается с вероятностью ~ 1 / r^exponent."""
+    return list(itertools.accumulate(1 / (rank ** exponent) for rank in range(1, n + 1)))
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Отключает auto_now_add, чтобы created_at можно было задать при вставке."""
+    fields = [model._meta.get_field('created_at') for model in models]
+    saved = [field.auto_now_add for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, value in zip(fields, saved):
+            field.auto_now_add = value
+
+
+class Command(BaseCommand):
+    help = 'Генерирует пользователей, посты, комментарии, лайки, подписки и уведомления'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--likes', type=int, default=50000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument('--notifications', type=int, default=20000)
+        parser.add_argument('--days', type=int, default=90, help='На сколько дней назад растянуть даты')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Показатель степенного закона')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--skip-timelines', action='store_true')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.span = timedelta(days=options['days']).total_seconds()
+
+        with explicit_timestamps(Post, Comment, Like, Follow):
+            user_ids = self.create_users(options['users'])
+            # Перемешиваем, чтобы "звёзды" не совпадали с первыми id
+            popular = self.rng.sample(user_ids, len(user_ids))
+            weights = zipf_weights(len(popular), options['zipf'])
+
+            self.insert(Post, options['posts'], lambda i: Post(
+                user_id=self.rng.choices(popular, cum_weights=weights)[0],
+                content=self.text(), created_at=self.when()))
+            post_ids = list(Post.objects.values_list('id', flat=True))
+            self.rng.shuffle(post_ids)
+            post_weights = zipf_weights(len(post_ids), options['zipf']) if post_ids else []
+
+            self.insert(Follow, options['follows'], lambda i: self.follow(user_ids, popular, weights),
+                        ignore_conflicts=True)
+            if post_ids:
+                self.insert(Like, options['likes'], lambda i: Like(
+                    user_id=self.rng.choice(user_ids),
+                    post_id=self.rng.choices(post_ids, cum_weights=post_weights)[0],
+                    created_at=self.when()), ignore_conflicts=True)
+                self.insert(Comment, options['comments'], lambda i: Comment(
+                    user_id=self.rng.choice(user_ids),
+                    post_id=self.rng.choices(post_ids, cum_weights=post_weights)[0],
+                    content=self.text(8), created_at=self.when()))
+            self.insert(Notification, options['notifications'], lambda i: Notification(
+                recipient_id=self.rng.choices(popular, cum_weights=weights)[0],
+                sender_id=self.rng.choice(user_ids),
+                message=self.rng.choice(list(notifications.MESSAGES.values())),
+                is_read=self.rng.random() < 0.7, created_at=self.when()))
+
+        self.stdout.write('Reconciling counters...')
+        call_command('reconcile_counters', stdout=self.stdout)
+        self.stdout.write('Rebuilding search index...')
+        search.get_backend().rebuild()
+        if not options['skip_timelines']:
+            self.stdout.write('Building timelines...')
+            self.build_timelines()
+
+    def when(self):
+        return self.now - timedelta(seconds=self.rng.random() * self.span)
+
+    def text(self, words=20):
+        return ' '.join(self.rng.choices(WORDS, k=self.rng.randint(3, words)))
+
+    def follow(self, user_ids, popular, weights):
+        follower = self.rng.choice(user_ids)
+        following = self.rng.choices(popular, cum_weights=weights)[0]
+        if following == follower:
+            following = self.rng.choice(user_ids)
+        return Follow(follower_id=follower, following_id=following, created_at=self.when())
+
+    def create_users(self, count):
+        prefix = f'seed{self.rng.getrandbits(24):06x}_'
+        # '!' — непригодный пароль, без дорогого хэширования
+        self.insert(User, count, lambda i: User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com', password='!'))
+        user_ids = list(User.objects.filter(username__startswith=prefix).values_list('id', flat=True))
+        for start in range(0, len(user_ids), self.batch_size):
+            Profile.objects.bulk_create([Profile(user_id=user_id) for user_id in user_ids[start:start + self.batch_size]])
+        return user_ids
+
+    def insert(self, model, count, make, ignore_conflicts=False):
+        done = 0
+        while done < count:
+            batch = [make(i) for i in range(done, min(done + self.batch_size, count))]
+            with transaction.atomic():
+                model.objects.bulk_create(batch, ignore_conflicts=ignore_conflicts)
+            done += len(batch)
+            self.stdout.write(f'\r{model.__name__}: {done}/{count}', ending='')
+        self.stdout.write('')
+
+    def build_timelines(self):
+        """
+        Последние BACKFILL_POSTS постов каждого автора — в его ленту и в ленты
+        подписчиков, двумя INSERT ... SELECT вместо fan_out_post на каждый пост.
+        """
+        qn = connection.ops.quote_name
+        latest = (f'(SELECT id, user_id, created_at, ROW_NUMBER() OVER '
+                  f'(PARTITION BY user_id ORDER BY created_at DESC, id DESC) AS n '
+                  f'FROM {qn(Post._meta.db_table)})')
+        insert = f'INSERT INTO {qn(TimelineEntry._meta.db_table)} (user_id, post_id, created_at) '
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                insert + f'SELECT p.user_id, p.id, p.created_at FROM {latest} p WHERE p.n <= %s '
+                'ON CONFLICT (user_id, post_id) DO NOTHING',
+                [timeline.BACKFILL_POSTS],
+            )
+            cursor.execute(
+                insert + f'SELECT f.follower_id, p.id, p.created_at FROM {qn(Follow._meta.db_table)} f '
+                f'JOIN {latest} p ON p.user_id = f.following_id WHERE p.n <= %s '
+                'ON CONFLICT (user_id, post_id) DO NOTHING',
+                [timeline.BACKFILL_POSTS],
+            )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.avatars import ORPHAN_UPLOAD_AGE, sweep_orphaned_uploads
+
+
+class Command(BaseCommand):
+    help = 'Удаляет прямые загрузки аватарок, которые так и не завершили через complete'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=ORPHAN_UPLOAD_AGE,
+                            help='Возраст загрузки в секундах, после которого она считается брошенной')
+
+    def handle(self, *args, **options):
+        removed = sweep_orphaned_uploads(options['older_than'])
+        self.stdout.write(f'{removed} orphaned upload(s) removed')
@@ -0,0 +1,267 @@
+"""
+Метрики запросов в формате Prometheus.
+
+MetricsMiddleware (api/middleware.py) на каждый запрос замеряет время
+ответа, число и время SQL-запросов (через connection.execute_wrapper),
+время рендеринга ответа в JSON и его размер; /api/metrics/ отдаёт всё это
+вместе со статистикой кэша. Маршрут берётся из шаблона URL
+(api/posts/<int:post_id>/), а не из пути — число рядов не растёт с числом постов.
+
+Счётчики копятся в памяти процесса, а раз в METRICS_FLUSH_INTERVAL секунд
+каждый воркер сбрасывает их снимок в METRICS_DIR/<pid>.json. Prometheus
+ходит на /api/metrics/ через общий порт и попадает в случайный воркер,
+поэтому тот отдаёт сумму снимков всех воркеров, а не только свои — иначе
+ряды прыгали бы между значениями разных процессов. Файлы завершившихся
+воркеров остаются в сумме, чтобы счётчики не убывали; каталог чистится при
+деплое, как PROMETHEUS_MULTIPROC_DIR у prometheus_client. Подробные замеры
+делаются только для доли запросов METRICS_SAMPLE_RATE, api_requests_total
+считается всегда.
+
+N+1 ловится по повторам: если один и тот же SQL (с плейсхолдерами вместо
+параметров) выполнился за запрос METRICS_REPEATED_QUERY_ALARM раз и больше,
+в лог уходит предупреждение, а api_repeated_query_alarms_total растёт.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+METRICS = {
+    'api_requests_total': ('counter', 'Requests by route, method and status class'),
+    'api_request_duration_seconds': ('histogram', 'Time to produce the response', LATENCY_BUCKETS),
+    'api_db_queries': ('histogram', 'SQL queries per request', QUERY_BUCKETS),
+    'api_db_query_duration_seconds': ('histogram', 'Total SQL time per request', LATENCY_BUCKETS),
+    'api_render_duration_seconds': ('histogram', 'Time to serialize the response body', LATENCY_BUCKETS),
+    'api_response_size_bytes': ('histogram', 'Response body size', SIZE_BUCKETS),
+    'api_repeated_query_alarms_total': ('counter', 'Requests that repeated one SQL statement (likely N+1)'),
+    'api_cache_hits_total': ('counter', 'Object cache hits (api.cache)'),
+    'api_cache_misses_total': ('counter', 'Object cache misses'),
+    'api_cache_invalidations_total': ('counter', 'Object cache entries dropped after writes'),
+}
+
+_lock = threading.Lock()
+_counters = Counter()
+# (имя, метки) -> [счётчики по корзинам..., сумма, количество]
+_histograms = {}
+_last_flush = 0.0
+# (каталог, pid), для которых уже подхвачен файл прежнего процесса с тем же pid
+_adopted = set()
+
+
+def enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+def sample_rate():
+    return getattr(settings, 'METRICS_SAMPLE_RATE', 1.0)
+
+
+def repeated_query_alarm():
+    return getattr(settings, 'METRICS_REPEATED_QUERY_ALARM', 10)
+
+
+def metrics_dir():
+    directory = getattr(settings, 'METRICS_DIR', None)
+    return str(directory) if directory else None
+
+
+def flush_interval():
+    return getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0)
+
+
+def inc(name, labels, value=1):
+    with _lock:
+        _counters[name, labels] += value
+
+
+def observe(name, labels, value):
+    buckets = METRICS[name][2]
+    with _lock:
+        row = _histograms.get((name, labels))
+        if row is None:
+            row = _histograms[name, labels] = [0] * (len(buckets) + 2)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                row[i] += 1
+        row[-2] += value
+        row[-1] += 1
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        directory = metrics_dir()
+        if directory:
+            _adopted.add((directory, os.getpid()))
+            try:
+                os.unlink(_snapshot_path(directory))
+            except FileNotFoundError:
+                pass
+
+
+def _snapshot_path(directory):
+    return os.path.join(directory, f'{os.getpid()}.json')
+
+
+def _read_snapshot(path):
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (FileNotFoundError, ValueError):
+        # Файл мог пропасть или оказаться битым после падения — просто пропускаем
+        return [], []
+    return ([(name, _labels(pairs), value) for name, pairs, value in snapshot['counters']],
+            [(name, _labels(pairs), row) for name, pairs, row in snapshot['histograms']])
+
+
+def _labels(pairs):
+    # В JSON кортежи меток становятся списками
+    return tuple(tuple(pair) for pair in pairs)
+
+
+def _merge(snapshot, counters, histograms):
+    counter_rows, histogram_rows = snapshot
+    for name, labels, value in counter_rows:
+        counters[name, labels] += value
+    for name, labels, row in histogram_rows:
+        total = histograms.setdefault((name, labels), [0] * len(row))
+        for i, value in enumerate(row):
+            total[i] += value
+
+
+def flush(force=False):
+    """Сбрасывает счётчики процесса в METRICS_DIR/<pid>.json (не чаще METRICS_FLUSH_INTERVAL)."""
+    global _last_flush
+    directory = metrics_dir()
+    now = time.monotonic()
+    if not directory or (not force and now - _last_flush < flush_interval()):
+        return
+    _last_flush = now
+    os.makedirs(directory, exist_ok=True)
+    path = _snapshot_path(directory)
+    with _lock:
+        if (directory, os.getpid()) not in _adopted:
+            # pid переиспользован: без этого сумма по воркерам уменьшилась бы
+            _merge(_read_snapshot(path), _counters, _histograms)
+            _adopted.add((directory, os.getpid()))
+        snapshot = {
+            'counters': [[name, labels, value] for (name, labels), value in _counters.items()],
+            'histograms': [[name, labels, row] for (name, labels), row in _histograms.items()],
+        }
+    temporary = f'{path}.{threading.get_ident()}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(temporary, path)
+
+
+atexit.register(flush, True)
+
+
+def collect():
+    """Счётчики и гистограммы всех воркеров: ({(имя, метки): значение}, {(имя, метки): корзины})."""
+    directory = metrics_dir()
+    if not directory:
+        with _lock:
+            return Counter(_counters), {key: list(row) for key, row in _histograms.items()}
+    flush(force=True)
+    counters, histograms = Counter(), {}
+    for name in os.listdir(directory):
+        if name.endswith('.json'):
+            _merge(_read_snapshot(os.path.join(directory, name)), counters, histograms)
+    return counters, histograms
+
+
+class RequestStats:
+    """Замеры одного запроса; wrapper вешается на все соединения через execute_wrapper."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.render_seconds = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_seconds += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def capture(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+
+def record(route, method, status, seconds, stats=None, size=None):
+    labels = (('route', route), ('method', method))
+    inc('api_requests_total', labels + (('status', f'{status // 100}xx'),))
+    if stats is not None:
+        _observe_request(labels, method, route, seconds, stats, size)
+    flush()
+
+
+def _observe_request(labels, method, route, seconds, stats, size):
+    observe('api_request_duration_seconds', labels, seconds)
+    observe('api_db_queries', labels, stats.queries)
+    observe('api_db_query_duration_seconds', labels, stats.sql_seconds)
+    observe('api_render_duration_seconds', labels, stats.render_seconds)
+    if size is not None:
+        observe('api_response_size_bytes', labels, size)
+
+    if stats.statements:
+        sql, repeats = stats.statements.most_common(1)[0]
+        if repeats >= repeated_query_alarm():
+            inc('api_repeated_query_alarms_total', labels)
+            logger.warning('Possible N+1 on %s %s: %d queries, %d x %s',
+                           method, route, stats.queries, repeats, sql)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def render():
+    """Метрики всех воркеров и статистика кэша в текстовом формате Prometheus."""
+    counters, histograms = collect()
+
+    lines = []
+    for name, (kind, help_text, *buckets) in METRICS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        if kind == 'counter':
+            lines += [f'{name}{_format_labels(labels)} {value}'
+                      for (metric, labels), value in sorted(counters.items()) if metric == name]
+            continue
+        for (metric, labels), row in sorted(histograms.items()):
+            if metric != name:
+                continue
+            for bound, count in zip(buckets[0], row):
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} {count}')
+            lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {row[-1]}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {row[-2]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {row[-1]}')
+
+    hits, misses = counters['api_cache_hits_total', ()], counters['api_cache_misses_total', ()]
+    ratio = hits / (hits + misses) if hits + misses else 0.0
+    lines += ['# TYPE api_cache_hit_ratio gauge', f'api_cache_hit_ratio {ratio}']
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,108 @@
+import random
+import time
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+
+from . import cache as api_cache
+from . import metrics, profiling, routers
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReadYourWritesMiddleware:
+    """
+    Небезопасные запросы целиком читают из основной базы, а после успешной
+    записи пользователь на REPLICA_PIN_SECONDS закрепляется за ней (ключ
+    db:pin:<id>, его проверяет api.authentication), чтобы следующий GET
+    не получил с реплики состояние до его же изменения.
+
+    Ключ должен быть виден всем воркерам: в LocMem запись на воркере A не
+    закрепит следующий GET на воркере B, поэтому реплики без общего кэша
+    (api.cache.shared) не запускаются.
+    """
+
+    def __init__(self, get_response):
+        if routers.replicas() and not api_cache.shared():
+            raise ImproperlyConfigured(
+                'SQLITE_REPLICAS needs a cache shared by all workers (REDIS_URL) for read-your-writes pins; '
+                'set API_CACHE_SINGLE_PROCESS=True only if the server runs a single process.')
+        self.get_response = get_response
+
+    def __call__(self, request):
+        writes = request.method not in SAFE_METHODS
+        # Всегда ставим своё значение: контекст потока переиспользуется следующими запросами
+        token = routers.pin_primary(writes)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.reset(token)
+        user = getattr(request, 'user', None)
+        if writes and routers.replicas() and user is not None and user.is_authenticated \
+                and response.status_code < 400:
+            cache.set(routers.pin_key(user.id), True, routers.pin_seconds())
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Снимает метрики запроса для api.metrics: время ответа, SQL, рендеринг
+    и размер. Стоит первым в MIDDLEWARE, чтобы в замер попало всё остальное.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not metrics.enabled():
+            return self.get_response(request)
+        stats = metrics.RequestStats() if random.random() < metrics.sample_rate() else None
+        request._metrics = stats
+        started = time.perf_counter()
+        if stats is None:
+            response = self.get_response(request)
+        else:
+            with stats.capture():
+                response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        size = None if response.streaming else len(response.content)
+        metrics.record(match.route if match else 'unmatched', request.method, response.status_code,
+                       elapsed, stats, size)
+        return response
+
+    def process_template_response(self, request, response):
+        # Ответы DRF рендерятся в JSON уже после вьюхи — меряем это отдельно
+        stats = getattr(request, '_metrics', None)
+        if stats is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                stats.render_seconds += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Профилирует запрос, если api.profiling.trigger() на это согласен, и
+    возвращает id сохранённого профиля в заголовке X-Profile-Id.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reason = profiling.trigger(request)
+        if reason is None:
+            return self.get_response(request)
+        with profiling.RequestProfile() as profile:
+            response = self.get_response(request)
+        match = request.resolver_match
+        response['X-Profile-Id'] = profile.save(
+            route=match.route if match else 'unmatched', method=request.method, path=request.path,
+            status=response.status_code, trigger=reason,
+        )
+        return response
@@ -0,0 +1,57 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _count_of(model, link, outer='pk'):
+    counts = (model.objects.filter(**{link: OuterRef(outer)})
+              .order_by().values(link).annotate(n=Count('pk')).values('n'))
+    return Coalesce(Subquery(counts), 0)
+
+
+def backfill_counters(apps, schema_editor):
+    Post = apps.get_model('api', 'Post')
+    Profile = apps.get_model('api', 'Profile')
+    Like = apps.get_model('api', 'Like')
+    Comment = apps.get_model('api', 'Comment')
+    Follow = apps.get_model('api', 'Follow')
+
+    Post.objects.update(
+        likes_count=_count_of(Like, 'post'),
+        comments_count=_count_of(Comment, 'post'),
+    )
+    Profile.objects.update(
+        followers_count=_count_of(Follow, 'following', 'user_id'),
+        following_count=_count_of(Follow, 'follower', 'user_id'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_alter_profile_avatar_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS api_post_fts USING fts5(content, tokenize='unicode61 remove_diacritics 2')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS api_user_fts USING fts5(username, prefix='2 3')",
+    "INSERT INTO api_post_fts(rowid, content) SELECT id, content FROM api_post",
+    "INSERT INTO api_user_fts(rowid, username) SELECT id, username FROM auth_user",
+]
+SQLITE_BACKWARD = [
+    "DROP TABLE IF EXISTS api_post_fts",
+    "DROP TABLE IF EXISTS api_user_fts",
+]
+POSTGRES_FORWARD = [
+    "CREATE INDEX IF NOT EXISTS api_post_content_fts ON api_post USING GIN (to_tsvector('simple', content))",
+    "CREATE INDEX IF NOT EXISTS auth_user_username_prefix ON auth_user (lower(username) text_pattern_ops)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS api_post_content_fts",
+    "DROP INDEX IF EXISTS auth_user_username_prefix",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for sql in statements.get(vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_timelineentry'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            _run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
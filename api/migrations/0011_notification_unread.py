@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-18 14:18
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_unread(apps, schema_editor):
+    Profile = apps.get_model('api', 'Profile')
+    Notification = apps.get_model('api', 'Notification')
+    unread = (Notification.objects.filter(recipient=OuterRef('user_id'), is_read=False)
+              .order_by().values('recipient').annotate(n=Count('pk')).values('n'))
+    Profile.objects.update(unread_notifications_count=Coalesce(Subquery(unread), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_notificationoutbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='unread_notifications_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'is_read', 'created_at'], name='notification_unread_idx'),
+        ),
+        migrations.RunPython(backfill_unread, migrations.RunPython.noop),
+    ]
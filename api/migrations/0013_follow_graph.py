@@ -0,0 +1,61 @@
+# Generated by Django 5.2 on 2026-10-18 14:20
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+LEGACY_TABLE = 'auth_user_following'
+
+
+def merge_legacy_following(apps, schema_editor):
+    """
+    Раньше User.following (add_to_class) жил в отдельной таблице
+    auth_user_following. Переносим оттуда связи в api_follow и удаляем её.
+    """
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if LEGACY_TABLE not in connection.introspection.table_names(cursor):
+            return
+        cursor.execute(
+            f"INSERT INTO api_follow (follower_id, following_id, created_at) "
+            f"SELECT legacy.from_user_id, legacy.to_user_id, %s FROM {LEGACY_TABLE} legacy "
+            f"WHERE legacy.from_user_id <> legacy.to_user_id AND NOT EXISTS ("
+            f"SELECT 1 FROM api_follow f WHERE f.follower_id = legacy.from_user_id "
+            f"AND f.following_id = legacy.to_user_id)",
+            [django.utils.timezone.now()],
+        )
+        moved = cursor.rowcount
+    schema_editor.execute(f'DROP TABLE {LEGACY_TABLE}')
+
+    if moved:
+        Profile = apps.get_model('api', 'Profile')
+        Follow = apps.get_model('api', 'Follow')
+
+        def count_of(link):
+            counts = (Follow.objects.filter(**{link: OuterRef('user_id')})
+                      .order_by().values(link).annotate(n=Count('pk')).values('n'))
+            return Coalesce(Subquery(counts), 0)
+
+        Profile.objects.update(followers_count=count_of('following'), following_count=count_of('follower'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_access_pattern_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['following', '-created_at', '-id'], name='follow_followers_list_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['follower', '-created_at', '-id'], name='follow_following_list_idx'),
+        ),
+        migrations.RunPython(merge_legacy_following, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+import hashlib
+import math
+import time
+
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import cache
+
+
+class NotModified(Exception):
+    pass
+
+
+class ConditionalGetMixin:
+    """
+    ETag и Last-Modified для GET-вьюх.
+
+    Валидаторы строятся из отметок изменений в кэше (api.cache.get_stamps)
+    до сериализации, поэтому на совпадающий If-None-Match / If-Modified-Since
+    ответ 304 отдаётся без запросов к данным. Вьюха перечисляет, от каких
+    пространств имён зависит ответ, в get_cache_namespaces().
+
+    Если отметки не общие для всех процессов (cache.shared), валидаторы
+    не выдаются вовсе: лучше полный ответ, чем 304 на устаревшие данные.
+    """
+
+    def get_cache_namespaces(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+    def get_validators(self, request, *args, **kwargs):
+        stamps = cache.get_stamps(self.get_cache_namespaces(request, *args, **kwargs))
+        # Ответ зависит от пользователя (is_liked, уведомления) и от параметров страницы
+        user_id = request.user.id if request.user.is_authenticated else 0
+        payload = repr((sorted(stamps.items()), user_id, request.get_full_path()))
+        etag = quote_etag(hashlib.sha1(payload.encode('utf-8')).hexdigest())
+        # Вверх: отметка 10.3 не должна совпасть с копией, выданной в 10.0
+        return etag, math.ceil(max(stamps.values()))
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._validators = None
+        if request.method not in ('GET', 'HEAD') or not cache.shared():
+            return
+        etag, last_modified = self._validators = self.get_validators(request, *args, **kwargs)
+
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            etags = parse_etags(if_none_match)
+            if '*' in etags or etag in etags:
+                raise NotModified
+            return
+        if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        if if_modified_since is not None and last_modified <= if_modified_since:
+            raise NotModified
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        validators = getattr(self, '_validators', None)
+        if validators and response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            etag, last_modified = validators
+            response['ETag'] = etag
+            # Пока секунда отметки не истекла, в неё же может попасть ещё одна запись,
+            # и If-Modified-Since с точностью до секунды её не отличит
+            if time.time() >= last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+            # Ответы персональные: промежуточным кэшам хранить нельзя, клиент обязан перепроверять
+            response['Cache-Control'] = 'private, no-cache'
+        return response
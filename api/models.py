@@ -1,18 +1,43 @@
 from django.db import models
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from django.contrib.auth.models import User
 from django.utils import timezone
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        return self.select_related('user')
+
+
 class Post(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Денормализованные счётчики, обновляются в api/signals.py
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Глобальная лента и лента пользователя, keyset по (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='post_feed_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='post_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
 
-    def likes_count(self):
-        return self.likes.count()
+
+class CommentQuerySet(models.QuerySet):
+    def previews(self, post_ids, per_post):
+        """Первые per_post комментариев каждого поста одним оконным запросом."""
+        return (self.filter(post_id__in=post_ids).select_related('user')
+                .annotate(position=Window(RowNumber(), partition_by=F('post_id'),
+                                          order_by=[F('created_at').asc(), F('id').asc()]))
+                .filter(position__lte=per_post))
 
 
 class Comment(models.Model):
@@ -21,6 +46,13 @@ class Comment(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CommentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created_at', 'id'], name='comment_post_created_idx'),
+        ]
+
     def __str__(self):
         return f"Comment by {self.user.username} on {self.post.id}"
 
@@ -39,13 +71,16 @@ class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     bio = models.TextField(blank=True)
     avatar_url = models.URLField(blank=True, null=True)
+    # {'small': {'webp': url, 'jpg': url}, ...} — см. api/avatars.py
+    avatar_variants = models.JSONField(default=dict, blank=True)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    unread_notifications_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.user.username
 
 
-User.add_to_class('following', models.ManyToManyField('self', related_name='followers', symmetrical=False))
-
 class Follow(models.Model):
     follower = models.ForeignKey(User, on_delete=models.CASCADE, related_name='following_set')
     following = models.ForeignKey(User, on_delete=models.CASCADE, related_name='followers_set')
@@ -53,6 +88,13 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ('follower', 'following')
+        indexes = [
+            # unique_together покрывает "на кого подписан", этот — "кто подписан"
+            models.Index(fields=['following', 'follower'], name='follow_following_idx'),
+            # Списки подписчиков/подписок, keyset по (created_at, id)
+            models.Index(fields=['following', '-created_at', '-id'], name='follow_followers_list_idx'),
+            models.Index(fields=['follower', '-created_at', '-id'], name='follow_following_list_idx'),
+        ]
     def __str__(self):
         return f"{self.follower.username} follows {self.following.username}"
 
@@ -63,5 +105,45 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['recipient', 'is_read', 'created_at'], name='notification_unread_idx'),
+            models.Index(fields=['recipient', '-created_at', '-id'], name='notification_recipient_idx'),
+        ]
+
     def __str__(self):
         return f"Notification for {self.recipient.username} from {self.sender.username}"
+
+
+class TimelineEntry(models.Model):
+    """
+    Предрассчитанная домашняя лента: id поста, разложенный по подписчикам
+    автора при публикации (fan-out on write), см. api/timeline.py.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    # Копия post.created_at, чтобы страница читалась одним индексом без JOIN
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='timeline_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} in timeline of {self.user_id}"
+
+
+class NotificationOutbox(models.Model):
+    """
+    Очередь событий для уведомлений: вьюха пишет сюда одну короткую строку,
+    а сами Notification создаёт воркер process_notifications пачками.
+    """
+    kind = models.CharField(max_length=16)
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.kind} from {self.sender_id} to {self.recipient_id}"
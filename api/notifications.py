@@ -0,0 +1,240 @@
+"""
+Неблокирующая доставка уведомлений.
+
+Вьюхи вызывают notify() — это одна дешёвая постановка события в очередь.
+Сами строки Notification создаются пачками через bulk_create, при этом
+одинаковые события схлопываются, а лайк, отменённый в той же пачке,
+не создаёт уведомления вовсе.
+
+Очередь выбирается настройкой NOTIFICATION_QUEUE:
+  * LocalNotificationQueue — in-process очередь с фоновым потоком (по умолчанию);
+  * OutboxNotificationQueue — таблица NotificationOutbox, которую разбирает
+    management-команда process_notifications.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import Counter, namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+from . import cache, realtime
+from .models import Notification, NotificationOutbox, Profile
+from .signals import bump_counter, bump_counters
+
+logger = logging.getLogger(__name__)
+
+LIKE = 'like'
+UNLIKE = 'unlike'
+COMMENT = 'comment'
+FOLLOW = 'follow'
+
+MESSAGES = {
+    LIKE: " лайкнул ваш пост",
+    COMMENT: "прокомментировал ваш пост",
+    FOLLOW: " подписался на вас",
+}
+
+BATCH_SIZE = 500
+
+Event = namedtuple('Event', ['kind', 'sender_id', 'recipient_id'])
+
+
+def coalesce(events):
+    """
+    Схлопывает пачку событий: повторы превращаются в одно событие,
+    unlike отменяет ещё не доставленный like того же отправителя.
+    """
+    pending = {}
+    for event in events:
+        if event.kind == UNLIKE:
+            pending.pop(Event(LIKE, event.sender_id, event.recipient_id), None)
+        elif event.kind in MESSAGES:
+            pending.setdefault(event, None)
+    return list(pending)
+
+
+def deliver(events):
+    """
+    Создаёт уведомления для пачки событий одним bulk_create и одним
+    UPDATE сдвигает счётчики непрочитанных у получателей.
+    """
+    notifications = [
+        Notification(recipient_id=event.recipient_id, sender_id=event.sender_id, message=MESSAGES[event.kind])
+        for event in coalesce(events)
+    ]
+    if not notifications:
+        return []
+    unread = Counter(notification.recipient_id for notification in notifications)
+    with transaction.atomic():
+        created = Notification.objects.bulk_create(notifications, batch_size=BATCH_SIZE)
+        bump_counters(Profile.objects.all(), 'user_id', 'unread_notifications_count', unread)
+        cache.touch(*(f'notifications:{recipient_id}' for recipient_id in unread))
+        payloads = to_payloads(created)
+        transaction.on_commit(lambda: realtime.publish_notifications(payloads))
+    return created
+
+
+def to_payloads(notifications):
+    """
+    То же, что NotificationSerializer, но имена отправителей и получателей
+    для всей пачки берутся одним запросом.
+    """
+    user_ids = {n.sender_id for n in notifications} | {n.recipient_id for n in notifications}
+    usernames = dict(User.objects.filter(id__in=user_ids).values_list('id', 'username'))
+    return [{
+        'id': notification.id,
+        'recipient_id': notification.recipient_id,
+        'sender_username': usernames.get(notification.sender_id),
+        'recipient_username': usernames.get(notification.recipient_id),
+        'message': notification.message,
+        'is_read': notification.is_read,
+        'created_at': notification.created_at.isoformat(),
+    } for notification in notifications]
+
+
+def mark_read(user, up_to=None):
+    """
+    Помечает прочитанными непрочитанные уведомления пользователя
+    (с id не больше up_to, если он задан). Уже прочитанные строки не трогаются.
+    """
+    unread = Notification.objects.filter(recipient=user, is_read=False)
+    if up_to is not None:
+        unread = unread.filter(id__lte=up_to)
+    with transaction.atomic():
+        marked = unread.update(is_read=True)
+        if marked:
+            bump_counter(Profile.objects.filter(user_id=user.id), 'unread_notifications_count', -marked)
+            cache.touch(f'notifications:{user.id}')
+    return marked
+
+
+class LocalNotificationQueue:
+    """
+    Очередь в памяти процесса. События попадают в неё только после коммита
+    транзакции вьюхи, фоновый поток доставляет их пачками.
+    """
+
+    def __init__(self, flush_interval=0.5, autostart=True):
+        self.flush_interval = flush_interval
+        self.autostart = autostart
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, event):
+        self.put_many([event])
+
+    def put_many(self, events):
+        def enqueue():
+            for event in events:
+                self._queue.put(event)
+
+        transaction.on_commit(enqueue)
+        if self.autostart:
+            self._ensure_worker()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='notification-worker', daemon=True)
+                self._thread.start()
+
+    def _take_batch(self, block):
+        batch = []
+        try:
+            batch.append(self._queue.get(block=block, timeout=self.flush_interval if block else None))
+            while len(batch) < BATCH_SIZE:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def flush(self):
+        """Синхронно доставляет всё, что накопилось в очереди."""
+        delivered = 0
+        while True:
+            batch = self._take_batch(block=False)
+            if not batch:
+                return delivered
+            delivered += len(deliver(batch))
+
+    def _run(self):
+        while True:
+            batch = self._take_batch(block=True)
+            if not batch:
+                continue
+            try:
+                deliver(batch)
+            except Exception:
+                logger.exception('Failed to deliver %d notification events', len(batch))
+            finally:
+                close_old_connections()
+
+
+class OutboxNotificationQueue:
+    """Очередь в таблице NotificationOutbox, запись идёт в транзакции вьюхи."""
+
+    def put(self, event):
+        self.put_many([event])
+
+    def put_many(self, events):
+        NotificationOutbox.objects.bulk_create([
+            NotificationOutbox(kind=event.kind, sender_id=event.sender_id, recipient_id=event.recipient_id)
+            for event in events
+        ])
+
+    def flush(self, batch_size=BATCH_SIZE):
+        """
+        Забирает одну пачку из outbox и доставляет её; возвращает число
+        обработанных событий. На СУБД с SKIP LOCKED несколько воркеров
+        разбирают очередь параллельно, не пересекаясь.
+        """
+        from django.db import connection
+
+        with transaction.atomic():
+            rows = NotificationOutbox.objects.order_by('id')
+            if connection.features.has_select_for_update_skip_locked:
+                rows = rows.select_for_update(skip_locked=True)
+            rows = list(rows.values_list('id', 'kind', 'sender_id', 'recipient_id')[:batch_size])
+            if not rows:
+                return 0
+            deliver([Event(*row[1:]) for row in rows])
+            NotificationOutbox.objects.filter(id__in=[row[0] for row in rows]).delete()
+        return len(rows)
+
+
+@lru_cache(maxsize=None)
+def get_queue():
+    backend = getattr(settings, 'NOTIFICATION_QUEUE', 'api.notifications.LocalNotificationQueue')
+    return import_string(backend)()
+
+
+def notify(kind, sender_id, recipient_id):
+    notify_many([Event(kind, sender_id, recipient_id)])
+
+
+def notify_many(events):
+    """Ставит в очередь пачку событий (kind, sender_id, recipient_id) одной операцией."""
+    events = [Event(*event) for event in events if event[1] != event[2]]
+    if events:
+        get_queue().put_many(events)
+
+
+def run_worker(batch_size=BATCH_SIZE, idle_sleep=1.0, once=False):
+    """Цикл воркера для OutboxNotificationQueue."""
+    outbox = OutboxNotificationQueue()
+    while True:
+        try:
+            processed = outbox.flush(batch_size)
+        finally:
+            close_old_connections()
+        if once and not processed:
+            return
+        if not processed:
+            time.sleep(idle_sleep)
@@ -0,0 +1,96 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(created_at, pk):
+    payload = json.dumps([created_at.isoformat(), pk]).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, pk = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        created_at = parse_datetime(created_at)
+        if created_at is None:
+            raise ValueError(cursor)
+        return created_at, int(pk)
+    except (ValueError, TypeError, UnicodeError):
+        raise ValidationError({'cursor': 'Invalid cursor.'})
+
+
+def get_page_size(request, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    try:
+        size = int(request.query_params.get('limit', default))
+    except (TypeError, ValueError):
+        raise ValidationError({'limit': 'Must be an integer.'})
+    return max(1, min(size, maximum))
+
+
+def get_offset(request):
+    try:
+        return max(0, int(request.query_params.get('offset', 0)))
+    except (TypeError, ValueError):
+        raise ValidationError({'offset': 'Must be an integer.'})
+
+
+def keyset_filter(cursor, descending=True, field='created_at'):
+    """
+    Условие "строго после курсора" для сортировки по (field, id).
+    """
+    created_at, pk = decode_cursor(cursor)
+    op = 'lt' if descending else 'gt'
+    return Q(**{f'{field}__{op}': created_at}) | Q(**{field: created_at, f'id__{op}': pk})
+
+
+def paginate_keyset(queryset, request, descending=True, field='created_at', page_size=None):
+    """
+    Keyset-пагинация по (field, id): возвращает (items, next_cursor).
+
+    Один запрос на страницу: берём page_size + 1 строк, чтобы понять,
+    есть ли следующая страница, без отдельного COUNT.
+    """
+    if page_size is None:
+        page_size = get_page_size(request)
+    cursor = request.query_params.get('cursor')
+    if cursor:
+        queryset = queryset.filter(keyset_filter(cursor, descending, field))
+    if descending:
+        queryset = queryset.order_by(f'-{field}', '-id')
+    else:
+        queryset = queryset.order_by(field, 'id')
+
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.pk)
+    return items, next_cursor
+
+
+def paginate_by_id(queryset, request, page_size=None):
+    """Keyset-пагинация по возрастанию id для моделей без created_at."""
+    if page_size is None:
+        page_size = get_page_size(request)
+    cursor = request.query_params.get('cursor')
+    if cursor:
+        try:
+            (after,) = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            after = int(after)
+        except (ValueError, TypeError, UnicodeError):
+            raise ValidationError({'cursor': 'Invalid cursor.'})
+        queryset = queryset.filter(id__gt=after)
+
+    items = list(queryset.order_by('id')[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = base64.urlsafe_b64encode(json.dumps([items[-1].pk]).encode('utf-8')).decode('ascii')
+    return items, next_cursor
@@ -0,0 +1,235 @@
+"""
+Профилирование отдельных запросов по требованию.
+
+ProfilingMiddleware (api/middleware.py) профилирует запрос, если:
+  * в заголовке X-Profile пришла подпись из sign() (manage.py profiles --sign) —
+    годится и в проде, подпись живёт PROFILING_SIGNATURE_MAX_AGE секунд;
+  * staff-пользователь добавил к запросу ?profile=1;
+  * запрос попал в случайную выборку PROFILING_SAMPLE_RATE.
+
+Профилировщик сэмплирующий: фоновый поток раз в PROFILING_INTERVAL секунд
+снимает стек потока запроса через sys._current_frames(), так что вьюхи не
+замедляются в разы, как под cProfile. Параллельно через execute_wrapper
+пишется хронология SQL.
+
+Результат — два файла в PROFILING_DIR:
+  * <id>.folded — стеки в collapsed-формате ("a;b;c 12"), открываются
+    в flamegraph.pl, speedscope и inferno;
+  * <id>.json — маршрут, время, статус и SQL-хронология.
+Хранятся последние PROFILING_MAX_FILES профилей.
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from . import routers
+from .authentication import StatelessJWTAuthentication
+
+HEADER = 'X-Profile'
+QUERY_FLAG = 'profile'
+SALT = 'api.profiling'
+MAX_SQL_LENGTH = 1000
+STOP_FRAME = f'{__name__}.Sampler.stop'
+
+
+def enabled():
+    return getattr(settings, 'PROFILING_ENABLED', True)
+
+
+def profiles_dir():
+    return str(settings.PROFILING_DIR)
+
+
+def sample_rate():
+    return getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+
+
+def interval():
+    return getattr(settings, 'PROFILING_INTERVAL', 0.005)
+
+
+def sign():
+    """Значение заголовка X-Profile, по которому запрос будет профилирован."""
+    return signing.TimestampSigner(salt=SALT).sign(uuid.uuid4().hex)
+
+
+def _valid_signature(value):
+    try:
+        signing.TimestampSigner(salt=SALT).unsign(
+            value, max_age=getattr(settings, 'PROFILING_SIGNATURE_MAX_AGE', 3600))
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def _is_staff(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    # JWT разбирается только во вьюхе DRF; состояние пользователя берётся из кэша.
+    # get_user может закрепить чтение за основной базой — это решать не нам
+    token = routers.pin_primary(routers.is_pinned())
+    try:
+        authenticated = StatelessJWTAuthentication().authenticate(request)
+    except (AuthenticationFailed, InvalidToken):
+        return False
+    finally:
+        routers.reset(token)
+    return authenticated is not None and authenticated[0].is_staff
+
+
+def trigger(request):
+    """Почему запрос надо профилировать, или None."""
+    if not enabled():
+        return None
+    header = request.headers.get(HEADER)
+    if header and _valid_signature(header):
+        return 'header'
+    if request.GET.get(QUERY_FLAG) and _is_staff(request):
+        return 'staff'
+    rate = sample_rate()
+    if rate and random.random() < rate:
+        return 'sample'
+    return None
+
+
+def collapse(frame):
+    """Стек от корня к листу в виде "module.func;module.func"."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{frame.f_globals.get("__name__", "?")}.{getattr(code, "co_qualname", code.co_name)}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Sampler(threading.Thread):
+    def __init__(self, thread_id, interval):
+        super().__init__(name='request-profiler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = collapse(frame)
+            # Поток запроса уже ждёт остановки сэмплера — это не его время
+            if STOP_FRAME not in stack:
+                self.stacks[stack] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+class SqlTimeline:
+    def __init__(self, started):
+        self.started = started
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            # Параметры не сохраняем: в профилях не должно быть пользовательских данных
+            self.queries.append({
+                'start_ms': round((started - self.started) * 1000, 3),
+                'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+                'sql': sql[:MAX_SQL_LENGTH],
+            })
+
+
+class RequestProfile:
+    """Профилирование одного запроса: with RequestProfile() as profile: ..."""
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.started_at = datetime.now(timezone.utc)
+        self.sql = SqlTimeline(self.started)
+        self._wrappers = ExitStack()
+        for connection in connections.all():
+            self._wrappers.enter_context(connection.execute_wrapper(self.sql))
+        self.sampler = Sampler(threading.get_ident(), interval())
+        self.sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.sampler.stop()
+        self._wrappers.close()
+        self.duration = time.perf_counter() - self.started
+        return False
+
+    def save(self, **meta):
+        """Пишет .folded и .json в PROFILING_DIR, возвращает id профиля."""
+        directory = profiles_dir()
+        os.makedirs(directory, exist_ok=True)
+        profile_id = f'{self.started_at:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}'
+        base = os.path.join(directory, profile_id)
+        with open(base + '.folded', 'w') as f:
+            f.writelines(f'{stack} {count}\n' for stack, count in self.sampler.stacks.most_common())
+        with open(base + '.json', 'w') as f:
+            json.dump(dict(
+                meta,
+                id=profile_id,
+                started_at=self.started_at.isoformat(),
+                duration_ms=round(self.duration * 1000, 3),
+                interval_ms=self.sampler.interval * 1000,
+                samples=sum(self.sampler.stacks.values()),
+                sql_ms=round(sum(query['duration_ms'] for query in self.sql.queries), 3),
+                queries=self.sql.queries,
+            ), f, indent=1)
+        prune(directory)
+        return profile_id
+
+
+def load(directory=None):
+    """Метаданные сохранённых профилей, новые первыми."""
+    directory = directory or profiles_dir()
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if name.endswith('.json'):
+            with open(os.path.join(directory, name)) as f:
+                profiles.append(json.load(f))
+    return profiles
+
+
+def load_stacks(profile_id, directory=None):
+    stacks = Counter()
+    path = os.path.join(directory or profiles_dir(), profile_id + '.folded')
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                stacks[stack] += int(count)
+    return stacks
+
+
+def prune(directory):
+    keep = getattr(settings, 'PROFILING_MAX_FILES', 500)
+    names = sorted((name[:-5] for name in os.listdir(directory) if name.endswith('.json')), reverse=True)
+    for profile_id in names[keep:]:
+        for ext in ('.json', '.folded'):
+            try:
+                os.unlink(os.path.join(directory, profile_id + ext))
+            except FileNotFoundError:
+                pass
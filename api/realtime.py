@@ -0,0 +1,111 @@
+"""
+Доставка уведомлений в реальном времени через Server-Sent Events.
+
+Хаб держит подписки подключённых получателей и рассылает им новые
+уведомления. LocalHub работает внутри одного процесса; если уведомления
+создаются в другом процессе (воркер process_notifications или несколько
+ASGI-воркеров), нужен RedisHub, который пересылает события через Redis
+pub/sub. Хаб выбирается настройкой NOTIFICATION_HUB.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class LocalHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # user_id -> {(event loop, asyncio.Queue)}
+        self._subscribers = defaultdict(set)
+
+    @asynccontextmanager
+    async def subscribe(self, user_id):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE))
+        with self._lock:
+            self._subscribers[user_id].add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self._lock:
+                self._subscribers[user_id].discard(subscriber)
+                if not self._subscribers[user_id]:
+                    del self._subscribers[user_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, user_id, payload):
+        """Потокобезопасно: вызывается из воркера уведомлений, не из event loop."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._offer, queue, payload)
+
+    @staticmethod
+    def _offer(queue, payload):
+        # Медленный клиент не должен копить память: лишнее он догонит по Last-Event-ID
+        if not queue.full():
+            queue.put_nowait(payload)
+
+
+class RedisHub(LocalHub):
+    CHANNEL_PREFIX = 'api:notifications:'
+
+    def __init__(self, url=None):
+        super().__init__()
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('RedisHub requires the "redis" package')
+        self._redis = redis.Redis.from_url(url or settings.REDIS_URL)
+        self._listener = None
+
+    def publish(self, user_id, payload):
+        self._redis.publish(f'{self.CHANNEL_PREFIX}{user_id}', json.dumps(payload))
+
+    @asynccontextmanager
+    async def subscribe(self, user_id):
+        self._ensure_listener()
+        async with super().subscribe(user_id) as queue:
+            yield queue
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='notification-hub', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(f'{self.CHANNEL_PREFIX}*')
+        for message in pubsub.listen():
+            try:
+                user_id = int(message['channel'].decode().rsplit(':', 1)[1])
+                LocalHub.publish(self, user_id, json.loads(message['data']))
+            except (ValueError, KeyError):
+                logger.warning('Malformed notification hub message: %r', message)
+
+
+@lru_cache(maxsize=None)
+def get_hub():
+    backend = getattr(settings, 'NOTIFICATION_HUB', 'api.realtime.LocalHub')
+    return import_string(backend)()
+
+
+def publish_notifications(payloads):
+    hub = get_hub()
+    for payload in payloads:
+        hub.publish(payload['recipient_id'], payload)
@@ -0,0 +1,71 @@
+"""
+Чтение с реплик, запись в основную базу.
+
+Реплики перечислены в settings.DATABASE_REPLICAS. Чтение уходит на
+основную базу, если:
+  * мы внутри транзакции — она должна видеть собственные записи;
+  * запрос закреплён за основной базой (pin_primary): это делает
+    ReadYourWritesMiddleware для небезопасных методов и аутентификация —
+    несколько секунд после того, как пользователь что-то записал, пока
+    реплика может отставать.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_pinned = ContextVar('db_pinned_to_primary', default=False)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def pin_key(user_id):
+    return f'db:pin:{user_id}'
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+def pin_primary(pinned=True):
+    """Закрепляет чтение за основной базой до конца текущего контекста; возвращает токен для reset."""
+    return _pinned.set(pinned)
+
+
+def reset(token):
+    _pinned.reset(token)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+@contextmanager
+def use_primary():
+    token = pin_primary()
+    try:
+        yield
+    finally:
+        reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if not aliases or _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии основной базы, связи между ними допустимы
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,152 @@
+"""
+Полнотекстовый поиск по постам и пользователям.
+
+На SQLite используются виртуальные таблицы FTS5 (api_post_fts, api_user_fts),
+на PostgreSQL — выражения to_tsvector с GIN-индексом. Таблицы и индексы
+создаёт миграция 0009_search_index, в актуальном состоянии их держат сигналы
+из api/signals.py. Для остальных СУБД остаётся ограниченный icontains.
+"""
+import re
+
+from django.contrib.auth.models import User
+from django.db import connection, connections, router
+
+from .models import Post
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+MAX_TERMS = 8
+
+
+def tokenize(query):
+    return WORD_RE.findall(query.lower())[:MAX_TERMS]
+
+
+class SimpleSearchBackend:
+    """Запасной вариант без индекса: LIKE-поиск, но всегда с LIMIT."""
+
+    def index_post(self, post):
+        self.index_posts([post])
+
+    def index_posts(self, posts):
+        pass
+
+    def remove_post(self, post_id):
+        pass
+
+    def index_user(self, user):
+        pass
+
+    def remove_user(self, user_id):
+        pass
+
+    def rebuild(self):
+        """Переиндексирует всё целиком — после массовой загрузки мимо сигналов."""
+
+    def search_posts(self, query, limit, offset=0):
+        posts = Post.objects.all()
+        for term in tokenize(query):
+            posts = posts.filter(content__icontains=term)
+        return list(posts.order_by('-created_at', '-id').values_list('id', flat=True)[offset:offset + limit])
+
+    def search_users(self, query, limit, offset=0):
+        users = User.objects.filter(username__istartswith=query.strip())
+        return list(users.order_by('username').values_list('id', flat=True)[offset:offset + limit])
+
+
+class SqliteSearchBackend(SimpleSearchBackend):
+    @staticmethod
+    def _match(terms, prefix):
+        # Каждое слово в кавычках, чтобы операторы FTS5 в запросе не интерпретировались
+        quoted = ['"%s"' % term.replace('"', '""') for term in terms]
+        if prefix:
+            quoted = [term + '*' for term in quoted]
+        else:
+            quoted[-1] += '*'
+        return ' AND '.join(quoted)
+
+    def _search(self, table, terms, prefix, limit, offset):
+        if not terms:
+            return []
+        with connections[router.db_for_read(Post)].cursor() as cursor:
+            # rank — встроенный bm25, FTS5 сортирует по нему без временного B-дерева
+            cursor.execute(
+                f'SELECT rowid FROM {table} WHERE {table} MATCH %s ORDER BY rank LIMIT %s OFFSET %s',
+                [self._match(terms, prefix), limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def index_posts(self, posts):
+        if not posts:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT OR REPLACE INTO api_post_fts(rowid, content) VALUES '
+                           + ', '.join(['(%s, %s)'] * len(posts)),
+                           [value for post in posts for value in (post.id, post.content)])
+
+    def remove_post(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM api_post_fts WHERE rowid = %s', [post_id])
+
+    def index_user(self, user):
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT OR REPLACE INTO api_user_fts(rowid, username) VALUES (%s, %s)',
+                           [user.id, user.username])
+
+    def remove_user(self, user_id):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM api_user_fts WHERE rowid = %s', [user_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            for table, column, source in (('api_post_fts', 'content', 'api_post'),
+                                          ('api_user_fts', 'username', 'auth_user')):
+                cursor.execute(f'DELETE FROM {table}')
+                cursor.execute(f'INSERT INTO {table}(rowid, {column}) SELECT id, {column} FROM {source}')
+
+    def search_posts(self, query, limit, offset=0):
+        return self._search('api_post_fts', tokenize(query), False, limit, offset)
+
+    def search_users(self, query, limit, offset=0):
+        return self._search('api_user_fts', tokenize(query), True, limit, offset)
+
+
+class PostgresSearchBackend(SimpleSearchBackend):
+    # Индексы выражений обновляет сама СУБД, поэтому index_*/remove_* не нужны
+
+    def search_posts(self, query, limit, offset=0):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        tsquery = ' & '.join(terms[:-1] + [terms[-1] + ':*'])
+        with connections[router.db_for_read(Post)].cursor() as cursor:
+            cursor.execute(
+                "SELECT id FROM api_post "
+                "WHERE to_tsvector('simple', content) @@ to_tsquery('simple', %s) "
+                "ORDER BY ts_rank(to_tsvector('simple', content), to_tsquery('simple', %s)) DESC, id DESC "
+                "LIMIT %s OFFSET %s",
+                [tsquery, tsquery, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def search_users(self, query, limit, offset=0):
+        prefix = query.strip().lower()
+        if not prefix:
+            return []
+        escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        with connections[router.db_for_read(User)].cursor() as cursor:
+            cursor.execute(
+                "SELECT id FROM auth_user WHERE lower(username) LIKE %s "
+                "ORDER BY length(username), username LIMIT %s OFFSET %s",
+                [escaped + '%', limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    'sqlite': SqliteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend():
+    return BACKENDS.get(connection.vendor, SimpleSearchBackend)()
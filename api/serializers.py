@@ -2,6 +2,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from .models import Post, Profile, Comment, Like, Notification
+from . import batch
 from utils.s3 import *
 
 User = get_user_model()
@@ -37,51 +38,11 @@ class UserSerializer(serializers.ModelSerializer):
 
 class ProfileSerializer(serializers.ModelSerializer):
     user = UserSerializer()
-    followers_count = serializers.SerializerMethodField()
-    following_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Profile
-        fields = ['id', 'user', 'bio', 'avatar_url', 'followers_count', 'following_count']
-
-    def get_followers_count(self, obj):
-        return Follow.objects.filter(following=obj.user).count()
-
-    def get_following_count(self, obj):
-        return Follow.objects.filter(follower=obj.user).count()
-
-    def update(self, instance, validated_data):
-        user_data = validated_data.pop('user', {})
-        instance.bio = validated_data.get('bio', instance.bio)
-
-        avatar = validated_data.get('avatar', None)  # Если прислан файл
-        if avatar:
-            file_name = f"avatars/{instance.user.username}/{os.path.basename(avatar.name)}"
-            file_url = upload_to_s3(avatar, file_name)
-            instance.avatar_url = file_url  # Сохраняем URL в базе данных
-
-        if 'username' in user_data:
-            instance.user.username = user_data['username']
-            instance.user.save()
-
-        instance.save()
-        return instance
-
-
-class ProfileSerializer(serializers.ModelSerializer):
-    user = UserSerializer()
-    followers_count = serializers.SerializerMethodField()
-    following_count = serializers.SerializerMethodField()
-
-    class Meta:
-        model = Profile
-        fields = ['id', 'user', 'bio', 'avatar_url', 'followers_count', 'following_count']  # заменено 'avatar' на 'avatar_url'
-
-    def get_followers_count(self, obj):
-        return Follow.objects.filter(following=obj.user).count()
-
-    def get_following_count(self, obj):
-        return Follow.objects.filter(follower=obj.user).count()
+        fields = ['id', 'user', 'bio', 'avatar_url', 'avatar_variants', 'followers_count', 'following_count']  # заменено 'avatar' на 'avatar_url'
+        read_only_fields = ['avatar_variants', 'followers_count', 'following_count']
 
     def update(self, instance, validated_data):
         user_data = validated_data.pop('user', {})
@@ -99,15 +60,12 @@ class ProfileSerializer(serializers.ModelSerializer):
 
 class PostSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
-    comments_count = serializers.SerializerMethodField()
     is_liked = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
-        fields = ['id', 'user', 'content', 'created_at', 'comments_count', 'is_liked']
-
-    def get_comments_count(self, obj):
-        return Comment.objects.filter(post=obj).count()
+        fields = ['id', 'user', 'content', 'created_at', 'comments_count', 'likes_count', 'is_liked']
+        read_only_fields = ['comments_count', 'likes_count']
 
     def get_user(self, obj):
         return {
@@ -116,6 +74,10 @@ class PostSerializer(serializers.ModelSerializer):
         }
 
     def get_is_liked(self, obj):
+        # Для списков вьюха заранее кладёт в контекст множество лайкнутых id
+        liked_ids = self.context.get('liked_post_ids')
+        if liked_ids is not None:
+            return obj.id in liked_ids
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Like.objects.filter(post=obj, user=request.user).exists()
@@ -131,27 +93,20 @@ class CommentSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'post', 'content', 'created_at']
 
 
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+
+from .authentication import USERNAME_CLAIM
 
 
-class BearerTokenAuthentication(JWTAuthentication):
-    """
-    Custom authentication class that validates Bearer tokens in the Authorization header
-    """
+class UsernameTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Пара токенов с username в claim'ах (см. api/authentication.py)."""
 
-    def get_header(self, request):
-        header = super().get_header(request)
-        if header and header.decode('utf-8').startswith('Bearer '):
-            return header
-        return None
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token[USERNAME_CLAIM] = user.username
+        return token
 
-    def get_raw_token(self, header):
-        if header is None:
-            return None
-        parts = header.decode('utf-8').split()
-        if len(parts) == 2 and parts[0] == 'Bearer':
-            return parts[1]
-        return None
 
 class NotificationSerializer(serializers.ModelSerializer):
     sender_username = serializers.CharField(source='sender.username', read_only=True)
@@ -159,4 +114,25 @@ class NotificationSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Notification
-        fields = ['id', 'sender_username', 'recipient_username', 'message', 'is_read', 'created_at']
\ No newline at end of file
+        fields = ['id', 'sender_username', 'recipient_username', 'message', 'is_read', 'created_at']
+
+class BatchOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=batch.OPERATIONS)
+    content = serializers.CharField(required=False)
+    post_id = serializers.IntegerField(required=False)
+    username = serializers.CharField(required=False)
+
+    REQUIRED = {
+        batch.CREATE_POST: ['content'],
+        batch.COMMENT: ['post_id', 'content'],
+        batch.LIKE: ['post_id'],
+        batch.UNLIKE: ['post_id'],
+        batch.FOLLOW: ['username'],
+        batch.UNFOLLOW: ['username'],
+    }
+
+    def validate(self, attrs):
+        missing = [field for field in self.REQUIRED[attrs['op']] if field not in attrs]
+        if missing:
+            raise serializers.ValidationError({field: 'This field is required.' for field in missing})
+        return attrs
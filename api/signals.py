@@ -0,0 +1,129 @@
+from django.contrib.auth.models import User
+from django.db.models import Case, F, Value, When
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import authentication, cache, search
+from .models import Comment, Follow, Like, Notification, Post, Profile
+
+# Поля пользователя, которые держит кэш аутентификации
+AUTH_FIELDS = {'username', 'is_active', 'is_staff'}
+
+
+def bump_counter(queryset, field, delta):
+    """
+    Атомарно сдвигает счётчик через F-выражение (UPDATE ... SET x = x + n),
+    без чтения строки. Вызывается в той же транзакции, что и INSERT/DELETE.
+    """
+    if delta < 0:
+        # Счётчик не уходит в минус даже при рассинхроне; его чинит reconcile_counters
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def bump_counters(queryset, key, field, deltas):
+    """
+    Сдвигает счётчик сразу у многих строк одним UPDATE:
+    deltas = {значение key: приращение}.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return 0
+    delta = Case(*[When(**{key: pk}, then=Value(n)) for pk, n in deltas.items()], default=Value(0))
+    return queryset.filter(**{f'{key}__in': list(deltas)}).update(**{field: F(field) + delta})
+
+
+@receiver(post_save, sender=Like)
+def like_created(sender, instance, created, **kwargs):
+    if created:
+        bump_counter(Post.objects.filter(pk=instance.post_id), 'likes_count', 1)
+        cache.invalidate_posts([instance.post_id])
+
+
+@receiver(post_delete, sender=Like)
+def like_deleted(sender, instance, **kwargs):
+    bump_counter(Post.objects.filter(pk=instance.post_id), 'likes_count', -1)
+    cache.invalidate_posts([instance.post_id])
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        bump_counter(Post.objects.filter(pk=instance.post_id), 'comments_count', 1)
+        cache.invalidate_posts([instance.post_id])
+    cache.touch(f'comments:{instance.post_id}')
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    bump_counter(Post.objects.filter(pk=instance.post_id), 'comments_count', -1)
+    cache.invalidate_posts([instance.post_id])
+    cache.touch(f'comments:{instance.post_id}')
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        bump_counter(Profile.objects.filter(user_id=instance.following_id), 'followers_count', 1)
+        bump_counter(Profile.objects.filter(user_id=instance.follower_id), 'following_count', 1)
+        cache.invalidate_profiles([instance.following_id, instance.follower_id])
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    bump_counter(Profile.objects.filter(user_id=instance.following_id), 'followers_count', -1)
+    bump_counter(Profile.objects.filter(user_id=instance.follower_id), 'following_count', -1)
+    cache.invalidate_profiles([instance.following_id, instance.follower_id])
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, **kwargs):
+    search.get_backend().index_post(instance)
+    cache.invalidate_posts([instance.id])
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    search.get_backend().remove_post(instance.id)
+    cache.invalidate_posts([instance.id])
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is None or AUTH_FIELDS & set(update_fields):
+        authentication.forget_user(instance.id)
+    # Логин обновляет только last_login — переиндексировать нечего
+    if update_fields is None or 'username' in update_fields:
+        search.get_backend().index_user(instance)
+        # Имя автора вшито в закэшированные посты и профиль
+        if not created:
+            cache.touch('users')
+            cache.invalidate_profiles([instance.id])
+            cache.invalidate_posts(Post.objects.filter(user=instance).values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    authentication.forget_user(instance.id)
+    search.get_backend().remove_user(instance.id)
+    cache.invalidate_profiles([instance.id])
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def profile_changed(sender, instance, **kwargs):
+    cache.invalidate_profiles([instance.user_id])
+
+
+@receiver(post_save, sender=Notification)
+def notification_saved(sender, instance, created, **kwargs):
+    if created and not instance.is_read:
+        bump_counter(Profile.objects.filter(user_id=instance.recipient_id), 'unread_notifications_count', 1)
+    cache.touch(f'notifications:{instance.recipient_id}')
+
+
+@receiver(post_delete, sender=Notification)
+def notification_deleted(sender, instance, **kwargs):
+    if not instance.is_read:
+        bump_counter(Profile.objects.filter(user_id=instance.recipient_id), 'unread_notifications_count', -1)
+    cache.touch(f'notifications:{instance.recipient_id}')
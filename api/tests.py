@@ -1,3 +1,1257 @@
-from django.test import TestCase
+import asyncio
+import base64
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from contextlib import closing
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import http_date
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+from PIL import Image
+from rest_framework.test import APIClient
+
+from utils import images, s3
+
+from . import authentication, avatars, metrics, notifications, profiling, realtime, routers
+from . import cache as api_cache
+from . import views
+from .management.commands.refresh_replicas import Command as RefreshReplicasCommand
+from .middleware import ReadYourWritesMiddleware
+from .models import Comment, Follow, Like, Notification, NotificationOutbox, Post, Profile, TimelineEntry
+from .serializers import UsernameTokenObtainPairSerializer
+
+
+# Тесты идут в одном процессе, так что LocMem-кэш здесь общий
+@override_settings(API_CACHE_SINGLE_PROCESS=True)
+class APITestCase(TestCase):
+    def setUp(self):
+        # locmem-кэш живёт между тестами, а id в SQLite после отката переиспользуются
+        cache.clear()
+        self.client = APIClient()
+
+
+def make_user(username):
+    user = User.objects.create_user(username=username, email=f'{username}@example.com')
+    Profile.objects.create(user=user)
+    return user
+
+
+class PostListViewTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('alice')
+        self.client.force_authenticate(self.user)
+
+    def _seed(self, count):
+        for i in range(count):
+            author = make_user(f'author{Post.objects.count()}')
+            post = Post.objects.create(user=author, content=f'post {i}')
+            Comment.objects.create(user=self.user, post=post, content='hi')
+            Like.objects.create(user=self.user, post=post)
+
+    def _count_queries(self, url='/api/posts/'):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.data
+
+    def test_query_count_does_not_grow_with_page(self):
+        self._seed(2)
+        small, _ = self._count_queries()
+        self._seed(15)
+        large, data = self._count_queries()
+        self.assertEqual(small, large)
+        self.assertEqual(len(data['results']), 17)
+        first = data['results'][0]
+        self.assertEqual(first['comments_count'], 1)
+        self.assertEqual(first['likes_count'], 1)
+        self.assertTrue(first['is_liked'])
+
+    def test_cursor_walks_the_feed_without_duplicates(self):
+        self._seed(5)
+        seen = []
+        url = '/api/posts/?limit=2'
+        while url:
+            _, data = self._count_queries(url)
+            seen.extend(post['id'] for post in data['results'])
+            url = data['next'] and f"/api/posts/?limit=2&cursor={data['next']}"
+        self.assertEqual(seen, list(Post.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/posts/?cursor=garbage')
+        self.assertEqual(response.status_code, 400)
+
+
+class CounterTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.post = Post.objects.create(user=self.bob, content='hello')
+        self.client.force_authenticate(self.alice)
+
+    def test_like_comment_follow_maintain_counters(self):
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.client.post(f'/api/posts/{self.post.id}/comments/', {'content': 'nice'})
+        self.client.post('/api/follow/bob/')
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (1, 1))
+        self.assertEqual(Profile.objects.get(user=self.bob).followers_count, 1)
+        self.assertEqual(Profile.objects.get(user=self.alice).following_count, 1)
+
+        self.client.delete(f'/api/posts/{self.post.id}/like/')
+        self.client.delete('/api/unfollow/bob/')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+        self.assertEqual(Profile.objects.get(user=self.bob).followers_count, 0)
+
+    def test_like_is_idempotent_and_lean(self):
+        url = f'/api/posts/{self.post.id}/like/'
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url)
+        self.assertEqual(response.data, {'post_id': self.post.id, 'liked': True, 'likes_count': 1})
+        # SAVEPOINT/RELEASE + INSERT + UPDATE
+        self.assertLessEqual(len([q for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]), 2)
+
+        self.assertEqual(self.client.post(url).data['likes_count'], 1)
+        self.assertEqual(self.client.delete(url).data, {'post_id': self.post.id, 'liked': False, 'likes_count': 0})
+        self.assertEqual(self.client.delete(url).data['likes_count'], 0)
+        self.assertEqual(self.client.post('/api/posts/999999/like/').status_code, 404)
+
+    def test_toggle_and_liked_status(self):
+        other = Post.objects.create(user=self.bob, content='other')
+        toggle = f'/api/posts/{self.post.id}/like/toggle/'
+        self.assertTrue(self.client.post(toggle).data['liked'])
+        response = self.client.get(f'/api/likes/status/?ids={self.post.id},{other.id}')
+        self.assertEqual(response.data['liked'], {self.post.id: True, other.id: False})
+
+        self.assertEqual(self.client.post(toggle).data, {'post_id': self.post.id, 'liked': False, 'likes_count': 0})
+        self.assertFalse(Like.objects.exists())
+
+    def test_reconcile_counters_fixes_drift(self):
+        Like.objects.create(user=self.alice, post=self.post)
+        Post.objects.filter(pk=self.post.pk).update(likes_count=42)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+
+class TimelineTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.star = make_user('star')
+        self.client.force_authenticate(self.alice)
+        self.client.post('/api/follow/bob/')
+        self.client.post('/api/follow/star/')
+
+    def _timeline_ids(self):
+        response = self.client.get('/api/timeline/')
+        self.assertEqual(response.status_code, 200)
+        return [post['id'] for post in response.data['results']]
+
+    def _publish(self, user, content):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.post(f'/api/profile/{user.username}/posts/', {'content': content}).data['id']
+
+    def test_fan_out_and_celebrity_pull(self):
+        with self.settings(TIMELINE_FANOUT_LIMIT=0):
+            from_bob = self._publish(self.bob, 'bob')
+            from_star = self._publish(self.star, 'star')
+            self.assertFalse(TimelineEntry.objects.filter(post_id=from_star, user=self.alice).exists())
+            self.assertEqual(self._timeline_ids(), [from_star, from_bob])
+
+    def test_unfollow_removes_author_posts(self):
+        post_id = self._publish(self.bob, 'bob')
+        self.assertEqual(self._timeline_ids(), [post_id])
+        self.client.delete('/api/unfollow/bob/')
+        self.assertEqual(self._timeline_ids(), [])
+
+    def test_backfill_inserts_latest_posts_in_one_statement(self):
+        carol = make_user('carol')
+        Post.objects.bulk_create([Post(user=carol, content=str(i)) for i in range(25)])
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post('/api/follow/carol/')
+        inserts = [q for q in ctx.captured_queries
+                   if q['sql'].startswith('INSERT') and 'api_timelineentry' in q['sql']]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(TimelineEntry.objects.filter(user=self.alice, post__user=carol).count(), 20)
+        self.assertLess(len(ctx.captured_queries), 15)
+
+    def test_in_memory_backend_pages(self):
+        from . import timeline
+        with self.settings(TIMELINE_BACKEND='api.timeline.InMemoryTimelineBackend'):
+            timeline.get_backend.cache_clear()
+            try:
+                ids = [self._publish(self.bob, str(i)) for i in range(3)]
+                first = self.client.get('/api/timeline/?limit=2').data
+                second = self.client.get(f"/api/timeline/?limit=2&cursor={first['next']}").data
+                self.assertEqual([p['id'] for p in first['results'] + second['results']], ids[::-1])
+                self.assertIsNone(second['next'])
+            finally:
+                timeline.get_backend.cache_clear()
+
+
+class SearchIndexTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user('alice_smith')
+        self.post = Post.objects.create(user=self.alice, content='Привет, байланыста!')
+        Post.objects.create(user=self.alice, content='unrelated text')
+
+    def test_ranked_prefix_search(self):
+        response = self.client.get('/api/search/', {'q': 'прив'})
+        self.assertEqual([post['id'] for post in response.data['posts']], [self.post.id])
+        response = self.client.get('/api/search/', {'q': 'smi'})
+        self.assertEqual(len(response.data['users']), 1)
+
+    def test_index_follows_edits_and_deletes(self):
+        self.post.content = 'completely new words'
+        self.post.save()
+        self.assertEqual(self.client.get('/api/search/', {'q': 'привет'}).data['posts'], [])
+        self.assertEqual(len(self.client.get('/api/search/', {'q': 'words'}).data['posts']), 1)
+        self.post.delete()
+        self.assertEqual(self.client.get('/api/search/', {'q': 'words'}).data['posts'], [])
+
+    def test_empty_query_returns_nothing(self):
+        response = self.client.get('/api/search/', {'q': '  '})
+        self.assertEqual(response.data['posts'], [])
+        self.assertIsNone(response.data['next_offset'])
+
+
+class SearchAssemblyTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.viewer = make_user('viewer')
+        self.client.force_authenticate(self.viewer)
+
+    def _seed(self, count):
+        for _ in range(count):
+            author = make_user(f'kazakh{User.objects.count()}')
+            Post.objects.create(user=author, content='kazakh steppe')
+
+    def _search(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/search/', {'q': 'kazakh'})
+        return len(ctx.captured_queries), response.data
+
+    def test_query_count_is_constant(self):
+        self._seed(1)
+        small, _ = self._search()
+        self._seed(10)
+        large, data = self._search()
+        self.assertEqual(small, large)
+        self.assertEqual(len(data['posts']), 11)
+
+    def test_author_profile_is_attached_to_each_post(self):
+        self._seed(3)
+        _, data = self._search()
+        for post in data['posts']:
+            self.assertEqual(post['user_profile']['user']['id'], post['user']['id'])
+        self.assertEqual({u['user']['username'] for u in data['users']},
+                         {p['user']['username'] for p in data['posts']})
+
+
+class CacheTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user('alice')
+        self.post = Post.objects.create(user=self.alice, content='cached')
+        self.client.force_authenticate(self.alice)
+
+    def test_post_detail_is_served_from_cache_with_personal_overlay(self):
+        self.client.get(f'/api/posts/{self.post.id}/')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/posts/{self.post.id}/')
+        # Остаётся только запрос is_liked
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertFalse(response.data['is_liked'])
+
+    def test_like_invalidates_cached_post(self):
+        self.client.get(f'/api/posts/{self.post.id}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(user=self.alice, post=self.post)
+        response = self.client.get(f'/api/posts/{self.post.id}/')
+        self.assertEqual(response.data['likes_count'], 1)
+        self.assertTrue(response.data['is_liked'])
+
+    def test_rename_invalidates_profile(self):
+        self.client.get('/api/profile/alice/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.username = 'alicia'
+            self.alice.save()
+        response = self.client.get('/api/profile/alicia/')
+        self.assertEqual(response.data['user']['username'], 'alicia')
+
+    @override_settings(API_CACHE_SINGLE_PROCESS=False)
+    def test_process_local_cache_is_not_used(self):
+        self.client.get(f'/api/posts/{self.post.id}/')
+        # Правка в другом воркере сбросила бы только его LocMem — кэш должен быть выключен
+        Post.objects.filter(id=self.post.id).update(content='edited elsewhere')
+        response = self.client.get(f'/api/posts/{self.post.id}/')
+        self.assertEqual(response.data['content'], 'edited elsewhere')
+        self.assertEqual(cache.get(api_cache.post_key(self.post.id), version=settings.API_CACHE_VERSION), None)
+
+    def test_stats_are_summed_across_workers(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with self.settings(METRICS_DIR=directory):
+            metrics.reset()
+            self.addCleanup(metrics.reset)
+            self.client.get(f'/api/posts/{self.post.id}/')
+            self.client.get(f'/api/posts/{self.post.id}/')
+            with open(os.path.join(directory, '1.json'), 'w') as f:
+                json.dump({'counters': [['api_cache_hits_total', [], 2]], 'histograms': []}, f)
+            self.alice.is_staff = True
+            stats = self.client.get('/api/cache/stats/').data
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_ratio']), (3, 1, 0.75))
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user('alice')
+        self.post = Post.objects.create(user=self.alice, content='etag me')
+
+    def test_matching_etag_short_circuits_without_queries(self):
+        first = self.client.get('/api/posts/')
+        self.assertIn('ETag', first)
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get('/api/posts/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_new_comment_changes_etag(self):
+        url = f'/api/posts/{self.post.id}/comments/'
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(user=self.alice, post=self.post, content='new')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_if_modified_since_sees_changes_within_the_same_second(self):
+        url = f'/api/posts/{self.post.id}/comments/'
+        with mock.patch('time.time', return_value=1000.3), self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(user=self.alice, post=self.post, content='first')
+        with mock.patch('time.time', return_value=1000.5):
+            # Секунда отметки ещё идёт — Last-Modified пока не выдаём
+            self.assertNotIn('Last-Modified', self.client.get(url))
+        with mock.patch('time.time', return_value=1000.7), self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(user=self.alice, post=self.post, content='second')
+        with mock.patch('time.time', return_value=1002.0):
+            stale = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(1000))
+            self.assertEqual((stale.status_code, stale['Last-Modified']), (200, http_date(1001)))
+            fresh = self.client.get(url, HTTP_IF_MODIFIED_SINCE=stale['Last-Modified'])
+        self.assertEqual(fresh.status_code, 304)
+
+    def _write_comment_on(self, worker):
+        with mock.patch('api.cache.cache', worker), self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(user=self.alice, post=self.post, content='from the other worker')
+
+    def _get_on(self, worker, url, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        with mock.patch('api.cache.cache', worker):
+            return self.client.get(url, **headers)
+
+    @override_settings(API_CACHE_SINGLE_PROCESS=False)
+    def test_process_local_stamps_disable_validators(self):
+        url = f'/api/posts/{self.post.id}/comments/'
+        worker_a, worker_b = LocMemCache('worker-a', {}), LocMemCache('worker-b', {})
+        first = self._get_on(worker_a, url)
+        self.assertNotIn('ETag', first)
+        self._write_comment_on(worker_b)
+        # Без валидаторов воркер A не может ответить 304 на устаревшие данные
+        response = self._get_on(worker_a, url, etag='"stale"')
+        self.assertEqual((response.status_code, len(response.data['results'])), (200, 1))
+
+    def test_shared_stamps_see_writes_from_other_workers(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                              'LOCATION': location}}
+        url = f'/api/posts/{self.post.id}/comments/'
+        worker_a, worker_b = FileBasedCache(location, {}), FileBasedCache(location, {})
+        with self.settings(CACHES=shared, API_CACHE_SINGLE_PROCESS=False):
+            etag = self._get_on(worker_a, url)['ETag']
+            self._write_comment_on(worker_b)
+            response = self._get_on(worker_a, url, etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class NotificationQueueTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.post = Post.objects.create(user=self.bob, content='hello')
+        self.client.force_authenticate(self.alice)
+
+    def test_local_queue_coalesces_like_unlike(self):
+        local = notifications.LocalNotificationQueue(autostart=False)
+        with mock.patch.object(notifications, 'get_queue', return_value=local):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(f'/api/posts/{self.post.id}/like/')
+                self.client.delete(f'/api/posts/{self.post.id}/like/')
+                self.client.post(f'/api/posts/{self.post.id}/like/')
+                self.client.delete(f'/api/posts/{self.post.id}/like/')
+                self.client.post('/api/follow/bob/')
+            self.assertEqual(Notification.objects.count(), 0)
+            local.flush()
+        self.assertEqual(list(Notification.objects.values_list('message', flat=True)), [' подписался на вас'])
+
+    def test_outbox_is_drained_by_worker_command(self):
+        with mock.patch.object(notifications, 'get_queue', return_value=notifications.OutboxNotificationQueue()):
+            self.client.post(f'/api/posts/{self.post.id}/like/')
+            self.client.post(f'/api/posts/{self.post.id}/comments/', {'content': 'hi'})
+        self.assertEqual(NotificationOutbox.objects.count(), 2)
+        call_command('process_notifications', '--once', stdout=StringIO())
+        self.assertEqual(NotificationOutbox.objects.count(), 0)
+        self.assertEqual(Notification.objects.filter(recipient=self.bob, sender=self.alice).count(), 2)
+
+
+class NotificationReadTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.client.force_authenticate(self.alice)
+        self.created = notifications.deliver([
+            notifications.Event(notifications.FOLLOW, self.bob.id, self.alice.id),
+            notifications.Event(notifications.LIKE, self.bob.id, self.alice.id),
+            notifications.Event(notifications.COMMENT, self.bob.id, self.alice.id),
+        ])
+
+    def _unread(self):
+        return self.client.get('/api/notifications/unread-count/').data['unread_count']
+
+    def test_listing_is_paginated_and_read_only(self):
+        page = self.client.get('/api/notifications/?limit=2').data
+        self.assertEqual(len(page['results']), 2)
+        self.assertEqual(page['results'][0]['sender_username'], 'bob')
+        rest = self.client.get(f"/api/notifications/?limit=2&cursor={page['next']}").data
+        self.assertEqual(len(rest['results']), 1)
+        self.assertEqual(self._unread(), 3)
+
+    def test_mark_read_up_to_id(self):
+        response = self.client.post('/api/notifications/mark-read/', {'up_to': self.created[1].id})
+        self.assertEqual(response.data['marked'], 2)
+        self.assertEqual(self._unread(), 1)
+        self.assertEqual(self.client.post('/api/notifications/mark-read/').data['marked'], 1)
+        self.assertEqual(self.client.post('/api/notifications/mark-read/').data['marked'], 0)
+        self.assertEqual(self._unread(), 0)
+
+
+class RealtimeHubTests(APITestCase):
+    def test_published_notification_reaches_subscriber(self):
+        hub = realtime.LocalHub()
+
+        async def scenario():
+            async with hub.subscribe(7) as queue:
+                threading.Thread(target=hub.publish, args=(7, {'id': 1})).start()
+                return await asyncio.wait_for(queue.get(), timeout=1)
+
+        self.assertEqual(asyncio.run(scenario()), {'id': 1})
+        self.assertEqual(hub.subscriber_count(), 0)
+
+    def test_stream_requires_token(self):
+        response = self.client.get('/api/notifications/stream/')
+        self.assertEqual(response.status_code, 401)
+
+    async def test_stream_authenticates_under_asgi_with_cold_cache(self):
+        alice = await sync_to_async(make_user)('alice')
+        refresh = await sync_to_async(UsernameTokenObtainPairSerializer.get_token)(alice)
+        token = refresh.access_token
+        # Состояние пользователя не в кэше — его придётся прочитать из базы
+        cache.clear()
+        response = await AsyncClient().get(f'/api/notifications/stream/?token={token}')
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'text/event-stream'))
+
+    async def test_reconnect_replays_missed_events_once(self):
+        alice, bob = await sync_to_async(make_user)('alice'), await sync_to_async(make_user)('bob')
+        created = await sync_to_async(notifications.deliver)([
+            notifications.Event(kind, bob.id, alice.id)
+            for kind in (notifications.FOLLOW, notifications.LIKE, notifications.COMMENT)])
+        ids = [notification.id for notification in created]
+        fetch, hub = views._missed_notifications, realtime.get_hub()
+
+        def fetch_during_live_traffic(user_id, last_id):
+            missed = fetch(user_id, last_id)
+            # Пока шла выборка, пришли живые события: последнее уже в выборке,
+            # а их больше, чем помещается в очередь подписчика
+            for i in range(realtime.SUBSCRIBER_QUEUE_SIZE + 5):
+                hub.publish(user_id, {'id': ids[-1] + i})
+            return missed
+
+        events = views.stream_events(alice.id, str(ids[0]))
+        try:
+            with mock.patch.object(views, '_missed_notifications', fetch_during_live_traffic):
+                chunks = [await asyncio.wait_for(anext(events), timeout=1) for _ in range(4)]
+        finally:
+            await events.aclose()
+        self.assertEqual(chunks[0], 'retry: 5000\n\n')
+        self.assertEqual([int(chunk.split('\n')[0][4:]) for chunk in chunks[1:]], [ids[1], ids[2], ids[2] + 1])
+
+
+class QueryPlanTests(APITestCase):
+    """
+    Прогоняет горячие эндпоинты и проверяет EXPLAIN QUERY PLAN каждого
+    SELECT: полный проход по таблице или сортировка во временном B-дереве
+    означают, что под запрос нет подходящего индекса. Исключение — первая
+    страница по первичному ключу (без WHERE, с LIMIT): это проход по rowid,
+    который останавливается на LIMIT.
+    """
+    BAD_PLAN = re.compile(r'^SCAN \w+$|USE TEMP B-TREE FOR ORDER BY')
+    BOUNDED_WALK = re.compile(r'^SELECT (?:(?!\bWHERE\b).)* LIMIT \d+$', re.S)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = make_user('alice')
+        cls.bob = make_user('bob')
+        Follow.objects.create(follower=cls.alice, following=cls.bob)
+        for i in range(30):
+            post = Post.objects.create(user=cls.bob if i % 2 else cls.alice, content=f'seed post {i}')
+            Comment.objects.create(user=cls.alice, post=post, content='seed comment')
+            Like.objects.create(user=cls.alice, post=post)
+        cls.post = post
+        notifications.deliver([notifications.Event(notifications.FOLLOW, cls.bob.id, cls.alice.id)])
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.alice)
+
+    def assertIndexedPlans(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        selects = [q['sql'] for q in ctx.captured_queries if q['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertTrue(selects, url)
+        with connection.cursor() as cursor:
+            for sql in selects:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                details = [row[-1] for row in cursor.fetchall()]
+                # Проход по результату подзапроса (co-routine) — не проход по таблице
+                coroutines = {d.split(' ', 1)[1] for d in details if d.startswith('CO-ROUTINE ')}
+                bad = [detail for detail in details if self.BAD_PLAN.search(detail)
+                       and detail[5:] not in coroutines
+                       and not (detail.startswith('SCAN') and self.BOUNDED_WALK.match(sql))]
+                self.assertFalse(bad, f'{url}: {sql}\n' + '\n'.join(details))
+
+    def test_hot_endpoints_use_indexes(self):
+        cursor = self.client.get('/api/posts/?limit=5').data['next']
+        urls = [
+            '/api/posts/',
+            f'/api/posts/?limit=5&cursor={cursor}',
+            '/api/timeline/',
+            '/api/profile/bob/',
+            '/api/profile/bob/posts/',
+            f'/api/posts/{self.post.id}/',
+            f'/api/posts/{self.post.id}/comments/',
+            '/api/notifications/',
+            '/api/notifications/unread-count/',
+            '/api/search/?q=seed',
+            '/api/profile/bob/followers/',
+            '/api/profile/alice/following/',
+            '/api/following-status/?usernames=bob,alice',
+            '/api/users/',
+            '/api/posts/?comments_preview=3',
+            f'/api/posts/{self.post.id}/comments/?limit=5',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                self.assertIndexedPlans(url)
+
+
+class FollowGraphTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user('alice')
+        self.others = [make_user(f'user{i}') for i in range(5)]
+        for other in self.others[:3]:
+            Follow.objects.create(follower=self.alice, following=other)
+        Follow.objects.create(follower=self.others[4], following=self.alice)
+        self.client.force_authenticate(self.alice)
+
+    def test_batch_status_in_one_query(self):
+        names = ','.join(user.username for user in self.others)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/following-status/?usernames={names}')
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(response.data['following'],
+                         {'user0': True, 'user1': True, 'user2': True, 'user3': False, 'user4': False})
+
+    def test_batch_status_rejects_mixed_usernames_and_ids(self):
+        response = self.client.get(f'/api/following-status/?usernames=user0&ids={self.others[1].id}')
+        self.assertEqual(response.status_code, 400)
+
+    def test_following_list_is_paginated(self):
+        first = self.client.get('/api/profile/alice/following/?limit=2').data
+        rest = self.client.get(f"/api/profile/alice/following/?limit=2&cursor={first['next']}").data
+        names = [p['user']['username'] for p in first['results'] + rest['results']]
+        self.assertEqual(names, ['user2', 'user1', 'user0'])
+        followers = self.client.get('/api/profile/alice/followers/').data['results']
+        self.assertEqual([(p['user']['username'], p['is_following']) for p in followers], [('user4', False)])
+
+    def test_profile_includes_follow_status(self):
+        self.assertTrue(self.client.get('/api/profile/user0/').data['is_following'])
+        self.assertFalse(self.client.get('/api/profile/user3/').data['is_following'])
+
+
+class UserDirectoryTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user('alice')
+        self.users = [make_user(f'user{i}') for i in range(6)]
+        Follow.objects.create(follower=self.alice, following=self.users[0])
+        self.client.force_authenticate(self.alice)
+
+    def test_lookup_uses_constant_queries(self):
+        def lookup(names):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post('/api/users/lookup/', {'usernames': names}, format='json')
+            return len(ctx.captured_queries), response.data['results']
+
+        small, _ = lookup(['user0'])
+        large, results = lookup([user.username for user in self.users])
+        self.assertEqual(small, large)
+        by_name = {row['username']: row for row in results}
+        self.assertTrue(by_name['user0']['is_following'])
+        self.assertEqual(by_name['user0']['followers_count'], 1)
+        self.assertFalse(by_name['user5']['is_following'])
+
+    def test_profile_list_is_paginated(self):
+        first = self.client.get('/api/users/?limit=4').data
+        rest = self.client.get(f"/api/users/?limit=4&cursor={first['next']}").data
+        self.assertEqual(len(first['results']) + len(rest['results']), 7)
+        self.assertIsNone(rest['next'])
+
+
+class CommentThreadTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user('alice')
+        self.posts = [Post.objects.create(user=self.alice, content=str(i)) for i in range(3)]
+
+    def _comment(self, post, count):
+        for i in range(count):
+            Comment.objects.create(user=make_user(f'c{Comment.objects.count()}'), post=post, content=f'#{i}')
+
+    def _get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        return len(ctx.captured_queries), response.data
+
+    def test_thread_pages_in_order_with_constant_queries(self):
+        post = self.posts[0]
+        self._comment(post, 2)
+        small, _ = self._get(f'/api/posts/{post.id}/comments/')
+        self._comment(post, 10)
+        large, page = self._get(f'/api/posts/{post.id}/comments/?limit=5')
+        self.assertEqual(small, large)
+        _, rest = self._get(f"/api/posts/{post.id}/comments/?limit=20&cursor={page['next']}")
+        contents = [c['content'] for c in page['results'] + rest['results']]
+        self.assertEqual(contents, ['#0', '#1'] + [f'#{i}' for i in range(10)])
+
+    def test_feed_embeds_first_comments(self):
+        self._comment(self.posts[0], 4)
+        self._comment(self.posts[2], 1)
+        queries_without, _ = self._get('/api/posts/')
+        queries_with, data = self._get('/api/posts/?comments_preview=2')
+        self.assertEqual(queries_with, queries_without + 1)
+        previews = {post['id']: [c['content'] for c in post['comments_preview']] for post in data['results']}
+        self.assertEqual(previews, {self.posts[0].id: ['#0', '#1'], self.posts[1].id: [], self.posts[2].id: ['#0']})
+
+
+class BatchWriteTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.posts = [Post.objects.create(user=self.bob, content=str(i)) for i in range(12)]
+        self.client.force_authenticate(self.alice)
+
+    def _batch(self, operations):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/batch/', {'operations': operations}, format='json')
+        return len(ctx.captured_queries), response
+
+    def test_mixed_operations_keep_counters_and_report_per_op(self):
+        post = self.posts[0]
+        _, response = self._batch([
+            {'op': 'create_post', 'content': 'offline'},
+            {'op': 'like', 'post_id': post.id},
+            {'op': 'comment', 'post_id': post.id, 'content': 'nice'},
+            {'op': 'follow', 'username': 'bob'},
+            {'op': 'like', 'post_id': 999999},
+            {'op': 'comment', 'post_id': post.id},
+            {'op': 'follow', 'username': 'alice'},
+        ])
+        statuses = [result['status'] for result in response.data['results']]
+        self.assertEqual(statuses, [201, 200, 201, 201, 404, 400, 400])
+        self.assertEqual(response.data['results'][1]['likes_count'], 1)
+
+        post.refresh_from_db()
+        self.assertEqual((post.likes_count, post.comments_count), (1, 1))
+        self.assertTrue(Post.objects.filter(user=self.alice, content='offline').exists())
+        self.assertEqual(Profile.objects.get(user=self.bob).followers_count, 1)
+        self.assertEqual(Profile.objects.get(user=self.alice).following_count, 1)
+
+    def test_like_then_unlike_nets_out(self):
+        Like.objects.create(user=self.alice, post=self.posts[1])
+        _, response = self._batch([
+            {'op': 'like', 'post_id': self.posts[0].id},
+            {'op': 'unlike', 'post_id': self.posts[0].id},
+            {'op': 'unlike', 'post_id': self.posts[1].id},
+        ])
+        # Счётчик после каждой операции, а не итог пакета
+        self.assertEqual([r['likes_count'] for r in response.data['results']], [1, 0, 0])
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual(sum(Post.objects.values_list('likes_count', flat=True)), 0)
+
+    def test_query_count_does_not_grow_with_batch(self):
+        small, _ = self._batch([{'op': 'like', 'post_id': self.posts[0].id},
+                                {'op': 'comment', 'post_id': self.posts[0].id, 'content': 'x'}])
+        operations = []
+        for post in self.posts[1:]:
+            operations += [{'op': 'like', 'post_id': post.id}, {'op': 'comment', 'post_id': post.id, 'content': 'x'}]
+        large, _ = self._batch(operations)
+        self.assertEqual(small, large)
+        self.assertEqual(Like.objects.count(), len(self.posts))
+
+    def test_query_count_does_not_grow_with_posts_and_follows(self):
+        # Outbox пишет уведомления в ту же транзакцию — их вставки тоже считаются
+        with self.settings(NOTIFICATION_QUEUE='api.notifications.OutboxNotificationQueue'):
+            notifications.get_queue.cache_clear()
+            self.addCleanup(notifications.get_queue.cache_clear)
+            authors = [make_user(f'author{i}') for i in range(10)]
+            for author in authors:
+                Post.objects.bulk_create([Post(user=author, content=str(i)) for i in range(3)])
+            Follow.objects.create(follower=self.bob, following=self.alice)
+
+            small, _ = self._batch([{'op': 'create_post', 'content': 'one'},
+                                    {'op': 'follow', 'username': 'author0'}])
+            large, response = self._batch(
+                [{'op': 'create_post', 'content': str(i)} for i in range(10)]
+                + [{'op': 'follow', 'username': author.username} for author in authors[1:]])
+        self.assertEqual(small, large)
+        self.assertEqual({r['status'] for r in response.data['results']}, {201})
+        self.assertEqual(TimelineEntry.objects.filter(user=self.bob, post__user=self.alice).count(), 11)
+        self.assertEqual(TimelineEntry.objects.filter(user=self.alice, post__user__in=authors).count(), 30)
+        self.assertEqual(NotificationOutbox.objects.filter(kind=notifications.FOLLOW).count(), 10)
+
+
+class ImmediateExecutor:
+    """Выполняет задачу сразу в том же потоке и соединении с БД."""
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class AvatarUploadTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user('alice')
+        self.client.force_authenticate(self.alice)
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        overrides = self.settings(AVATAR_STORAGE='utils.s3.FileSystemStorage', LOCAL_STORAGE_ROOT=self.root,
+                                  AVATAR_PROCESS_WORKERS=0)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        for getter in (s3.get_storage, images.get_pool):
+            getter.cache_clear()
+            self.addCleanup(getter.cache_clear)
+
+    def _image(self, mode='RGBA', size=(640, 480), fmt='PNG', **save_options):
+        out = BytesIO()
+        Image.new(mode, size, 'red').save(out, fmt, **save_options)
+        return out.getvalue()
+
+    def _path(self, url):
+        return os.path.join(self.root, url[len('/media/'):])
+
+    def _upload(self, data, name='me.png'):
+        avatar = SimpleUploadedFile(name, data, content_type='image/png')
+        return self.client.put('/api/profile/alice/', {'avatar': avatar}, format='multipart')
+
+    def test_upload_produces_resized_variants(self):
+        response = self._upload(self._image())
+        self.assertFalse(response.data['avatar_pending'])
+        variants = response.data['avatar_variants']
+        self.assertEqual(set(variants), set(images.SIZES))
+        self.assertEqual(response.data['avatar_url'], variants['large']['jpg'])
+
+        path = os.path.join(self.root, variants['small']['webp'][len('/media/'):])
+        with Image.open(path) as small:
+            self.assertEqual((small.format, small.size), ('WEBP', (40, 40)))
+
+    def test_new_avatar_removes_previous_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self._upload(self._image()).data['avatar_variants']
+        with self.captureOnCommitCallbacks(execute=True):
+            second = self._upload(self._image()).data['avatar_variants']
+        self.assertFalse(any(os.path.exists(self._path(url)) for formats in first.values() for url in formats.values()))
+        self.assertTrue(all(os.path.exists(self._path(url)) for formats in second.values() for url in formats.values()))
+
+    def test_metadata_is_stripped(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # повёрнуто на 90°
+        exif[0x010F] = 'SecretCam'
+        data = self._image('RGB', (200, 100), 'JPEG', exif=exif)
+        variants = images.render_variants(data)
+        with Image.open(BytesIO(variants['large', 'jpg'][0])) as large:
+            self.assertEqual(dict(large.getexif()), {})
+
+    def test_garbage_is_rejected(self):
+        response = self._upload(b'x' * 3000)
+        self.assertEqual(response.status_code, 400)
+        self.assertIsNone(Profile.objects.get(user=self.alice).avatar_url)
+
+    def test_background_processing_returns_pending(self):
+        with self.settings(S3_UPLOAD_ASYNC=True), \
+                mock.patch.object(s3, 'get_executor', return_value=ImmediateExecutor()), \
+                mock.patch.object(avatars, '_process_in_background', avatars.process_avatar):
+            response = self._upload(self._image())
+        self.assertTrue(response.data['avatar_pending'])
+        profile = Profile.objects.get(user=self.alice)
+        self.assertEqual(profile.avatar_url, profile.avatar_variants['large']['jpg'])
+
+    def _direct_upload(self, data, name='upload.jpg'):
+        key = avatars.upload_prefix('alice') + name
+        s3.get_storage().save(BytesIO(data), key)
+        return key
+
+    def _complete(self, key):
+        with mock.patch.object(s3, 'get_executor', return_value=ImmediateExecutor()), \
+                mock.patch.object(avatars, '_process_upload_in_background', avatars.process_upload):
+            return self.client.post('/api/avatar/complete/', {'key': key}, format='json')
+
+    def test_direct_upload_is_processed_before_publishing(self):
+        exif = Image.Exif()
+        exif[0x8825] = {1: 'N', 2: (55.0, 45.0, 0.0)}  # GPSInfo
+        key = self._direct_upload(self._image('RGB', (300, 200), 'JPEG', exif=exif))
+        response = self._complete(key)
+        self.assertEqual((response.status_code, response.data), (202, {'avatar_pending': True}))
+        variants = Profile.objects.get(user=self.alice).avatar_variants
+        self.assertEqual(set(variants), set(images.SIZES))
+        self.assertEqual(Profile.objects.get(user=self.alice).avatar_url, variants['large']['jpg'])
+        self.assertIsNone(s3.get_storage().head(key))
+
+        path = os.path.join(self.root, variants['large']['jpg'][len('/media/'):])
+        with Image.open(path) as large:
+            self.assertEqual((large.size, dict(large.getexif())), ((256, 256), {}))
+
+    def test_direct_upload_of_garbage_is_rejected_and_removed(self):
+        key = self._direct_upload(b'x' * 3000)
+        with self.assertLogs('api.views', 'ERROR'):
+            response = self._complete(key)
+        self.assertEqual(response.status_code, 202)
+        self.assertIsNone(Profile.objects.get(user=self.alice).avatar_url)
+        self.assertIsNone(s3.get_storage().head(key))
+
+    def test_sweep_removes_only_abandoned_uploads(self):
+        abandoned, fresh = self._direct_upload(b'old', 'old.jpg'), self._direct_upload(b'new', 'new.jpg')
+        day_ago = time.time() - avatars.ORPHAN_UPLOAD_AGE - 60
+        os.utime(os.path.join(self.root, abandoned), (day_ago, day_ago))
+        self._upload(self._image())
+        out = StringIO()
+        call_command('sweep_uploads', stdout=out)
+        self.assertIn('1 orphaned upload(s) removed', out.getvalue())
+        storage = s3.get_storage()
+        self.assertEqual((storage.head(abandoned), storage.head(fresh)['size']), (None, 3))
+        self.assertIsNotNone(Profile.objects.get(user=self.alice).avatar_url)
+
+    def test_local_storage_has_no_presigned_uploads(self):
+        response = self.client.post('/api/avatar/upload/', {'content_type': 'image/png'}, format='json')
+        self.assertEqual(response.status_code, 501)
+
+    def test_variants_render_in_process_pool(self):
+        with self.settings(AVATAR_PROCESS_WORKERS=1):
+            images.get_pool.cache_clear()
+            try:
+                variants = images.render_in_pool(self._image())
+            finally:
+                images.get_pool().shutdown()
+        self.assertEqual(len(variants), len(images.SIZES) * len(images.FORMATS))
+
+    def test_s3_client_is_shared(self):
+        s3.get_client.cache_clear()
+        self.assertIs(s3.S3Storage('bucket').client, s3.S3Storage('bucket').client)
+
+
+class DirectUploadTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user('alice')
+        self.client.force_authenticate(self.alice)
+        overrides = self.settings(AVATAR_STORAGE='utils.s3.S3Storage', AWS_BUCKET_NAME='avatars-test',
+                                  AWS_REGION='us-east-1', AWS_ACCESS_KEY_ID='test', AWS_SECRET_ACCESS_KEY='test')
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        for getter in (s3.get_client, s3.get_storage):
+            getter.cache_clear()
+            self.addCleanup(getter.cache_clear)
+        self.stub = Stubber(s3.get_storage().client)
+        self.stub.activate()
+        self.addCleanup(self.stub.deactivate)
+
+    def _presign(self, **data):
+        return self.client.post('/api/avatar/upload/', dict({'content_type': 'image/png'}, **data), format='json')
+
+    def test_presigned_post_is_scoped_to_user_folder(self):
+        response = self._presign()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['method'], 'POST')
+        self.assertTrue(response.data['key'].startswith('uploads/avatars/alice/'))
+        self.assertEqual(response.data['fields']['key'], response.data['key'])
+        put = self._presign(method='put').data
+        self.assertIn('X-Amz-Expires=300', put['url'])
+        # Сырой файл с EXIF/GPS не должен быть публичным ни минуты
+        self.assertNotIn('acl', response.data['fields'])
+        self.assertNotIn('acl', base64.b64decode(response.data['fields']['policy']).decode())
+        self.assertNotIn('x-amz-acl', put['headers'])
+        self.assertNotIn('x-amz-acl', put['url'])
+        self.assertEqual(self._presign(content_type='text/html').status_code, 400)
+
+    def test_complete_only_checks_head_in_request(self):
+        key = self._presign().data['key']
+        self.stub.add_response('head_object', {'ContentLength': 2048, 'ContentType': 'image/png'},
+                               {'Bucket': 'avatars-test', 'Key': key})
+        executor = mock.Mock()
+        with mock.patch.object(s3, 'get_executor', return_value=executor):
+            response = self.client.post('/api/avatar/complete/', {'key': key}, format='json')
+        # Скачивание и нарезка — в фоне; в потоке запроса только HEAD
+        self.stub.assert_no_pending_responses()
+        self.assertEqual((response.status_code, response.data), (202, {'avatar_pending': True}))
+        executor.submit.assert_called_once_with(avatars._process_upload_in_background, self.alice.id, 'alice', key)
+
+    def test_background_processing_rejects_non_images(self):
+        key = self._presign().data['key']
+        params = {'Bucket': 'avatars-test', 'Key': key}
+        self.stub.add_response('get_object', {'Body': StreamingBody(BytesIO(b'x' * 2048), 2048)}, params)
+        self.stub.add_response('delete_object', {}, params)
+        with self.assertRaises(images.InvalidImage):
+            avatars.process_upload(self.alice.id, 'alice', key)
+        self.stub.assert_no_pending_responses()
+        self.assertIsNone(Profile.objects.get(user=self.alice).avatar_url)
+
+    def test_complete_rejects_foreign_or_missing_objects(self):
+        foreign = self.client.post('/api/avatar/complete/', {'key': 'uploads/avatars/bob/x.png'}, format='json')
+        self.assertEqual(foreign.status_code, 400)
+
+        key = self._presign().data['key']
+        self.stub.add_client_error('head_object', service_error_code='404', http_status_code=404)
+        missing = self.client.post('/api/avatar/complete/', {'key': key}, format='json')
+        self.assertEqual(missing.status_code, 400)
+        self.assertIsNone(Profile.objects.get(user=self.alice).avatar_url)
+
+
+class StatelessAuthTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user('alice')
+        self.refresh = UsernameTokenObtainPairSerializer.get_token(self.alice)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+
+    def _get(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/notifications/unread-count/')
+        return response, [q['sql'] for q in ctx.captured_queries if 'auth_user' in q['sql']]
+
+    def test_user_is_not_loaded_per_request(self):
+        self.assertEqual(self.refresh.access_token['username'], 'alice')
+        _, first = self._get()
+        response, second = self._get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((len(first), second), (1, []))
+
+    def test_lazy_user_loads_extra_fields_on_demand(self):
+        user = authentication.StatelessJWTAuthentication().get_user(self.refresh.access_token)
+        self.assertEqual(user, self.alice)
+        self.assertEqual((user.is_active, user.is_staff), (True, False))
+        self.assertIn('email', user.get_deferred_fields())
+        self.assertEqual(user.email, 'alice@example.com')
+
+    def test_deactivation_and_rename_apply_without_new_token(self):
+        self._get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.username = 'alice2'
+            self.alice.save()
+        user = authentication.StatelessJWTAuthentication().get_user(self.refresh.access_token)
+        self.assertEqual(user.username, 'alice2')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.is_active = False
+            self.alice.save()
+        self.assertEqual(self._get()[0].status_code, 401)
+
+    def test_logout_revokes_access_token(self):
+        response = self.client.post('/api/auth/logout/', {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, 205)
+        self.assertEqual(self._get()[0].status_code, 401)
+
+    @override_settings(API_CACHE_SINGLE_PROCESS=False)
+    def test_process_local_cache_falls_back_to_database(self):
+        self.assertEqual(self._get()[0].status_code, 200)
+        # Деактивация в другом воркере: ни сигнала, ни сброса в нашем кэше
+        User.objects.filter(id=self.alice.id).update(is_active=False)
+        self.assertEqual(self._get()[0].status_code, 401)
+
+    @override_settings(API_CACHE_SINGLE_PROCESS=False)
+    def test_process_local_cache_revokes_through_blacklist(self):
+        response = self.client.post('/api/auth/logout/', {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, 205)
+        cache.clear()  # другой воркер с пустым кэшем
+        self.assertEqual(self._get()[0].status_code, 401)
+
+
+class SqliteTuningTests(TestCase):
+    def test_pragmas_are_applied_on_connect(self):
+        if connection.vendor != 'sqlite' or not settings.SQLITE_TUNING:
+            self.skipTest('SQLite tuning is disabled')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_TUNED_OPTIONS['timeout'] * 1000)
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def test_reads_go_to_replicas_unless_pinned(self):
+        router = routers.ReplicaRouter()
+        with self.settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(router.db_for_read(Post), 'default')
+        with self.settings(DATABASE_REPLICAS=['replica1']):
+            self.assertEqual(router.db_for_read(Post), 'replica1')
+            self.assertEqual(router.db_for_write(Post), 'default')
+            with routers.use_primary():
+                self.assertEqual(router.db_for_read(Post), 'default')
+            self.assertEqual(router.db_for_read(Post), 'replica1')
+            self.assertFalse(router.allow_migrate('replica1', 'api'))
+
+    def test_refresh_copies_primary_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        primary, replica = os.path.join(directory, 'primary.sqlite3'), os.path.join(directory, 'replica.sqlite3')
+        with closing(sqlite3.connect(primary)) as db:
+            db.executescript('CREATE TABLE t (x); INSERT INTO t VALUES (42);')
+        RefreshReplicasCommand.copy(primary, replica)
+        with closing(sqlite3.connect(replica)) as db:
+            self.assertEqual(db.execute('SELECT x FROM t').fetchall(), [(42,)])
+
+
+class ReadYourWritesTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user('alice')
+        self.post = Post.objects.create(user=self.alice, content='hi')
+        self.access = UsernameTokenObtainPairSerializer.get_token(self.alice).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+
+    def _pinned_after_auth(self):
+        token = routers.pin_primary(False)
+        try:
+            authentication.StatelessJWTAuthentication().get_user(self.access)
+            return routers.is_pinned()
+        finally:
+            routers.reset(token)
+
+    def test_writer_reads_from_primary_for_a_while(self):
+        with self.settings(DATABASE_REPLICAS=['replica1']):
+            self.client.get('/api/posts/')
+            self.assertFalse(self._pinned_after_auth())
+            self.client.post(f'/api/posts/{self.post.id}/like/')
+            self.assertTrue(self._pinned_after_auth())
+            self.assertFalse(routers.is_pinned())
+
+    def test_replicas_require_a_shared_cache(self):
+        with self.settings(DATABASE_REPLICAS=['replica1'], API_CACHE_SINGLE_PROCESS=False):
+            with self.assertRaises(ImproperlyConfigured):
+                ReadYourWritesMiddleware(lambda request: None)
+        with self.settings(DATABASE_REPLICAS=[], API_CACHE_SINGLE_PROCESS=False):
+            ReadYourWritesMiddleware(lambda request: None)
+
+
+class BenchmarkTests(APITestCase):
+    def test_seed_data_leaves_consistent_counters(self):
+        call_command('seed_data', users=20, posts=100, comments=50, likes=200, follows=60,
+                     notifications=30, seed=1, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 100)
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertNotRegex(out.getvalue(), r'[1-9]\d* fixed')
+        # Автор видит свои посты в ленте
+        post = Post.objects.first()
+        self.assertTrue(TimelineEntry.objects.filter(user_id=post.user_id, post=post).exists())
+
+    def test_benchmark_flags_query_regressions(self):
+        call_command('seed_data', users=10, posts=20, comments=10, likes=20, follows=20,
+                     notifications=5, seed=1, stdout=StringIO())
+        path = os.path.join(tempfile.mkdtemp(), 'baseline.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        routes = ['--route', 'timeline', '--route', 'post-detail']
+        call_command('benchmark_api', *routes, iterations=2, warmup=0, save=path, stdout=StringIO())
+        with open(path) as f:
+            baseline = json.load(f)
+        self.assertEqual(baseline['GET timeline']['errors'], 0)
+        self.assertGreater(baseline['GET timeline']['queries'], 0)
+
+        baseline['GET timeline']['queries'] -= 1
+        with open(path, 'w') as f:
+            json.dump(baseline, f)
+        with self.assertRaisesMessage(CommandError, 'GET timeline'):
+            call_command('benchmark_api', *routes, iterations=2, warmup=0, compare=path, stdout=StringIO())
+        # Временный пользователь удаляется, в том числе после упавшего сравнения
+        self.assertFalse(User.objects.filter(username__startswith='bench_').exists())
+
+    def test_benchmark_refuses_main_database(self):
+        main = settings.BASE_DIR / 'db.sqlite3'
+        with mock.patch.dict(settings.DATABASES['default'], NAME=main), \
+                self.assertRaisesMessage(CommandError, 'SQLITE_PATH'):
+            call_command('benchmark_api', route=['timeline'], iterations=1, warmup=0, stdout=StringIO())
+        self.assertFalse(User.objects.filter(username__startswith='bench_').exists())
+
+
+class MetricsTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        overrides = self.settings(METRICS_DIR=self.directory)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.alice = make_user('alice')
+        for i in range(12):
+            Post.objects.create(user=self.alice, content=f'post {i}')
+
+    def test_endpoint_exposes_route_histograms_and_cache_stats(self):
+        self.client.get('/api/posts/')
+        body = self.client.get('/api/metrics/').content.decode()
+        labels = 'route="api/posts/",method="GET"'
+        self.assertIn(f'api_requests_total{{{labels},status="2xx"}} 1', body)
+        self.assertIn(f'api_request_duration_seconds_count{{{labels}}} 1', body)
+        self.assertIn(f'api_db_queries_bucket{{{labels},le="+Inf"}} 1', body)
+        self.assertIn(f'api_render_duration_seconds_count{{{labels}}} 1', body)
+        self.assertIn('api_cache_hit_ratio', body)
+
+    def test_repeated_queries_raise_an_alarm(self):
+        with self.settings(METRICS_REPEATED_QUERY_ALARM=10), self.assertLogs('api.metrics', 'WARNING') as logs:
+            self.client.get('/api/profile/alice/posts/')
+        self.assertIn('Possible N+1 on GET api/profile/<str:username>/posts/', logs.output[0])
+        self.assertIn('api_repeated_query_alarms_total{route="api/profile/<str:username>/posts/"',
+                      metrics.render())
+
+    def test_unsampled_requests_are_only_counted(self):
+        with self.settings(METRICS_SAMPLE_RATE=0):
+            self.client.get('/api/posts/')
+        body = metrics.render()
+        self.assertIn('api_requests_total{route="api/posts/",method="GET",status="2xx"} 1', body)
+        self.assertNotIn('api_request_duration_seconds_count{route="api/posts/"', body)
+
+    def test_scrape_sums_all_workers(self):
+        self.client.get('/api/posts/')
+        labels = (('route', 'api/posts/'), ('method', 'GET'))
+        # Снимок другого воркера: его запросы должны войти в ответ любого воркера
+        with open(os.path.join(self.directory, '1.json'), 'w') as f:
+            json.dump({'counters': [['api_requests_total', labels + (('status', '2xx'),), 4]],
+                       'histograms': [['api_db_queries', labels, [4] * len(metrics.QUERY_BUCKETS) + [9.0, 4]]]}, f)
+        body = self.client.get('/api/metrics/').content.decode()
+        self.assertIn('api_requests_total{route="api/posts/",method="GET",status="2xx"} 5', body)
+        self.assertIn('api_db_queries_count{route="api/posts/",method="GET"} 5', body)
+
+    def test_restarted_worker_with_same_pid_keeps_counters(self):
+        self.client.get('/api/posts/')
+        metrics.flush(force=True)
+        # Новый процесс с тем же pid начинает с пустых счётчиков
+        with mock.patch.object(metrics, '_counters', Counter()), \
+                mock.patch.object(metrics, '_histograms', {}), mock.patch.object(metrics, '_adopted', set()):
+            self.client.get('/api/posts/')
+            body = metrics.render()
+        self.assertIn('api_requests_total{route="api/posts/",method="GET",status="2xx"} 2', body)
+
+    def test_token_protects_endpoint(self):
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/api/metrics/').status_code, 401)
+            response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+
+class ProfilingTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        overrides = self.settings(PROFILING_DIR=self.directory, PROFILING_INTERVAL=0.001)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.alice = make_user('alice')
+        Post.objects.create(user=self.alice, content='hi')
+
+    def authenticate(self, user):
+        access = UsernameTokenObtainPairSerializer.get_token(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_signed_header_stores_profile_with_sql_timeline(self):
+        response = self.client.get('/api/posts/', HTTP_X_PROFILE=profiling.sign())
+        profile_id = response['X-Profile-Id']
+        self.assertTrue(os.path.exists(os.path.join(self.directory, profile_id + '.folded')))
+        [profile] = profiling.load()
+        self.assertEqual(profile['id'], profile_id)
+        self.assertEqual((profile['method'], profile['route'], profile['trigger']), ('GET', 'api/posts/', 'header'))
+        self.assertIn('api_post', profile['queries'][0]['sql'])
+
+    def test_unsigned_requests_are_not_profiled(self):
+        self.assertFalse(self.client.get('/api/posts/', HTTP_X_PROFILE='forged').has_header('X-Profile-Id'))
+        self.assertFalse(self.client.get('/api/posts/?profile=1').has_header('X-Profile-Id'))
+        self.assertEqual(profiling.load(), [])
+
+    def test_query_flag_is_staff_only(self):
+        self.authenticate(self.alice)
+        self.assertFalse(self.client.get('/api/posts/?profile=1').has_header('X-Profile-Id'))
+        User.objects.filter(id=self.alice.id).update(is_staff=True)
+        cache.clear()
+        response = self.client.get('/api/posts/?profile=1')
+        self.assertTrue(response.has_header('X-Profile-Id'))
+        self.assertEqual(profiling.load()[0]['trigger'], 'staff')
+
+    def test_command_summarizes_by_route_and_prunes_old_profiles(self):
+        with self.settings(PROFILING_MAX_FILES=2):
+            for _ in range(3):
+                self.client.get('/api/posts/', HTTP_X_PROFILE=profiling.sign())
+        self.assertEqual(len(profiling.load()), 2)
+        out = StringIO()
+        call_command('profiles', stdout=out)
+        self.assertIn('GET api/posts/: 2 profiles', out.getvalue())
@@ -0,0 +1,200 @@
+"""
+Домашняя лента "посты тех, на кого я подписан".
+
+Обычные авторы раскладывают id нового поста по лентам подписчиков при
+публикации (fan-out on write), поэтому чтение ленты — это один проход по
+индексу. Для аккаунтов с очень большим числом подписчиков (больше
+TIMELINE_FANOUT_LIMIT) раскладка не делается: их посты подтягиваются при
+чтении (pull) и сливаются с предрассчитанной частью.
+
+Хранилище выбирается настройкой TIMELINE_BACKEND.
+"""
+import bisect
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils.module_loading import import_string
+
+from .models import Follow, Post, Profile, TimelineEntry
+
+FANOUT_BATCH_SIZE = 1000
+BACKFILL_POSTS = 20
+
+
+class BaseTimelineBackend:
+    def push(self, post, user_ids):
+        """Добавляет пост в ленты пользователей user_ids."""
+        raise NotImplementedError
+
+    def push_many(self, items):
+        """Добавляет пары (post, user_id) разом; бэкенды с БД делают это одной вставкой."""
+        for post, user_id in items:
+            self.push(post, [user_id])
+
+    def remove_author(self, user_id, author_id):
+        """Убирает из ленты user_id все посты автора (после отписки)."""
+        raise NotImplementedError
+
+    def remove_authors(self, user_id, author_ids):
+        for author_id in author_ids:
+            self.remove_author(user_id, author_id)
+
+    def page(self, user_id, before=None, limit=20):
+        """
+        Возвращает до limit пар (created_at, post_id) по убыванию,
+        строго раньше курсора before = (created_at, post_id).
+        """
+        raise NotImplementedError
+
+
+class DatabaseTimelineBackend(BaseTimelineBackend):
+    def push(self, post, user_ids):
+        entries = [TimelineEntry(user_id=user_id, post_id=post.id, created_at=post.created_at)
+                   for user_id in user_ids]
+        TimelineEntry.objects.bulk_create(entries, batch_size=FANOUT_BATCH_SIZE, ignore_conflicts=True)
+
+    def push_many(self, items):
+        entries = [TimelineEntry(user_id=user_id, post_id=post.id, created_at=post.created_at)
+                   for post, user_id in items]
+        TimelineEntry.objects.bulk_create(entries, batch_size=FANOUT_BATCH_SIZE, ignore_conflicts=True)
+
+    def remove_author(self, user_id, author_id):
+        self.remove_authors(user_id, [author_id])
+
+    def remove_authors(self, user_id, author_ids):
+        TimelineEntry.objects.filter(user_id=user_id, post__user_id__in=author_ids).delete()
+
+    def page(self, user_id, before=None, limit=20):
+        entries = TimelineEntry.objects.filter(user_id=user_id)
+        if before:
+            created_at, post_id = before
+            entries = (entries.filter(created_at__lt=created_at)
+                       | entries.filter(created_at=created_at, post_id__lt=post_id))
+        entries = entries.order_by('-created_at', '-post_id').values_list('created_at', 'post_id')
+        return list(entries[:limit])
+
+
+class InMemoryTimelineBackend(BaseTimelineBackend):
+    """
+    Локальная реализация для разработки и тестов: ленты живут в памяти
+    процесса и ограничены max_entries последними постами.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # user_id -> отсортированный по возрастанию список (created_at, post_id, author_id)
+        self._timelines = {}
+
+    def push(self, post, user_ids):
+        item = (post.created_at, post.id, post.user_id)
+        with self._lock:
+            for user_id in user_ids:
+                timeline = self._timelines.setdefault(user_id, [])
+                index = bisect.bisect_left(timeline, item)
+                if index < len(timeline) and timeline[index][:2] == item[:2]:
+                    continue
+                timeline.insert(index, item)
+                if len(timeline) > self.max_entries:
+                    del timeline[0]
+
+    def remove_author(self, user_id, author_id):
+        with self._lock:
+            timeline = self._timelines.get(user_id, [])
+            timeline[:] = [item for item in timeline if item[2] != author_id]
+
+    def page(self, user_id, before=None, limit=20):
+        with self._lock:
+            timeline = self._timelines.get(user_id, [])
+            end = bisect.bisect_left(timeline, tuple(before)) if before else len(timeline)
+            return [(created_at, post_id) for created_at, post_id, _ in reversed(timeline[max(0, end - limit):end])]
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    backend = getattr(settings, 'TIMELINE_BACKEND', 'api.timeline.DatabaseTimelineBackend')
+    return import_string(backend)()
+
+
+def get_fanout_limit():
+    return getattr(settings, 'TIMELINE_FANOUT_LIMIT', 5000)
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост по лентам подписчиков автора и самого автора."""
+    followers_count = (Profile.objects.filter(user_id=post.user_id)
+                       .values_list('followers_count', flat=True).first() or 0)
+    user_ids = [post.user_id]
+    if followers_count <= get_fanout_limit():
+        user_ids.extend(Follow.objects.filter(following_id=post.user_id)
+                        .values_list('follower_id', flat=True).iterator(chunk_size=FANOUT_BATCH_SIZE))
+    get_backend().push(post, user_ids)
+
+
+def fan_out_posts(posts):
+    """fan_out_post для пачки постов: подписчики всех авторов читаются одним запросом."""
+    if not posts:
+        return
+    author_ids = {post.user_id for post in posts}
+    fanned = set(Profile.objects.filter(user_id__in=author_ids, followers_count__lte=get_fanout_limit())
+                 .values_list('user_id', flat=True))
+    followers = {author_id: [author_id] for author_id in author_ids}
+    edges = Follow.objects.filter(following_id__in=fanned).values_list('following_id', 'follower_id')
+    for author_id, follower_id in edges.iterator(chunk_size=FANOUT_BATCH_SIZE):
+        followers[author_id].append(follower_id)
+    get_backend().push_many([(post, user_id) for post in posts for user_id in followers[post.user_id]])
+
+
+def backfill_author(follower_id, author_id):
+    """После подписки подтягивает в ленту последние посты автора."""
+    backfill_authors([(follower_id, author_id)])
+
+
+def backfill_authors(follows):
+    """
+    backfill_author для пар (follower_id, author_id): последние BACKFILL_POSTS
+    постов каждого автора выбираются одним запросом и вставляются одним bulk_create.
+    """
+    followers = {}
+    for follower_id, author_id in follows:
+        followers.setdefault(author_id, []).append(follower_id)
+    if not followers:
+        return
+    posts = (Post.objects.filter(user_id__in=followers)
+             .annotate(rank=Window(RowNumber(), partition_by=F('user_id'),
+                                   order_by=[F('created_at').desc(), F('id').desc()]))
+             .filter(rank__lte=BACKFILL_POSTS)
+             .only('id', 'user_id', 'created_at'))
+    get_backend().push_many([(post, follower_id) for post in posts for follower_id in followers[post.user_id]])
+
+
+def remove_author(follower_id, author_id):
+    get_backend().remove_author(follower_id, author_id)
+
+
+def remove_authors(follower_id, author_ids):
+    if author_ids:
+        get_backend().remove_authors(follower_id, author_ids)
+
+
+def read_timeline(user, before=None, limit=20):
+    """
+    Возвращает до limit пар (created_at, post_id) домашней ленты user:
+    предрассчитанные записи плюс посты "звёзд", которые подтягиваются при чтении.
+    """
+    items = get_backend().page(user.id, before, limit)
+
+    celebrity_ids = list(Follow.objects.filter(
+        follower=user, following__profile__followers_count__gt=get_fanout_limit(),
+    ).values_list('following_id', flat=True))
+    if celebrity_ids:
+        pulled = Post.objects.filter(user_id__in=celebrity_ids)
+        if before:
+            created_at, post_id = before
+            pulled = pulled.filter(created_at__lt=created_at) | pulled.filter(created_at=created_at, id__lt=post_id)
+        pulled = pulled.order_by('-created_at', '-id').values_list('created_at', 'id')[:limit]
+        items = sorted(set(items) | set(pulled), reverse=True)[:limit]
+    return items
@@ -4,20 +4,31 @@ from .views import (
     register,
     logout,
     ProfileView,
+    avatar_upload_url,
+    avatar_upload_complete,
     PostListView,
+    TimelineView,
     PostDetailView,
     UserPostsView,
     PostCommentsView,
     CommentDetailView,
     LikePostView,
+    batch_write,
+    ToggleLikeView,
+    liked_status,
     follow_user,
     unfollow_user,
     check_following_status,
-    SearchView, NotificationListView, ProfileListView, health_check
+    batch_following_status,
+    FollowListView,
+    SearchView, NotificationListView, ProfileListView, UserLookupView, health_check, cache_stats, prometheus_metrics,
+    NotificationMarkReadView, unread_notifications_count, notification_stream,
 )
 
 urlpatterns = [
     path('health/', health_check, name='health-check'),
+    path('metrics/', prometheus_metrics, name='metrics'),
+    path('cache/stats/', cache_stats, name='cache-stats'),
     path('auth/register/', register, name='register'),
     path('auth/login/', TokenObtainPairView.as_view(), name='login'),
     path('auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
@@ -26,18 +37,31 @@ urlpatterns = [
     path('search/', SearchView.as_view(), name='search'),
 
 
+    path('avatar/upload/', avatar_upload_url, name='avatar-upload-url'),
+    path('avatar/complete/', avatar_upload_complete, name='avatar-upload-complete'),
     path('profile/<str:username>/', ProfileView.as_view(), name='user-profile'),
     path('profile/<str:username>/posts/', UserPostsView.as_view(), name='user-posts'),
     path('follow/<str:username>/', follow_user, name='follow-user'),
     path('unfollow/<str:username>/', unfollow_user, name='unfollow-user'),
+    path('following-status/', batch_following_status, name='batch-following-status'),
     path('following-status/<str:username>/', check_following_status , name='check-following-status'),
+    path('profile/<str:username>/followers/', FollowListView.as_view(direction='followers'), name='user-followers'),
+    path('profile/<str:username>/following/', FollowListView.as_view(direction='following'), name='user-following'),
     path('posts/',  PostListView.as_view(), name='posts-list'),
+    path('timeline/', TimelineView.as_view(), name='timeline'),
     path('posts/<int:post_id>/', PostDetailView.as_view(), name='post-detail'),
     path('posts/<int:post_id>/like/', LikePostView.as_view(), name='like-post'),
+    path('posts/<int:post_id>/like/toggle/', ToggleLikeView.as_view(), name='toggle-like'),
+    path('likes/status/', liked_status, name='liked-status'),
+    path('batch/', batch_write, name='batch-write'),
 
     path('notifications/', NotificationListView.as_view(), name='notification-list'),
+    path('notifications/mark-read/', NotificationMarkReadView.as_view(), name='notification-mark-read'),
+    path('notifications/unread-count/', unread_notifications_count, name='notification-unread-count'),
+    path('notifications/stream/', notification_stream, name='notification-stream'),
 
     path('posts/<int:post_id>/comments/', PostCommentsView.as_view(), name='post-comments'),
     path('posts/<int:post_id>/comments/<int:comment_id>/', CommentDetailView.as_view(), name='comment-detail'),
     path('users/', ProfileListView.as_view(), name='user-list'),
+    path('users/lookup/', UserLookupView.as_view(), name='user-lookup'),
 ]
\ No newline at end of file
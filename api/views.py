@@ -1,24 +1,78 @@
 # views.py
+import asyncio
+import json
+import logging
+
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status, generics, permissions
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
 from rest_framework_simplejwt.tokens import RefreshToken
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.http import JsonResponse
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from utils.s3 import *
+from django.utils.crypto import constant_time_compare
+from utils.images import InvalidImage
+from utils.s3 import UnsupportedOperation
 from .models import Profile, Post, Comment, Like , Follow, Notification
+from .mixins import ConditionalGetMixin
+from .pagination import (
+    decode_cursor, encode_cursor, get_offset, get_page_size, paginate_by_id, paginate_keyset,
+)
+from . import authentication, avatars, batch, cache, follows, likes, metrics, notifications, realtime, search, timeline
 from .serializers import (
     UserSerializer,
     CommentSerializer,
     ProfileSerializer,
     PostSerializer,
-    NotificationSerializer
+    NotificationSerializer,
+    BatchOperationSerializer,
+    UsernameTokenObtainPairSerializer,
 )
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_USERS = 100
+MAX_BATCH_POSTS = 100
+MAX_COMMENTS_PREVIEW = 5
+
+
+def attach_comment_previews(request, post_data):
+    """
+    ?comments_preview=N: встраивает в каждый пост первые N комментариев,
+    один запрос на всю страницу.
+    """
+    try:
+        per_post = min(int(request.query_params.get('comments_preview', 0)), MAX_COMMENTS_PREVIEW)
+    except ValueError:
+        per_post = 0
+    if per_post <= 0 or not post_data:
+        return post_data
+    previews = {}
+    for comment in Comment.objects.previews([post['id'] for post in post_data], per_post):
+        previews.setdefault(comment.post_id, []).append(comment)
+    for post in post_data:
+        comments = sorted(previews.get(post['id'], []), key=lambda comment: (comment.created_at, comment.id))
+        post['comments_preview'] = CommentSerializer(comments, many=True).data
+    return post_data
+
+
+def liked_post_ids(user, posts):
+    """Один запрос вместо EXISTS на каждый пост."""
+    return likes.liked_post_ids(user, [post.id for post in posts])
+
+
+def log_failed_upload(upload):
+    if upload.exception() is not None:
+        logger.error('Background avatar processing failed', exc_info=upload.exception())
 
 
 # Auth Views
@@ -32,7 +86,7 @@ def register(request):
             password=request.data.get('password')
         )
         Profile.objects.create(user=user)
-        refresh = RefreshToken.for_user(user)
+        refresh = UsernameTokenObtainPairSerializer.get_token(user)
         return Response({
             'user': UserSerializer(user).data,
             'refresh': str(refresh),
@@ -48,20 +102,32 @@ def logout(request):
         refresh_token = request.data["refresh"]
         token = RefreshToken(refresh_token)
         token.blacklist()
+        # Access-токен живёт до истечения срока — отзываем и его
+        if request.auth is not None:
+            authentication.deny_token(request.auth)
         return Response(status=status.HTTP_205_RESET_CONTENT)
     except Exception as e:
         print(str(e))
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
-class ProfileView(APIView):
+class ProfileView(ConditionalGetMixin, APIView):
     permission_classes = [IsAuthenticatedOrReadOnly]
 
+    def get_cache_namespaces(self, request, username=None):
+        if username is None:
+            return [f'profile:{request.user.id}', 'users']
+        user_id = User.objects.filter(username=username).values_list('id', flat=True).first()
+        return [f'profile:{user_id}', 'users']
+
     def get(self, request, username=None):
         user = request.user if username is None else get_object_or_404(User, username=username)
-        profile = get_object_or_404(Profile, user=user)
-        serializer = ProfileSerializer(profile)
-        return Response(serializer.data)
+        data = cache.get_profile(user.id)
+        if data is None:
+            raise Http404
+        # Статус подписки отдаём сразу, без отдельного запроса к following-status
+        is_following = user.id in follows.following_ids(request.user, [user.id])
+        return Response(dict(data, is_following=is_following))
 
     def put(self, request, username):
         user = get_object_or_404(User, username=username)
@@ -70,25 +136,94 @@ class ProfileView(APIView):
 
         avatar = request.FILES.get('avatar', None)
         if avatar:
-            file_name = f"avatars/{user.username}/{os.path.basename(avatar.name)}"
-            file_url = upload_to_s3(avatar, file_name)
-            profile.avatar_url = file_url
-
+            try:
+                avatar_data = avatars.read_upload(avatar)
+            except InvalidImage as e:
+                return Response({'avatar': [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
 
         serializer = ProfileSerializer(profile, data=request.data, partial=True)
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer.save()
+
+        pending = False
+        if avatar and settings.S3_UPLOAD_ASYNC:
+            # Варианты догрузятся в фоне, профиль обновится сам
+            avatars.submit(user, avatar_data).add_done_callback(log_failed_upload)
+            pending = True
+        elif avatar:
+            avatars.process_avatar(user.id, user.username, avatar_data)
+            profile.refresh_from_db(fields=['avatar_url', 'avatar_variants'])
+        return Response(dict(ProfileSerializer(profile).data, avatar_pending=pending))
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def avatar_upload_url(request):
+    """
+    {"content_type": "image/png", "method": "post"|"put"} -> подписанная ссылка
+    для загрузки аватарки прямо в хранилище.
+    """
+    try:
+        upload = avatars.presign(request.user, request.data.get('content_type', ''),
+                                 request.data.get('method', 'post'))
+    except InvalidImage as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except UnsupportedOperation as e:
+        return Response({'error': str(e)}, status=status.HTTP_501_NOT_IMPLEMENTED)
+    return Response(upload)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def avatar_upload_complete(request):
+    """{"key": ...} после загрузки по ссылке из avatar_upload_url."""
+    try:
+        upload = avatars.complete(request.user, request.data.get('key', ''))
+    except InvalidImage as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    # Файл скачивается и нарезается в фоне, профиль обновится сам
+    upload.add_done_callback(log_failed_upload)
+    return Response({'avatar_pending': True}, status=status.HTTP_202_ACCEPTED)
 
 
-class PostListView(APIView):
+class PostListView(ConditionalGetMixin, APIView):
     permission_classes = [AllowAny]
 
+    def get_cache_namespaces(self, request):
+        return ['posts', 'users']
+
     def get(self, request):
-        posts = Post.objects.all().order_by('-created_at')
-        serializer = PostSerializer(posts, many=True, context={'request': request})
-        return Response(serializer.data)
+        posts, next_cursor = paginate_keyset(Post.objects.for_feed(), request)
+        serializer = PostSerializer(posts, many=True, context={
+            'request': request,
+            'liked_post_ids': liked_post_ids(request.user, posts),
+        })
+        return Response({'results': attach_comment_previews(request, serializer.data), 'next': next_cursor})
+
+
+class TimelineView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        limit = get_page_size(request)
+        cursor = request.query_params.get('cursor')
+        before = decode_cursor(cursor) if cursor else None
+
+        items = timeline.read_timeline(request.user, before, limit + 1)
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = encode_cursor(*items[-1])
+
+        posts_by_id = Post.objects.for_feed().in_bulk([post_id for _, post_id in items])
+        # Удалённые посты могли остаться в ленте in-memory бэкенда — просто пропускаем
+        posts = [posts_by_id[post_id] for _, post_id in items if post_id in posts_by_id]
+        serializer = PostSerializer(posts, many=True, context={
+            'request': request,
+            'liked_post_ids': liked_post_ids(request.user, posts),
+        })
+        return Response({'results': attach_comment_previews(request, serializer.data), 'next': next_cursor})
 
 
 class PostDetailView(APIView):
@@ -98,9 +233,10 @@ class PostDetailView(APIView):
         return get_object_or_404(Post, id=post_id)
 
     def get(self, request, post_id):
-        post = self.get_object(post_id)
-        serializer = PostSerializer(post, context={'request': request})
-        return Response(serializer.data)
+        data = cache.get_post(post_id)
+        if data is None:
+            raise Http404
+        return Response(cache.with_is_liked([data], request.user)[0])
 
     def put(self, request, post_id):
         post = self.get_object(post_id)
@@ -148,29 +284,36 @@ class UserPostsView(APIView):
         user = request.user if username is None else get_object_or_404(User, username=username)
         serializer = PostSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(user=user)
+            post = serializer.save(user=user)
+            timeline.fan_out_post(post)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class PostCommentsView(APIView):
+class PostCommentsView(ConditionalGetMixin, APIView):
     permission_classes = [IsAuthenticatedOrReadOnly]
 
+    def get_cache_namespaces(self, request, post_id):
+        return [f'comments:{post_id}', 'users']
+
     def get_post(self, post_id):
         return get_object_or_404(Post, id=post_id)
 
     def get(self, request, post_id):
         post = self.get_post(post_id)
-        comments = Comment.objects.filter(post=post)
+        comments, next_cursor = paginate_keyset(
+            Comment.objects.filter(post=post).select_related('user'), request, descending=False,
+        )
         serializer = CommentSerializer(comments, many=True)
-        return Response(serializer.data)
+        return Response({'results': serializer.data, 'next': next_cursor})
 
     def post(self, request, post_id):
         post = self.get_post(post_id)
         serializer = CommentSerializer(data=request.data)
         if serializer.is_valid():
-            add_comment_notification(request, post_id)
-            serializer.save(user=request.user, post=post)
+            with transaction.atomic():
+                serializer.save(user=request.user, post=post)
+                notifications.notify(notifications.COMMENT, request.user.id, post.user_id)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -219,44 +362,72 @@ class CommentDetailView(APIView):
 
 
 class LikePostView(APIView):
+    """
+    POST ставит лайк, DELETE снимает. Оба идемпотентны и возвращают
+    {"post_id", "liked", "likes_count"} без повторной сериализации поста.
+    """
     permission_classes = [IsAuthenticated]
 
-    def post(self, request, post_id):
-
-        post = get_object_or_404(Post, id=post_id)
-
-
-        like, created = Like.objects.get_or_create(user=request.user, post=post)
-
-        if not created:
-
-            return Response({'message': 'Вы уже поставили лайк этому посту'}, status=status.HTTP_200_OK)
-
-
-        post.likes_count = post.likes.count()
-        post.save()
-        like_post_notification(request, post)
+    @staticmethod
+    def respond(post_id, change, *args):
+        try:
+            liked, likes_count = change(*args)
+        except likes.PostNotFound:
+            raise Http404
+        return Response({'post_id': post_id, 'liked': liked, 'likes_count': likes_count})
 
-        serializer = PostSerializer(post, context={'request': request})
-        return Response(serializer.data)
+    def post(self, request, post_id):
+        return self.respond(post_id, likes.set_like, request.user, post_id, True)
 
     def delete(self, request, post_id):
-        post = get_object_or_404(Post, id=post_id)
+        return self.respond(post_id, likes.set_like, request.user, post_id, False)
 
 
-        try:
-            like = Like.objects.get(user=request.user, post=post)
-            like.delete()
+class ToggleLikeView(LikePostView):
+    http_method_names = ['post', 'options']
 
+    def post(self, request, post_id):
+        return self.respond(post_id, likes.toggle_like, request.user, post_id)
 
-            post.likes_count = post.likes.count()
-            post.save()
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def liked_status(request):
+    """?ids=1,2,3 -> {"liked": {"1": true, ...}} одним запросом."""
+    try:
+        ids = [int(value) for value in request.query_params.get('ids', '').split(',') if value]
+    except ValueError:
+        return Response({'error': 'ids must be integers.'}, status=400)
+    if len(ids) > MAX_BATCH_POSTS:
+        return Response({'error': f'At most {MAX_BATCH_POSTS} posts per request.'}, status=400)
+    found = likes.liked_post_ids(request.user, ids)
+    return Response({'liked': {post_id: post_id in found for post_id in ids}})
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_write(request):
+    """
+    {"operations": [{"op": "like", "post_id": 1}, {"op": "comment", "post_id": 1, "content": "..."}, ...]}
+    -> {"results": [...]} в том же порядке. Невалидные операции получают 400
+    в своём результате, остальные выполняются одной транзакцией.
+    """
+    operations = request.data.get('operations') if isinstance(request.data, dict) else None
+    if not isinstance(operations, list):
+        return Response({'error': 'operations must be a list.'}, status=400)
+    if len(operations) > batch.MAX_OPERATIONS:
+        return Response({'error': f'At most {batch.MAX_OPERATIONS} operations per request.'}, status=400)
+
+    checked = [BatchOperationSerializer(data=operation) for operation in operations]
+    valid = [serializer.validated_data for serializer in checked if serializer.is_valid()]
+    try:
+        executed = iter(batch.execute(request.user, valid))
+    except IntegrityError:
+        # Параллельный запрос успел записать то же самое — клиент может просто повторить пакет
+        return Response({'error': 'Conflicting concurrent write, retry the batch.'}, status=409)
+    results = [{'status': 400, 'errors': serializer.errors} if serializer.errors else next(executed)
+               for serializer in checked]
+    return Response({'results': results})
 
-            serializer = PostSerializer(post, context={'request': request})
-            return Response(serializer.data)
-        except Like.DoesNotExist:
-            return Response({'message': 'Вы не ставили лайк этому посту'}, status=status.HTTP_404_NOT_FOUND)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -266,9 +437,12 @@ def follow_user(request, username):
         if request.user == to_follow:
             return Response({'error': 'You cannot follow yourself.'}, status=400)
 
-        created = Follow.objects.get_or_create(follower=request.user, following=to_follow)
-        follow_user_notification(request, username)
+        with transaction.atomic():
+            follow, created = Follow.objects.get_or_create(follower=request.user, following=to_follow)
+            if created:
+                notifications.notify(notifications.FOLLOW, request.user.id, to_follow.id)
         if created:
+            timeline.backfill_author(request.user.id, to_follow.id)
             return Response({'message': 'Successfully followed.'}, status=201)
         else:
             return Response({'message': 'Already following.'}, status=200)
@@ -283,7 +457,9 @@ def unfollow_user(request, username):
         to_unfollow = User.objects.get(username=username)
         follow = Follow.objects.filter(follower=request.user, following=to_unfollow)
         if follow.exists():
-            follow.delete()
+            with transaction.atomic():
+                follow.delete()
+            timeline.remove_author(request.user.id, to_unfollow.id)
             return Response({'message': 'Unfollowed successfully.'})
         else:
             return Response({'message': 'You are not following this user.'}, status=400)
@@ -303,78 +479,257 @@ def check_following_status(request, username):
 
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def batch_following_status(request):
+    """
+    ?usernames=a,b,c или ?ids=1,2,3 -> {"following": {"a": true, ...}} одним запросом.
+    Оба параметра сразу не принимаются: ключи ответа были бы вперемешку именами и id.
+    """
+    usernames = [name for name in request.query_params.get('usernames', '').split(',') if name]
+    raw_ids = [value for value in request.query_params.get('ids', '').split(',') if value]
+    if usernames and raw_ids:
+        return Response({'error': 'Pass either usernames or ids, not both.'}, status=400)
+    try:
+        ids = [int(value) for value in raw_ids]
+    except ValueError:
+        return Response({'error': 'ids must be integers.'}, status=400)
+    if len(usernames) + len(ids) > MAX_BATCH_USERS:
+        return Response({'error': f'At most {MAX_BATCH_USERS} users per request.'}, status=400)
+
+    followed = Follow.objects.filter(follower_id=request.user.id)
+    if usernames:
+        found = set(followed.filter(following__username__in=usernames)
+                    .values_list('following__username', flat=True))
+        return Response({'following': {name: name in found for name in usernames}})
+    found = follows.following_ids(request.user, ids)
+    return Response({'following': {user_id: user_id in found for user_id in ids}})
+
+
+class FollowListView(APIView):
+    """Подписчики (direction='followers') или подписки ('following') пользователя."""
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    direction = 'followers'
+
+    def get(self, request, username):
+        user = get_object_or_404(User, username=username)
+        if self.direction == 'followers':
+            edges, other = follows.followers_of(user), 'follower_id'
+        else:
+            edges, other = follows.followed_by(user), 'following_id'
+        page, next_cursor = paginate_keyset(edges.only('id', 'created_at', other), request)
+        user_ids = [getattr(edge, other) for edge in page]
+        profiles = cache.get_profiles(user_ids)
+        followed = follows.following_ids(request.user, user_ids)
+        results = [dict(profiles[user_id], is_following=user_id in followed)
+                   for user_id in user_ids if user_id in profiles]
+        return Response({'results': results, 'next': next_cursor})
+
+
 class SearchView(APIView):
     def get(self, request):
-        query = request.query_params.get('q', '')
+        query = request.query_params.get('q', '').strip()
+        limit = get_page_size(request)
+        offset = get_offset(request)
+        if not query:
+            return Response({'users': [], 'posts': [], 'next_offset': None}, status=status.HTTP_200_OK)
+
+        backend = search.get_backend()
+        # Берём на одну запись больше, чтобы понять, есть ли следующая страница
+        user_ids = backend.search_users(query, limit + 1, offset)
+        post_ids = backend.search_posts(query, limit + 1, offset)
+        has_more = len(user_ids) > limit or len(post_ids) > limit
+        user_ids, post_ids = user_ids[:limit], post_ids[:limit]
+
+        # Фиксированный бюджет запросов: посты, профили (найденные + авторы), лайки
+        posts = Post.objects.for_feed().in_bulk(post_ids)
+        posts = [posts[i] for i in post_ids if i in posts]
+        profile_user_ids = set(user_ids) | {post.user_id for post in posts}
+        profiles = Profile.objects.select_related('user').filter(user_id__in=profile_user_ids)
+        profile_data = ProfileSerializer(profiles, many=True).data
+        profiles_by_user = {profile['user']['id']: profile for profile in profile_data}
+
+        post_data = PostSerializer(posts, many=True, context={
+            'request': request,
+            'liked_post_ids': liked_post_ids(request.user, posts),
+        }).data
+        for post in post_data:
+            post['user_profile'] = profiles_by_user.get(post['user']['id'])
 
-        users = User.objects.filter(username__icontains=query)
+        return Response({
+            'users': [profiles_by_user[i] for i in user_ids if i in profiles_by_user],
+            'posts': post_data,
+            'next_offset': offset + limit if has_more else None,
+        }, status=status.HTTP_200_OK)
 
 
-        posts = Post.objects.filter(content__icontains=query)
+class NotificationListView(ConditionalGetMixin, generics.ListAPIView):
+    serializer_class = NotificationSerializer
+    permission_classes = [permissions.IsAuthenticated]
 
+    def get_cache_namespaces(self, request):
+        return [f'notifications:{request.user.id}', 'users']
 
-        profile_data = ProfileSerializer(Profile.objects.filter(user__in=users), many=True).data
-        user_data = {user['id']: user for user in profile_data}  # Создаём словарь с user_id как ключами
+    def get_queryset(self):
+        # Чтение больше ничего не пишет: прочитанными отмечает NotificationMarkReadView
+        return Notification.objects.filter(recipient=self.request.user).select_related('sender', 'recipient')
 
-        post_data = PostSerializer(posts, many=True, context={'request': request}).data
+    def list(self, request, *args, **kwargs):
+        items, next_cursor = paginate_keyset(self.get_queryset(), request)
+        serializer = self.get_serializer(items, many=True)
+        return Response({'results': serializer.data, 'next': next_cursor})
 
 
-        for post in post_data:
-            user_profile = user_data.get(post['user']['id'])
-            if user_profile:
-                post['user_profile'] = user_profile
+class NotificationMarkReadView(APIView):
+    permission_classes = [IsAuthenticated]
 
-        return Response({
-            'users': user_data,
-            'posts': post_data
-        }, status=status.HTTP_200_OK)
+    def post(self, request):
+        up_to = request.data.get('up_to')
+        if up_to is not None:
+            try:
+                up_to = int(up_to)
+            except (TypeError, ValueError):
+                return Response({'up_to': 'Must be a notification id.'}, status=status.HTTP_400_BAD_REQUEST)
+        marked = notifications.mark_read(request.user, up_to)
+        return Response({'marked': marked})
 
 
-def like_post_notification(request, post_id):
-    post = Post.objects.get(id=post_id)
-    if post.user != request.user:
-        Notification.objects.create(
-            recipient=post.user,
-            sender=request.user,
-            message=" лайкнул ваш пост"
-        )
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def unread_notifications_count(request):
+    count = (Profile.objects.filter(user_id=request.user.id)
+             .values_list('unread_notifications_count', flat=True).first() or 0)
+    return Response({'unread_count': count})
 
-def add_comment_notification(request, post_id):
-    post = Post.objects.get(id=post_id)
-    if request.method == "POST":
-        if post.user != request.user:
-            Notification.objects.create(
-                recipient=post.user,
-                sender=request.user,
-                message="прокомментировал ваш пост"
-            )
-
-def follow_user_notification(request, username):
-    target_user = User.objects.get(username=username)
-    if target_user != request.user:
-        Notification.objects.create(
-            recipient=target_user,
-            sender=request.user,
-            message=" подписался на вас"
-        )
 
-class NotificationListView(generics.ListAPIView):
-    serializer_class = NotificationSerializer
-    permission_classes = [permissions.IsAuthenticated]
+STREAM_KEEPALIVE_SECONDS = 15
+STREAM_REPLAY_LIMIT = 100
+
+
+def _stream_user_id(request):
+    # EventSource не умеет ставить заголовки, поэтому токен можно передать в ?token=
+    raw = request.GET.get('token')
+    header = request.headers.get('Authorization', '')
+    if not raw and header.startswith('Bearer '):
+        raw = header.split(' ', 1)[1]
+    if not raw:
+        return None
+    auth = authentication.StatelessJWTAuthentication()
+    try:
+        return auth.get_user(auth.get_validated_token(raw)).id
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+def _missed_notifications(user_id, last_id):
+    missed = (Notification.objects.filter(recipient_id=user_id, id__gt=last_id)
+              .order_by('id')[:STREAM_REPLAY_LIMIT])
+    return notifications.to_payloads(list(missed))
+
+
+def _sse(payload):
+    return f"id: {payload['id']}\nevent: notification\ndata: {json.dumps(payload)}\n\n"
+
+
+async def stream_events(user_id, last_event_id=None):
+    """Тело SSE-потока: пропущенные уведомления после last_event_id, затем живые."""
+    async with realtime.get_hub().subscribe(user_id) as queue:
+        yield 'retry: 5000\n\n'
+        seen = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+        if seen:
+            # Переподключение: досылаем то, что пришло, пока клиента не было. Отдаём
+            # сразу, а не через очередь — её разбирает только этот же генератор
+            for payload in await sync_to_async(_missed_notifications)(user_id, seen):
+                yield _sse(payload)
+                seen = payload['id']
+        while True:
+            try:
+                payload = await asyncio.wait_for(queue.get(), timeout=STREAM_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            # Пришедшее во время выборки лежит и в очереди — второй раз не шлём
+            if payload['id'] > seen:
+                yield _sse(payload)
+
+
+async def notification_stream(request):
+    """
+    SSE-поток новых уведомлений. Работает только под ASGI (uvicorn/daphne):
+    соединение висит без нагрузки, пока хаб не пришлёт событие.
+    """
+    # На холодном кэше состояние пользователя читается из базы — только из потока
+    user_id = await sync_to_async(_stream_user_id)(request)
+    if user_id is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    response = StreamingHttpResponse(stream_events(user_id, request.headers.get('Last-Event-ID')),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
-    def get_queryset(self):
-        qs = Notification.objects.filter(recipient=self.request.user).order_by('-created_at')
-        qs.update(is_read=True)
-        return qs
 
 class ProfileListView(APIView):
     permission_classes = [IsAuthenticatedOrReadOnly]
 
     def get(self, request):
-        profiles = Profile.objects.all()
-        serializer = ProfileSerializer(profiles, many=True)
-        return Response(serializer.data)
+        page, next_cursor = paginate_by_id(Profile.objects.only('id', 'user_id'), request)
+        user_ids = [profile.user_id for profile in page]
+        profiles = cache.get_profiles(user_ids)
+        followed = follows.following_ids(request.user, user_ids)
+        results = [dict(profiles[user_id], is_following=user_id in followed)
+                   for user_id in user_ids if user_id in profiles]
+        return Response({'results': results, 'next': next_cursor})
+
+
+class UserLookupView(APIView):
+    """
+    Сводка по списку пользователей для отрисовки списков: аватар, счётчики
+    и статус подписки. Два запроса независимо от длины списка.
+    """
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        usernames = request.data.get('usernames') or []
+        ids = request.data.get('ids') or []
+        if not isinstance(usernames, list) or not isinstance(ids, list):
+            return Response({'error': 'usernames and ids must be lists.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(usernames) + len(ids) > MAX_BATCH_USERS:
+            return Response({'error': f'At most {MAX_BATCH_USERS} users per request.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = [int(user_id) for user_id in ids]
+        except (TypeError, ValueError):
+            return Response({'error': 'ids must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = Profile.objects.filter(Q(user__username__in=usernames) | Q(user_id__in=ids)).values(
+            'user_id', 'user__username', 'avatar_url', 'followers_count', 'following_count',
+        )
+        rows = list(rows)
+        followed = follows.following_ids(request.user, [row['user_id'] for row in rows])
+        return Response({'results': [{
+            'id': row['user_id'],
+            'username': row['user__username'],
+            'avatar_url': row['avatar_url'],
+            'followers_count': row['followers_count'],
+            'following_count': row['following_count'],
+            'is_following': row['user_id'] in followed,
+        } for row in rows]})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    return Response(cache.get_stats())
 
 
 def health_check(request):
-    return JsonResponse({'status': 'ok'}, status=200)
\ No newline at end of file
+    return JsonResponse({'status': 'ok'}, status=200)
+
+
+def prometheus_metrics(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
\ No newline at end of file
@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backendSide.settings')
+# Под ASGI каждый поток sync_to_async держит своё соединение, поэтому
+# постоянные соединения по умолчанию выключены (нужен пулер на стороне БД)
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
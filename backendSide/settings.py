@@ -39,6 +39,18 @@ AWS_BUCKET_NAME = os.getenv("AWS_BUCKET_NAME")
 AWS_REGION = os.getenv("AWS_REGION")
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
+# Адрес S3-совместимого сервиса (minio, moto server); пусто — настоящий AWS
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "20"))
+# Обрабатывать и загружать аватарки из PUT профиля в фоне и сразу отвечать клиенту
+# (прямые загрузки через /api/avatar/complete/ обрабатываются в фоне всегда)
+S3_UPLOAD_ASYNC = os.getenv("S3_UPLOAD_ASYNC", "") == "1"
+# Процессы для нарезки вариантов аватарок; 0 — прямо в вызывающем потоке
+AVATAR_PROCESS_WORKERS = int(os.getenv("AVATAR_PROCESS_WORKERS", "2"))
+# utils.s3.FileSystemStorage — хранить файлы локально, без S3
+AVATAR_STORAGE = os.getenv("AVATAR_STORAGE", "utils.s3.S3Storage")
+LOCAL_STORAGE_ROOT = os.getenv("LOCAL_STORAGE_ROOT", str(BASE_DIR / "media"))
+LOCAL_STORAGE_URL = os.getenv("LOCAL_STORAGE_URL", "/media/")
 
 print("BUCKET =", AWS_BUCKET_NAME)
 
@@ -57,6 +69,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.ProfilingMiddleware',
+    'api.middleware.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -65,6 +79,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ReadYourWritesMiddleware',
 ]
 CORS_ALLOWED_ORIGINS = [
     'http://localhost:4200',
@@ -93,13 +108,77 @@ WSGI_APPLICATION = 'backendSide.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Прагмы выполняются при каждом открытии соединения (init_command, Django 5.1+).
+# WAL: читатели не ждут писателя; synchronous=NORMAL в WAL безопасен при падении процесса.
+# IMMEDIATE: транзакция сразу берёт блокировку записи и ждёт её по timeout,
+# а не падает с "database is locked" при попытке повысить блокировку.
+SQLITE_TUNED_OPTIONS = {
+    'init_command': ';'.join([
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))}",
+        f"PRAGMA cache_size=-{int(os.getenv('SQLITE_CACHE_KB', 64 * 1024))}",
+        'PRAGMA temp_store=MEMORY',
+    ]),
+    'timeout': int(os.getenv('SQLITE_TIMEOUT', 20)),
+    'transaction_mode': 'IMMEDIATE',
+}
+SQLITE_TUNING = os.getenv('SQLITE_TUNING', '1') == '1'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        'OPTIONS': SQLITE_TUNED_OPTIONS if SQLITE_TUNING else {},
+        # Соединение живёт между запросами; перед переиспользованием проверяется.
+        # 60 секунд — значение для WSGI, asgi.py по умолчанию выставляет 0
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Реплики только для чтения (api/routers.py): SQLITE_REPLICAS=/path/replica1.sqlite3,/path/replica2.sqlite3
+# Локально их обновляет manage.py refresh_replicas; в тестах они зеркалят default.
+# Закрепление за основной базой после записи хранится в кэше — нужен общий (REDIS_URL).
+DATABASE_REPLICAS = []
+for i, path in enumerate(filter(None, os.getenv('SQLITE_REPLICAS', '').split(',')), 1):
+    alias = f'replica{i}'
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        NAME=path,
+        # IMMEDIATE брал бы блокировку записи на реплике и мешал обновлению
+        OPTIONS={k: v for k, v in DATABASES['default']['OPTIONS'].items() if k != 'transaction_mode'},
+        TEST={'MIRROR': 'default'},
+    )
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+# Сколько секунд после записи пользователь читает с основной базы
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
+
+# Cache
+# Локальный LRU по умолчанию; при нескольких процессах нужен общий Redis (REDIS_URL)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bailanysta',
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000))},
+    }
+}
+if os.getenv('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL'),
+    }
+
+# Кэш сериализованных постов/профилей (api/cache.py); версию поднимаем при смене формата
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', 300))
+API_CACHE_VERSION = 1
+# Объектный кэш, ETag/Last-Modified (api/mixins.py) и прочее, что держится на общем
+# кэше, при LocMem включаются, только если процесс заведомо один; с REDIS_URL — всегда
+API_CACHE_SINGLE_PROCESS = os.getenv('API_CACHE_SINGLE_PROCESS', 'False') == 'True'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -122,7 +201,7 @@ AUTH_PASSWORD_VALIDATORS = [
 # settings.py
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.StatelessJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
@@ -163,8 +242,43 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
+    'TOKEN_OBTAIN_SERIALIZER': 'api.serializers.UsernameTokenObtainPairSerializer',
 }
-
+# Сколько секунд держать в кэше is_active/username пользователя (api/authentication.py)
+AUTH_STATE_TTL = int(os.getenv('AUTH_STATE_TTL', 60))
+
+
+# Домашняя лента (api/timeline.py)
+TIMELINE_BACKEND = os.getenv('TIMELINE_BACKEND', 'api.timeline.DatabaseTimelineBackend')
+# Авторы с большим числом подписчиков не раскладываются по лентам, а подтягиваются при чтении
+TIMELINE_FANOUT_LIMIT = int(os.getenv('TIMELINE_FANOUT_LIMIT', 5000))
+
+# Очередь уведомлений (api/notifications.py). В проде с несколькими процессами:
+# api.notifications.OutboxNotificationQueue + manage.py process_notifications
+NOTIFICATION_QUEUE = os.getenv('NOTIFICATION_QUEUE', 'api.notifications.LocalNotificationQueue')
+# Хаб SSE-потока /api/notifications/stream/ (api/realtime.py); между процессами — api.realtime.RedisHub
+NOTIFICATION_HUB = os.getenv('NOTIFICATION_HUB', 'api.realtime.LocalHub')
+REDIS_URL = os.getenv('REDIS_URL')
+
+# Метрики /api/metrics/ (api/metrics.py). METRICS_SAMPLE_RATE — доля запросов с подробными
+# замерами SQL/времени; METRICS_TOKEN, если задан, нужен в Authorization: Bearer
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', 1.0))
+METRICS_REPEATED_QUERY_ALARM = int(os.getenv('METRICS_REPEATED_QUERY_ALARM', 10))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+# Общий для всех воркеров каталог снимков счётчиков; /api/metrics/ отдаёт их сумму.
+# Очищайте его при деплое (как PROMETHEUS_MULTIPROC_DIR)
+METRICS_DIR = os.getenv('METRICS_DIR', BASE_DIR / 'metrics')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 1.0))
+
+# Профилирование запросов (api/profiling.py): по подписанному заголовку X-Profile,
+# по ?profile=1 от staff или для доли PROFILING_SAMPLE_RATE запросов
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'True') == 'True'
+PROFILING_DIR = os.getenv('PROFILING_DIR', BASE_DIR / 'profiles')
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0.0))
+PROFILING_INTERVAL = float(os.getenv('PROFILING_INTERVAL', 0.005))
+PROFILING_SIGNATURE_MAX_AGE = int(os.getenv('PROFILING_SIGNATURE_MAX_AGE', 3600))
+PROFILING_MAX_FILES = int(os.getenv('PROFILING_MAX_FILES', 500))
 
 CORS_ALLOW_ALL_ORIGINS = True
 
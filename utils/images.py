@@ -0,0 +1,86 @@
+"""
+Обработка аватарок на Pillow.
+
+Оригинал клиента наружу не отдаётся: картинка проверяется, поворачивается
+по EXIF, пережимается без метаданных и нарезается на фиксированные
+квадратные размеры в WebP и JPEG. Нарезка — CPU-работа, поэтому она идёт
+в пуле процессов (get_pool), а не в потоке запроса.
+"""
+import io
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF'}
+MAX_PIXELS = 40_000_000
+
+# Имя варианта -> сторона квадрата в пикселях
+SIZES = {
+    'small': 40,
+    'medium': 96,
+    'large': 256,
+}
+
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def validate(data):
+    """Быстрая проверка в потоке запроса: формат и размеры читаются из заголовка."""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.format not in ALLOWED_FORMATS:
+                raise InvalidImage(f'Unsupported image format: {image.format}')
+            if image.width * image.height > MAX_PIXELS:
+                raise InvalidImage('Image is too large')
+            image.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise InvalidImage('Not a valid image') from e
+
+
+def render_variants(data):
+    """
+    Возвращает {(size, ext): (bytes, content_type)}.
+    Функция верхнего уровня, чтобы её можно было отправить в пул процессов.
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        source.seek(0)  # у GIF берём первый кадр
+        image = ImageOps.exif_transpose(source)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+    variants = {}
+    for name, side in SIZES.items():
+        square = ImageOps.fit(image, (side, side), Image.LANCZOS)
+        for ext, (pil_format, content_type, options) in FORMATS.items():
+            frame = square
+            if pil_format == 'JPEG' and frame.mode != 'RGB':
+                # JPEG без альфы: прозрачность заливаем белым
+                background = Image.new('RGB', frame.size, 'white')
+                background.paste(frame, mask=frame.getchannel('A'))
+                frame = background
+            out = io.BytesIO()
+            # exif/icc не передаём — метаданные в результат не попадают
+            frame.save(out, pil_format, **options)
+            variants[name, ext] = (out.getvalue(), content_type)
+    return variants
+
+
+@lru_cache(maxsize=None)
+def get_pool():
+    workers = getattr(settings, 'AVATAR_PROCESS_WORKERS', 2)
+    return ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+
+
+def render_in_pool(data):
+    pool = get_pool()
+    if pool is None:
+        return render_variants(data)
+    return pool.submit(render_variants, data).result()
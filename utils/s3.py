@@ -1,27 +1,189 @@
-import boto3
-from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
+"""
+Хранилище загружаемых файлов (аватарки).
+
+Клиент boto3 создаётся один раз на процесс: он потокобезопасен и держит
+пул соединений, так что повторные загрузки не платят за поиск учётных
+данных и новое TLS-соединение. Большие файлы уходят multipart-загрузкой
+по частям (TransferConfig), целиком в память не читаются.
+
+Хранилище выбирается настройкой AVATAR_STORAGE:
+  * S3Storage — S3 или совместимый сервис (minio, moto) через S3_ENDPOINT_URL;
+  * FileSystemStorage — локальная папка, для разработки и тестов.
+"""
+import mimetypes
 import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+MB = 1024 * 1024
+
+
+class UnsupportedOperation(Exception):
+    """Хранилище не умеет эту операцию (например, прямую загрузку)."""
+
+
+def _setting(name, default=None):
+    return getattr(settings, name, None) or os.getenv(name) or default
 
-# Функция для загрузки файла в S3
-def upload_to_s3(file, file_name):
-    s3_client = boto3.client(
+
+@lru_cache(maxsize=None)
+def get_client():
+    """Один клиент на процесс с пулом соединений и ретраями."""
+    return boto3.client(
         's3',
-        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-        region_name=os.getenv('AWS_REGION')
+        aws_access_key_id=_setting('AWS_ACCESS_KEY_ID'),
+        aws_secret_access_key=_setting('AWS_SECRET_ACCESS_KEY'),
+        region_name=_setting('AWS_REGION'),
+        endpoint_url=_setting('S3_ENDPOINT_URL'),
+        config=Config(
+            max_pool_connections=int(_setting('S3_MAX_POOL_CONNECTIONS', 20)),
+            connect_timeout=5,
+            read_timeout=30,
+            retries={'max_attempts': 5, 'mode': 'adaptive'},
+            # Подписанные ссылки — только SigV4, SigV2 новые регионы не принимают
+            signature_version='s3v4',
+        ),
     )
 
-    try:
-        # Используем правильное имя бакета
-        s3_client.upload_fileobj(
-            file,
-            os.getenv('AWS_BUCKET_NAME'),  # Исправление тут
-            file_name,
-            ExtraArgs={'ACL': 'public-read'}
+
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * MB,
+    multipart_chunksize=8 * MB,
+    max_concurrency=4,
+    use_threads=True,
+)
+
+
+class S3Storage:
+    def __init__(self, bucket=None):
+        self.bucket = bucket or _setting('AWS_BUCKET_NAME')
+        self.client = get_client()
+
+    def url(self, key):
+        endpoint = _setting('S3_ENDPOINT_URL')
+        if endpoint:
+            return f"{endpoint.rstrip('/')}/{self.bucket}/{key}"
+        return f"https://{self.bucket}.s3.{_setting('AWS_REGION')}.amazonaws.com/{key}"
+
+    def save(self, fileobj, key, content_type=None):
+        extra = {'ACL': 'public-read'}
+        if content_type:
+            extra['ContentType'] = content_type
+        self.client.upload_fileobj(fileobj, self.bucket, key, ExtraArgs=extra, Config=TRANSFER_CONFIG)
+        return self.url(key)
+
+    def presign_upload(self, key, content_type, max_bytes, expires_in=300, method='post'):
+        """
+        Подписанная ссылка, по которой клиент сам кладёт файл в бакет.
+        POST-форма ограничивает размер и тип политикой; у PUT размер
+        проверяется только после загрузки (см. head). Объект остаётся
+        приватным: в нём метаданные клиента, читает его только обработчик.
+        """
+        if method == 'put':
+            url = self.client.generate_presigned_url('put_object', ExpiresIn=expires_in, Params={
+                'Bucket': self.bucket, 'Key': key, 'ContentType': content_type,
+            })
+            return {'method': 'PUT', 'url': url, 'headers': {'Content-Type': content_type}}
+        form = self.client.generate_presigned_post(
+            self.bucket, key, ExpiresIn=expires_in,
+            Fields={'Content-Type': content_type},
+            Conditions=[
+                {'Content-Type': content_type},
+                ['content-length-range', 1, max_bytes],
+            ],
         )
-        # Получаем URL файла
-        file_url = f"https://{os.getenv('AWS_BUCKET_NAME')}.s3.{os.getenv('AWS_REGION')}.amazonaws.com/{file_name}"
-        return file_url
-    except Exception as e:
-        raise e
+        return {'method': 'POST', 'url': form['url'], 'fields': form['fields']}
+
+    def head(self, key):
+        """{'size', 'content_type'} загруженного объекта или None."""
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return {'size': response['ContentLength'], 'content_type': response.get('ContentType')}
+
+    def read(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def list(self, prefix):
+        """Пары (key, время изменения в секундах) всех объектов под prefix."""
+        for page in self.client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get('Contents', ()):
+                yield obj['Key'], obj['LastModified'].timestamp()
+
+
+class FileSystemStorage:
+    """Локальная замена S3: файлы в LOCAL_STORAGE_ROOT, ссылки от LOCAL_STORAGE_URL."""
+
+    def __init__(self, root=None, base_url=None):
+        self.root = str(root or _setting('LOCAL_STORAGE_ROOT', os.path.join(settings.BASE_DIR, 'media')))
+        self.base_url = base_url or _setting('LOCAL_STORAGE_URL', '/media/')
+
+    def path(self, key):
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f'Key escapes storage root: {key}')
+        return path
+
+    def url(self, key):
+        return self.base_url.rstrip('/') + '/' + key
+
+    def save(self, fileobj, key, content_type=None):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as out:
+            shutil.copyfileobj(fileobj, out, MB)
+        return self.url(key)
+
+    def presign_upload(self, key, content_type, max_bytes, expires_in=300, method='post'):
+        raise UnsupportedOperation('FileSystemStorage does not support direct uploads')
+
+    def head(self, key):
+        try:
+            size = os.path.getsize(self.path(key))
+        except OSError:
+            return None
+        return {'size': size, 'content_type': mimetypes.guess_type(key)[0]}
+
+    def read(self, key):
+        with open(self.path(key), 'rb') as f:
+            return f.read()
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix):
+        top = self.path(prefix)
+        for directory, _, names in os.walk(top):
+            for name in names:
+                path = os.path.join(directory, name)
+                yield os.path.relpath(path, self.root).replace(os.sep, '/'), os.path.getmtime(path)
+
+
+@lru_cache(maxsize=None)
+def get_storage():
+    backend = getattr(settings, 'AVATAR_STORAGE', 'utils.s3.S3Storage')
+    return import_string(backend)()
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    """Фоновый пул для обработки и загрузки аватарок (api.avatars.submit)."""
+    return ThreadPoolExecutor(max_workers=int(_setting('S3_UPLOAD_WORKERS', 4)), thread_name_prefix='s3-upload')
+